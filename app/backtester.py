@@ -2,89 +2,162 @@ import pandas as pd
 import textwrap
 import pandas_ta as ta
 import numpy as np
-from datetime import datetime
 import logging
+from app.execution import simulate_trades
+from app.metrics import compute_metrics
+from app.code_analyzer import analyze_strategy_code
+from app.indicator_cache import CachedTA, caching_builtins, shared_cache, wrap_frame
 
-def run_backtest(strategy_code, ohlc_data, initial_capital=100):
-    try:
-        print(f"Initial Capital (Before Execution): {initial_capital}")  # Debugging
+class StrategyExecutionError(Exception):
+    """Raised when generated strategy code cannot be compiled or run."""
 
-        # Ensure initial_capital is a number
-        initial_capital = float(initial_capital)
 
-        # Make sure the OHLC data has numeric values
-        numeric_cols = ['open', 'high', 'low', 'close', 'volume']
-        for col in numeric_cols:
-            if col in ohlc_data.columns:
-                ohlc_data[col] = pd.to_numeric(ohlc_data[col], errors='coerce')
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+
+def coerce_numeric(df):
+    """
+    Convert non-numeric OHLCV columns in place; numeric columns are left untouched,
+    so typed frames pass through without a copy.
+    """
+    for col in OHLCV_COLUMNS:
+        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
 
-        # Clean up strategy code - remove any potential markdown formatting
-        strategy_code = strategy_code.replace("```python", "").replace("```", "").strip()
+def _format_timestamp(value):
+    """Format a trade-log timestamp as pandas does ('2024-01-01 00:00:00'), not as raw numpy datetime64."""
+    if isinstance(value, np.datetime64):
+        return str(pd.Timestamp(value))
+    return str(value)
 
-        # Wrap the strategy code dynamically
-        wrapped_code = textwrap.dedent(f"""
+
+def strip_code_fences(strategy_code):
+    """Remove markdown code fences around generated code."""
+    return strategy_code.replace("```python", "").replace("```", "").strip()
+
+
+def execute_strategy(strategy_code, ohlc_data, indicator_cache=None, analysis=None, initial_capital=None):
+    """
+    Compile generated strategy code and run `trading_strategy` on a copy of the data.
+    :param strategy_code: Python source defining `trading_strategy(ohlc_data)`
+    :param ohlc_data: DataFrame with open/high/low/close/volume columns
+    :param indicator_cache: IndicatorCache for `ta` calls; defaults to the shared cache, False disables caching
+    :param analysis: Result of analyze_strategy_code if the caller already ran it
+    :param initial_capital: Exposed to the strategy code as `initial_capital` when given
+    :return: DataFrame returned by the strategy, with an integer 'signal' column
+    """
+    # Clean up strategy code - remove any potential markdown formatting
+    strategy_code = strip_code_fences(strategy_code)
+
+    if analysis is None:
+        analysis = analyze_strategy_code(strategy_code)
+    if not analysis["valid"]:
+        raise StrategyExecutionError("Strategy code failed validation: " + "; ".join(analysis["errors"]))
+
+    # Wrap the strategy code dynamically
+    wrapped_code = textwrap.dedent(f"""
 {strategy_code}
-        """)
-
-        # Debugging: Print the dynamically generated strategy
-        print("Generated Strategy Code:")
-        print(wrapped_code)
-
-        # Execution environment with initial_capital included
-        exec_globals = {
-            "pd": pd, 
-            "ta": ta, 
-            "np": np,
-            "initial_capital": initial_capital  # Add initial_capital to the globals
-        }
-        
-        # Execute the strategy code
-        try:
-            exec(wrapped_code, exec_globals)
-        except SyntaxError as e:
-            error_msg = f"Syntax error in strategy code: {str(e)}"
-            print(error_msg)
-            return {"error": error_msg}
-        except Exception as e:
-            error_msg = f"Error executing strategy code: {str(e)}"
-            print(error_msg)
-            return {"error": error_msg}
+    """)
+
+    # Debugging: Print the dynamically generated strategy
+    print("Generated Strategy Code:")
+    print(wrapped_code)
 
-        # Ensure the strategy function exists
-        trading_strategy = exec_globals.get("trading_strategy", None)
-        if trading_strategy is None:
-            raise ValueError("The strategy function was not correctly defined.")
+    # Indicator calls made through `ta` (or `import pandas_ta`) and `df.ta` are memoized
+    cache = shared_cache if indicator_cache is None else indicator_cache
+    cached_ta = CachedTA(cache) if cache else ta
 
-        # Run the strategy
-        df = trading_strategy(ohlc_data.copy())  # Ensure no mutation of original data
+    # Execution environment with initial_capital included
+    exec_globals = {
+        "pd": pd,
+        "ta": cached_ta,
+        "np": np,
+    }
+    if initial_capital is not None:
+        exec_globals["initial_capital"] = initial_capital
+    if cache:
+        exec_globals["__builtins__"] = caching_builtins(cached_ta)
 
-        # Validate DataFrame output
-        if not isinstance(df, pd.DataFrame) or 'signal' not in df.columns:
-            raise ValueError("Strategy did not return a valid DataFrame with a 'signal' column.")
+    # Execute the strategy code
+    try:
+        exec(wrapped_code, exec_globals)
+    except SyntaxError as e:
+        raise StrategyExecutionError(f"Syntax error in strategy code: {str(e)}")
+    except Exception as e:
+        raise StrategyExecutionError(f"Error executing strategy code: {str(e)}")
 
-        # Ensure the signal column has numeric values
+    # Ensure the strategy function exists
+    trading_strategy = exec_globals.get("trading_strategy", None)
+    if trading_strategy is None:
+        raise StrategyExecutionError("The strategy function was not correctly defined.")
+
+    # Run the strategy
+    strategy_input = wrap_frame(ohlc_data, cache) if cache else ohlc_data.copy()
+    df = trading_strategy(strategy_input)  # Ensure no mutation of original data
+
+    # Validate DataFrame output
+    if not isinstance(df, pd.DataFrame) or 'signal' not in df.columns:
+        raise StrategyExecutionError("Strategy did not return a valid DataFrame with a 'signal' column.")
+
+    # Ensure the signal column has integer values
+    if not pd.api.types.is_integer_dtype(df['signal']):
         df['signal'] = pd.to_numeric(df['signal'], errors='coerce').fillna(0).astype(int)
-        
-        # Ensure price columns are numeric
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+
+def run_backtest(strategy_code, ohlc_data, initial_capital=100, commission=0.0, slippage=0.0,
+                 stop_loss=None, take_profit=None, trailing_stop=None,
+                 commission_model="percent", slippage_model="percent", interval=None,
+                 indicator_cache=None, backend="auto"):
+    """
+    Execute generated strategy code and simulate its trades.
+    :param strategy_code: Python source defining `trading_strategy(ohlc_data)`
+    :param ohlc_data: DataFrame with open/high/low/close/volume columns
+    :param initial_capital: Starting cash in quote currency
+    :param commission: Fee per fill, a fraction of notional or a flat amount (see commission_model)
+    :param slippage: Adverse fill offset, a fraction of price or of bar range (see slippage_model)
+    :param stop_loss, take_profit, trailing_stop: Protective exits as fractions of entry price
+    :param interval: Candle timeframe used to annualize ratios (inferred from timestamps if omitted)
+    :param indicator_cache: IndicatorCache for `ta` calls; defaults to the shared cache, False disables caching
+    :param backend: Trade simulation backend ('auto', 'numba', 'numpy' or 'python'); all give identical results
+    :return: Dictionary of performance metrics, equity curve and trade log, or {"error": ...}
+    """
+    try:
+        print(f"Initial Capital (Before Execution): {initial_capital}")  # Debugging
+
+        # Ensure initial_capital is a number
+        initial_capital = float(initial_capital)
+
+        # Frames from fetch_ohlc_data are typed at ingest; only foreign frames need coercion
+        coerce_numeric(ohlc_data)
+
+        # Reject broken or unsafe code before touching the data
+        analysis = analyze_strategy_code(strip_code_fences(strategy_code))
+        if not analysis["valid"]:
+            error_msg = "Strategy code failed validation: " + "; ".join(analysis["errors"])
+            print(error_msg)
+            return {"error": error_msg, "code_analysis": analysis}
+        for warning in analysis["warnings"]:
+            logging.warning(f"Strategy code: {warning}")
+
+        try:
+            df = execute_strategy(strategy_code, ohlc_data, indicator_cache=indicator_cache,
+                                  analysis=analysis, initial_capital=initial_capital)
+        except StrategyExecutionError as e:
+            print(str(e))
+            return {"error": str(e)}
+
+        # Strategies may overwrite price columns with non-numeric values
+        coerce_numeric(df)
 
         print("DataFrame Returned by Strategy Function:")
         print(df.head())
 
-        # Backtesting logic with enhanced metrics
-        cash = initial_capital
-        position = 0
-        position_value = 0
-        trade_log = []
-        equity_curve = []
-        entry_price = 0
-        profitable_trades = 0
-        losing_trades = 0
-        total_profit = 0
-        total_loss = 0
-        
+        # Drop rows without a usable close, matching the old per-row skip
+        df = df[df['close'].notna()]
+
         # Check if we have enough signals to make a meaningful backtest
         signal_counts = df['signal'].value_counts()
         has_buy_signals = 1 in signal_counts and signal_counts[1] > 0
@@ -96,121 +169,107 @@ def run_backtest(strategy_code, ohlc_data, initial_capital=100):
             logging.warning(error_msg)
             return {"error": error_msg, "signal_count": 0}
 
-        # Ensure signals are properly sequenced and first signal is a buy
-        # Get indexes of all signals
-        buy_signals = df.index[df['signal'] == 1].tolist()
-        sell_signals = df.index[df['signal'] == -1].tolist()
-        
-        if buy_signals and sell_signals:
-            # If first sell is before first buy, remove it
-            if sell_signals[0] < buy_signals[0]:
-                df.loc[sell_signals[0], 'signal'] = 0
-
-        # Calculate equity curve and trades
-        for i, row in df.iterrows():
-            # Skip rows with missing data
-            if pd.isna(row['close']):
+        close = df['close'].to_numpy(dtype=float)
+        high = df['high'].to_numpy(dtype=float) if 'high' in df.columns else close
+        low = df['low'].to_numpy(dtype=float) if 'low' in df.columns else close
+        open_ = df['open'].to_numpy(dtype=float) if 'open' in df.columns else close
+        # Bars with partial OHLC still have a close, so fall back to it
+        high = np.where(np.isnan(high), close, high)
+        low = np.where(np.isnan(low), close, low)
+        open_ = np.where(np.isnan(open_), close, open_)
+
+        simulation = simulate_trades(
+            open_, high, low, close, df['signal'].to_numpy(),
+            initial_capital=initial_capital,
+            commission=commission,
+            slippage=slippage,
+            stop_loss=stop_loss,
+            take_profit=take_profit,
+            trailing_stop=trailing_stop,
+            commission_model=commission_model,
+            slippage_model=slippage_model,
+            backend=backend,
+        )
+        equity = simulation["equity"]
+
+        if 'timestamp' in df.columns:
+            timestamps = df['timestamp'].to_numpy()
+        else:
+            timestamps = df.index.to_numpy()
+        equity_curve = pd.DataFrame({
+            "timestamp": timestamps,
+            "equity": equity,
+            "close": close
+        }).to_dict(orient='records')
+
+        # Build the trade log from the simulated fills
+        trade_log = []
+        trade_returns = []
+        total_fees = 0
+        for trade in simulation["trades"]:
+            entry = trade["entry_index"]
+            total_fees += trade["fees"]
+            trade_log.append({
+                "timestamp": _format_timestamp(timestamps[entry]),
+                "action": "BUY",
+                "price": trade["entry_price"],
+                "position": trade["units"],
+                "equity": trade["entry_cash"],
+                "reason": "signal"
+            })
+            if trade["exit_index"] is None:
                 continue
-                
-            # Get the close price and ensure it's a number
-            close_price = float(row['close'])
-            timestamp = row.name if isinstance(row.name, datetime) else row['timestamp']
-            
-            # Update position value
-            if position > 0:
-                position_value = position * close_price
-            else:
-                position_value = 0
-                
-            # Calculate equity
-            equity = cash + position_value
-            equity_curve.append({
-                "timestamp": timestamp,
-                "equity": equity,
-                "close": close_price
+            trade_profit = (trade["exit_cash"] - trade["entry_cash"]) / trade["entry_cash"] * 100
+            trade_returns.append(trade_profit)
+            trade_log.append({
+                "timestamp": _format_timestamp(timestamps[trade["exit_index"]]),
+                "action": "SELL",
+                "price": trade["exit_price"],
+                "position": trade["units"],
+                "equity": trade["exit_cash"],
+                "profit_pct": trade_profit,
+                "reason": trade["reason"]
             })
-            
-            # Process trading signal
-            if row['signal'] == 1 and cash > 0:  # Buy
-                print(f"BUY at {timestamp}, price: {close_price}, cash: {cash}")
-                entry_price = close_price
-                position = cash / close_price
-                cash = 0
-                trade_log.append({
-                    "timestamp": str(timestamp),
-                    "action": "BUY",
-                    "price": close_price,
-                    "position": position,
-                    "equity": equity
-                })
-
-            elif row['signal'] == -1 and position > 0:  # Sell
-                print(f"SELL at {timestamp}, price: {close_price}, position: {position}")
-                cash = position * close_price
-                trade_profit = ((close_price - entry_price) / entry_price) * 100
-                if trade_profit > 0:
-                    profitable_trades += 1
-                    total_profit += trade_profit
-                else:
-                    losing_trades += 1
-                    total_loss += abs(trade_profit)
-                
-                trade_log.append({
-                    "timestamp": str(timestamp),
-                    "action": "SELL",
-                    "price": close_price,
-                    "position": position,
-                    "equity": equity,
-                    "profit_pct": trade_profit
-                })
-                position = 0
 
         # Final calculations
-        if df.empty:
-            final_value = initial_capital
-        else:
-            last_close = float(df.iloc[-1]['close'])
-            final_value = cash + (position * last_close)
-            print(f"Final calculations: Cash: {cash}, Position: {position}, Last close: {last_close}")
-            print(f"Final value: {final_value}")
-            
+        final_value = float(equity[-1]) if len(equity) else initial_capital
+        print(f"Final value: {final_value}")
         total_return = ((final_value - initial_capital) / initial_capital) * 100
 
-        # Calculate additional metrics
-        total_trades = profitable_trades + losing_trades
-        win_rate = (profitable_trades / total_trades) * 100 if total_trades > 0 else 0
-        
-        # Calculate max drawdown
-        equity_df = pd.DataFrame(equity_curve)
-        if not equity_df.empty:
-            equity_df['peak'] = equity_df['equity'].cummax()
-            equity_df['drawdown'] = (equity_df['equity'] - equity_df['peak']) / equity_df['peak'] * 100
-            max_drawdown = equity_df['drawdown'].min()
-        else:
-            max_drawdown = 0
-
-        # Calculate Sharpe ratio (simplified)
-        if len(equity_curve) > 1:
-            equity_df['returns'] = equity_df['equity'].pct_change()
-            sharpe_ratio = equity_df['returns'].mean() / equity_df['returns'].std() * np.sqrt(252) if equity_df['returns'].std() > 0 else 0
-        else:
-            sharpe_ratio = 0
+        # Performance metrics straight from the simulation arrays
+        metrics = compute_metrics(
+            np.concatenate(([initial_capital], equity)),
+            interval=interval,
+            timestamps=timestamps if 'timestamp' in df.columns or isinstance(df.index, pd.DatetimeIndex) else None,
+            units=simulation["units"],
+            trade_returns=trade_returns
+        )
 
         # Convert trade log to a DataFrame if it's not empty
-        trade_log_df = pd.DataFrame(trade_log) if trade_log else pd.DataFrame(columns=["timestamp", "action", "price", "position", "equity", "profit_pct"])
+        trade_log_df = pd.DataFrame(trade_log) if trade_log else pd.DataFrame(columns=["timestamp", "action", "price", "position", "equity", "profit_pct", "reason"])
 
         return {
             "initial_capital": initial_capital,
             "final_value": final_value,
             "return": total_return,
-            "win_rate": win_rate,
-            "total_trades": total_trades,
-            "profitable_trades": profitable_trades,
-            "losing_trades": losing_trades,
-            "average_profit": total_profit / profitable_trades if profitable_trades > 0 else 0,
-            "average_loss": total_loss / losing_trades if losing_trades > 0 else 0,
-            "max_drawdown": max_drawdown,
-            "sharpe_ratio": sharpe_ratio,
+            "annualized_return": metrics["annualized_return"],
+            "win_rate": metrics["win_rate"],
+            "total_trades": metrics["total_trades"],
+            "profitable_trades": metrics["profitable_trades"],
+            "losing_trades": metrics["losing_trades"],
+            "average_profit": metrics["average_profit"],
+            "average_loss": metrics["average_loss"],
+            "profit_factor": metrics["profit_factor"],
+            "expectancy": metrics["expectancy"],
+            "max_drawdown": metrics["max_drawdown"],
+            "max_drawdown_duration": metrics["max_drawdown_duration"],
+            "sharpe_ratio": metrics["sharpe_ratio"],
+            "sortino_ratio": metrics["sortino_ratio"],
+            "calmar_ratio": metrics["calmar_ratio"],
+            "exposure": metrics["exposure"],
+            "periods_per_year": metrics["periods_per_year"],
+            "total_fees": float(total_fees),
+            "code_analysis": analysis,
             "equity_curve": equity_curve,
             "trade_log": trade_log_df.to_dict(orient='records')
         }
@@ -0,0 +1,138 @@
+# app/chart_data.py
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# About two points per horizontal pixel of a wide Streamlit chart
+DEFAULT_POINTS = 2000
+
+
+def minmax_downsample(x, y, n_out):
+    """
+    Keep the minimum and maximum of each bucket, preserving spikes exactly.
+    Fully vectorized: the series is padded and reshaped into buckets.
+    :param x: 1-D array of x values (unused except for length; kept for a uniform signature)
+    :param y: 1-D array of y values
+    :param n_out: Target number of points
+    :return: Sorted integer indices of the points to keep
+    """
+    n = len(y)
+    if n <= n_out or n_out < 4:
+        return np.arange(n)
+    buckets = n_out // 2
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    blocks = padded.reshape(buckets, size)
+    valid = ~np.all(np.isnan(blocks), axis=1)
+    safe = np.where(np.isnan(blocks), np.inf, blocks)
+    lows = safe.argmin(axis=1)
+    safe = np.where(np.isnan(blocks), -np.inf, blocks)
+    highs = safe.argmax(axis=1)
+    offsets = np.arange(buckets) * size
+    picks = np.concatenate([(offsets + lows)[valid], (offsets + highs)[valid], [0, n - 1]])
+    return np.unique(picks[picks < n])
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling, which keeps the visual shape of a line.
+    :param x: 1-D numeric array (e.g. int64 nanoseconds)
+    :param y: 1-D array of y values without NaNs
+    :param n_out: Target number of points (at least 3)
+    :return: Sorted integer indices of the points to keep
+    """
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_start, next_stop = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_stop].mean()
+        avg_y = y[next_start:next_stop].mean()
+        bx = x[start:stop]
+        by = y[start:stop]
+        area = np.abs((x[a] - avg_x) * (by - y[a]) - (x[a] - bx) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_series(series, n_points=DEFAULT_POINTS, method="lttb", window=None):
+    """
+    Reduce a time-indexed series to roughly `n_points` for plotting.
+    :param series: pandas Series with a DatetimeIndex (or numeric index)
+    :param n_points: Point budget for the chart
+    :param method: 'lttb' for shape-preserving lines or 'minmax' to keep every extreme
+    :param window: Optional (start, end) pair; zooming in spends the whole budget on that range
+    :return: Downsampled Series
+    """
+    series = series.dropna()
+    if window is not None:
+        start, end = window
+        index = series.index
+        lo = index.searchsorted(pd.Timestamp(start) if isinstance(index, pd.DatetimeIndex) else start, side="left")
+        hi = index.searchsorted(pd.Timestamp(end) if isinstance(index, pd.DatetimeIndex) else end, side="right")
+        series = series.iloc[lo:hi]
+    if len(series) <= n_points:
+        return series
+    if isinstance(series.index, pd.DatetimeIndex):
+        x = series.index.asi8
+    else:
+        x = np.asarray(series.index, dtype=np.float64)
+    y = series.to_numpy(dtype=np.float64)
+    if method == "minmax":
+        keep = minmax_downsample(x, y, n_points)
+    elif method == "lttb":
+        keep = lttb(x, y, n_points)
+    else:
+        raise ValueError(f"Unknown downsampling method '{method}'")
+    return series.iloc[keep]
+
+
+class ChartCache:
+    """
+    LRU cache of downsampled series, keyed by result id, column, budget, method and zoom window,
+    so Streamlit reruns do not redo the reduction.
+    """
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_series(self, result_key, column, series, n_points=DEFAULT_POINTS, method="lttb", window=None):
+        """
+        Return the downsampled `series`, computing it only on the first request.
+        :param result_key: Identifier of the backtest or dataset the series belongs to
+        :param column: Name of the plotted column
+        """
+        window_key = None if window is None else (str(window[0]), str(window[1]))
+        key = (result_key, column, n_points, method, window_key)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        reduced = downsample_series(series, n_points=n_points, method=method, window=window)
+        with self._lock:
+            self._entries[key] = reduced
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return reduced
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Process-wide cache used by the Streamlit app
+chart_cache = ChartCache()
@@ -0,0 +1,176 @@
+# app/code_analyzer.py
+import ast
+import time
+
+# Top-level modules generated strategies may import
+ALLOWED_IMPORTS = {"pandas", "numpy", "pandas_ta", "math", "datetime", "typing", "warnings"}
+
+# Builtins that give generated code access to the host process
+FORBIDDEN_CALLS = {
+    "exec", "eval", "compile", "open", "__import__", "input", "globals", "locals",
+    "vars", "getattr", "setattr", "delattr", "breakpoint", "exit", "quit",
+}
+
+# DataFrame methods that run Python code once per row
+SLOW_METHODS = {"iterrows", "itertuples", "apply", "applymap"}
+
+# Fill methods that copy later values backwards in time
+BACKWARD_FILLS = {"bfill", "backfill"}
+
+
+def analyze_strategy_code(strategy_code, strict=False):
+    """
+    Statically check generated strategy code without executing it.
+    :param strategy_code: Python source expected to define `trading_strategy(ohlc_data)`
+    :param strict: Treat slow per-row patterns as errors instead of warnings
+    :return: Dictionary with `valid`, `errors`, `warnings`, `indicators`, `lookahead` (patterns that
+             read future bars, also listed in `warnings`) and `analysis_ms`
+    """
+    started = time.perf_counter()
+    code = (strategy_code or "").replace("```python", "").replace("```", "").strip()
+    report = {"valid": False, "errors": [], "warnings": [], "indicators": [], "lookahead": [], "analysis_ms": 0.0}
+
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        report["errors"].append(f"Syntax error on line {e.lineno}: {e.msg}")
+        report["analysis_ms"] = (time.perf_counter() - started) * 1000
+        return report
+
+    visitor = _StrategyVisitor()
+    visitor.visit(tree)
+
+    report["errors"].extend(visitor.errors)
+    if not visitor.has_strategy_function:
+        report["errors"].append("Missing `trading_strategy(ohlc_data)` function definition.")
+    if not visitor.assigns_signal:
+        report["errors"].append("No assignment to a `signal` column was found.")
+    if strict:
+        report["errors"].extend(visitor.slow_patterns)
+    else:
+        report["warnings"].extend(visitor.slow_patterns)
+    report["lookahead"] = visitor.lookahead
+    report["warnings"].extend(visitor.lookahead)
+    report["indicators"] = sorted(visitor.indicators)
+    report["valid"] = not report["errors"]
+    report["analysis_ms"] = (time.perf_counter() - started) * 1000
+    return report
+
+
+def _mentions_signal(node):
+    """True if an assignment target refers to a `signal` column or attribute."""
+    for child in ast.walk(node):
+        if isinstance(child, ast.Constant) and child.value == "signal":
+            return True
+        if isinstance(child, ast.Attribute) and child.attr == "signal":
+            return True
+    return False
+
+
+class _StrategyVisitor(ast.NodeVisitor):
+    def __init__(self):
+        self.errors = []
+        self.slow_patterns = []
+        self.lookahead = []
+        self.indicators = set()
+        self.ta_aliases = {"ta"}
+        self.has_strategy_function = False
+        self.assigns_signal = False
+
+    def _check_module(self, name, lineno):
+        root = (name or "").split(".")[0]
+        if root not in ALLOWED_IMPORTS:
+            self.errors.append(f"Line {lineno}: import of '{name}' is not allowed.")
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self._check_module(alias.name, node.lineno)
+            if alias.name == "pandas_ta":
+                self.ta_aliases.add(alias.asname or alias.name)
+        self.generic_visit(node)
+
+    def visit_ImportFrom(self, node):
+        self._check_module(node.module, node.lineno)
+        self.generic_visit(node)
+
+    def visit_FunctionDef(self, node):
+        if node.name == "trading_strategy" and node.args.args:
+            self.has_strategy_function = True
+        self.generic_visit(node)
+
+    def visit_Assign(self, node):
+        if any(_mentions_signal(target) for target in node.targets):
+            self.assigns_signal = True
+        self.generic_visit(node)
+
+    def visit_AugAssign(self, node):
+        if _mentions_signal(node.target):
+            self.assigns_signal = True
+        self.generic_visit(node)
+
+    def visit_AnnAssign(self, node):
+        if _mentions_signal(node.target):
+            self.assigns_signal = True
+        self.generic_visit(node)
+
+    def visit_Dict(self, node):
+        # pd.DataFrame({'signal': ...}) or rename(columns={...: 'signal'})
+        if any(isinstance(v, ast.Constant) and v.value == "signal" for v in node.keys + node.values):
+            self.assigns_signal = True
+        self.generic_visit(node)
+
+    def visit_For(self, node):
+        self._check_loop(node, node.iter)
+        self.generic_visit(node)
+
+    def visit_While(self, node):
+        self.slow_patterns.append(f"Line {node.lineno}: `while` loop in strategy code; prefer vectorized operations.")
+        self.generic_visit(node)
+
+    def _check_loop(self, node, iterator):
+        if isinstance(iterator, ast.Call):
+            func = iterator.func
+            if isinstance(func, ast.Name) and func.id in ("range", "enumerate", "zip"):
+                self.slow_patterns.append(f"Line {node.lineno}: per-row `for` loop; prefer vectorized operations.")
+        elif isinstance(iterator, (ast.Subscript, ast.Attribute)):
+            self.slow_patterns.append(f"Line {node.lineno}: `for` loop over a column or index; prefer vectorized operations.")
+
+    def visit_Call(self, node):
+        func = node.func
+        if isinstance(func, ast.Name) and func.id in FORBIDDEN_CALLS:
+            self.errors.append(f"Line {node.lineno}: call to '{func.id}' is not allowed.")
+        if isinstance(func, ast.Attribute):
+            if func.attr in SLOW_METHODS:
+                self.slow_patterns.append(f"Line {node.lineno}: `.{func.attr}()` runs Python per row; prefer vectorized operations.")
+            owner = func.value
+            if isinstance(owner, ast.Name) and owner.id in self.ta_aliases:
+                self.indicators.add(func.attr.lower())
+            elif isinstance(owner, ast.Attribute) and owner.attr == "ta":
+                self.indicators.add(func.attr.lower())
+            self._check_lookahead(node, func.attr)
+            if func.attr in ("assign", "insert") and (
+                any(k.arg == "signal" for k in node.keywords)
+                or any(isinstance(a, ast.Constant) and a.value == "signal" for a in node.args)
+            ):
+                self.assigns_signal = True
+        self.generic_visit(node)
+
+    def _check_lookahead(self, node, method):
+        if method == "shift":
+            periods = node.args[0] if node.args else next(
+                (k.value for k in node.keywords if k.arg == "periods"), None)
+            if isinstance(periods, ast.UnaryOp) and isinstance(periods.op, ast.USub) \
+                    and isinstance(periods.operand, ast.Constant) and periods.operand.value:
+                self.lookahead.append(f"Line {node.lineno}: `.shift(-{periods.operand.value})` reads future bars.")
+        elif method == "rolling":
+            if any(k.arg == "center" and isinstance(k.value, ast.Constant) and k.value.value for k in node.keywords):
+                self.lookahead.append(f"Line {node.lineno}: centered rolling window reads future bars.")
+        elif method in BACKWARD_FILLS or (method == "fillna" and any(
+                k.arg == "method" and isinstance(k.value, ast.Constant) and k.value.value in BACKWARD_FILLS
+                for k in node.keywords)):
+            self.lookahead.append(f"Line {node.lineno}: backward fill copies future values into earlier bars.")
+
+    def visit_Attribute(self, node):
+        if node.attr.startswith("__") and node.attr.endswith("__"):
+            self.errors.append(f"Line {node.lineno}: access to '{node.attr}' is not allowed.")
+        self.generic_visit(node)
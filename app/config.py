@@ -6,6 +6,27 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 BINANCE_API_KEY = os.getenv("BINANCE_TESTNET_API_KEY")
 BINANCE_SECRET_KEY = os.getenv("BINANCE_TESTNET_SECRET_KEY")
+# Public REST endpoint for exchange info and market scans
+BINANCE_API_URL = os.getenv("BINANCE_API_URL", "https://api.binance.com")
 
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT") 
-AZURE_OPENAI_API_KEY = os.getenv("AZURE_API_KEY")
\ No newline at end of file
+AZURE_OPENAI_API_KEY = os.getenv("AZURE_API_KEY")
+
+# Local OHLCV cache: seconds before a download is considered stale, entry limit and optional disk mirror
+OHLCV_CACHE_TTL = float(os.getenv("OHLCV_CACHE_TTL", "300"))
+OHLCV_CACHE_MAX_ENTRIES = int(os.getenv("OHLCV_CACHE_MAX_ENTRIES", "64"))
+OHLCV_CACHE_DIR = os.getenv("OHLCV_CACHE_DIR")
+# Float dtype for downloaded prices and volume; float64 keeps full precision, float32 (opt-in) halves memory
+OHLCV_DTYPE = os.getenv("OHLCV_DTYPE", "float64")
+
+# SQLite file holding every backtest result for reuse and leaderboards
+RESULTS_DB_PATH = os.getenv("RESULTS_DB_PATH", "results.db")
+
+# Append-only memory-mapped tick files and the public archive they are downloaded from
+TICK_STORE_DIR = os.getenv("TICK_STORE_DIR", "ticks")
+BINANCE_DATA_URL = os.getenv("BINANCE_DATA_URL", "https://data.binance.vision")
+
+# Distributed backtests: content-addressed dataset directory, coordinator port and worker shared secret
+DATASET_STORE_DIR = os.getenv("DATASET_STORE_DIR", "datasets")
+DISTRIBUTED_PORT = int(os.getenv("DISTRIBUTED_PORT", "7070"))
+DISTRIBUTED_TOKEN = os.getenv("DISTRIBUTED_TOKEN")
@@ -0,0 +1,128 @@
+# app/data_cache.py
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from app.resample import divides, is_calendar_interval
+from app.utils import interval_to_seconds, normalize_interval
+
+
+class OHLCVCache:
+    """
+    In-memory LRU store of downloaded OHLCV frames keyed by (symbol, interval),
+    optionally mirrored to pickle files in `cache_dir`.
+    Only the finest interval per symbol is kept: storing a finer frame drops the
+    coarser frames it can rebuild.
+    """
+
+    def __init__(self, max_entries=64, ttl=300, cache_dir=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, symbol, interval):
+        return os.path.join(self.cache_dir, f"{symbol}_{interval}.pkl")
+
+    def _is_fresh(self, fetched_at):
+        return self.ttl is None or time.time() - fetched_at < self.ttl
+
+    def _load_from_disk(self, symbol, interval):
+        if not self.cache_dir:
+            return None
+        path = self._path(symbol, interval)
+        if not os.path.exists(path):
+            return None
+        try:
+            df = pd.read_pickle(path)
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable cache file {path}: {e}")
+            return None
+        fetched_at = df.attrs.get("fetched_at", os.path.getmtime(path))
+        if not self._is_fresh(fetched_at):
+            return None
+        self._entries[(symbol, interval)] = (df, fetched_at)
+        return df
+
+    def get(self, symbol, interval):
+        """
+        Return the cached frame for (symbol, interval) if it is still fresh, else None.
+        """
+        key = (symbol, normalize_interval(interval))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                df, fetched_at = entry
+                if self._is_fresh(fetched_at):
+                    self._entries.move_to_end(key)
+                    return df
+                del self._entries[key]
+                return None
+            return self._load_from_disk(*key)
+
+    def put(self, symbol, interval, df):
+        """
+        Store a frame, evicting coarser frames for the same symbol and old entries beyond max_entries.
+        """
+        interval = normalize_interval(interval)
+        fetched_at = time.time()
+        df.attrs["fetched_at"] = fetched_at
+        with self._lock:
+            for other in [k for k in self._entries if k[0] == symbol and k[1] != interval]:
+                if divides(interval, other[1]):
+                    self._discard(other)
+            self._entries[(symbol, interval)] = (df, fetched_at)
+            self._entries.move_to_end((symbol, interval))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if self.cache_dir:
+            try:
+                df.to_pickle(self._path(symbol, interval))
+            except Exception as e:
+                logging.warning(f"Could not persist {symbol} {interval} to cache: {e}")
+
+    def _discard(self, key):
+        self._entries.pop(key, None)
+        if self.cache_dir:
+            path = self._path(*key)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def find_base(self, symbol, interval):
+        """
+        Find a fresh cached frame for `symbol` from which `interval` bars can be rebuilt.
+        Prefers the coarsest usable interval, since it has the fewest rows to aggregate.
+        :return: (base_interval, DataFrame) or None
+        """
+        interval = normalize_interval(interval)
+        with self._lock:
+            candidates = [k[1] for k in self._entries if k[0] == symbol]
+        if self.cache_dir and os.path.isdir(self.cache_dir):
+            prefix = f"{symbol}_"
+            for name in os.listdir(self.cache_dir):
+                if name.startswith(prefix) and name.endswith(".pkl"):
+                    candidates.append(name[len(prefix):-4])
+        usable = []
+        for base in set(candidates):
+            try:
+                if base != interval and divides(base, interval):
+                    usable.append(base)
+            except ValueError:
+                continue
+        usable.sort(key=lambda b: (is_calendar_interval(b), interval_to_seconds(b)), reverse=True)
+        for base in usable:
+            df = self.get(symbol, base)
+            if df is not None:
+                return base, df
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
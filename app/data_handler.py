@@ -2,9 +2,17 @@ import requests
 import pandas as pd
 import logging
 import os
+import threading
+import time
 import numpy as np
+from concurrent.futures import CancelledError
 from datetime import datetime, timedelta
 from binance.client import Client
+from app.config import BINANCE_API_URL, OHLCV_CACHE_DIR, OHLCV_CACHE_MAX_ENTRIES, OHLCV_CACHE_TTL, OHLCV_DTYPE
+from app.data_cache import OHLCVCache
+from app.data_quality import validate_ohlcv
+from app.resample import divides, resample_ohlcv
+from app.utils import normalize_interval
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -38,65 +46,131 @@ def preprocess_symbol(symbol):
         symbol += 'USDT'
     return symbol
 
-def fetch_ohlc_data(symbol, interval=None):
+# Candle intervals Binance serves directly; anything else is rebuilt from one of these
+BINANCE_INTERVALS = ['1m', '3m', '5m', '15m', '30m', '1h', '2h', '4h', '6h', '8h', '12h', '1d', '3d', '1w', '1M']
+
+# Process-wide cache of downloaded frames, one finest interval per symbol
+ohlc_cache = OHLCVCache(
+    max_entries=OHLCV_CACHE_MAX_ENTRIES,
+    ttl=OHLCV_CACHE_TTL,
+    cache_dir=OHLCV_CACHE_DIR
+)
+
+def _resolve_interval(interval):
     """
-    Fetch OHLC data for a given symbol and interval.
-    Defaults to '1H' if no interval is provided.
-    """
-    interval_mapping = {
-        '1H': '1h',
-        '4H': '4h',
-        '1D': '1d',
-        '1W': '1w',
-        '1M': '1M',
-        '15M': '15m',
-        '30M': '30m',
-    }
+    Normalize a user timeframe, defaulting to 1h when it is missing or invalid.
+    """
+    try:
+        return normalize_interval(interval)
+    except (TypeError, ValueError):
+        logging.warning(f"Invalid or missing interval '{interval}'. Defaulting to '1H'.")
+        return '1h'
 
-    symbol = preprocess_symbol(symbol)
+def download_interval(interval):
+    """
+    Pick the Binance interval to download for a target timeframe: the coarsest
+    native interval that divides it exactly.
+    :param interval: Normalized timeframe, e.g. '6h', '2h' or '15min'
+    :return: Binance interval string, e.g. '15m' for 15 minutes; only for API calls, since
+             cache keys and comparisons use the normalize_interval spelling
+    """
+    usable = [b for b in BINANCE_INTERVALS if divides(b, interval)]
+    if not usable:
+        raise ValueError(f"No Binance interval can build {interval} bars")
+    return usable[-1]
+
+def klines_to_frame(klines, dtype=None):
+    """
+    Parse raw Binance klines straight into typed, contiguous OHLCV columns.
+    Only the first six fields are read; numeric coercion happens here once, so
+    later consumers (resampling, caching, backtests) never convert again.
+    :param klines: List of kline rows as returned by the Binance API
+    :param dtype: Float dtype for prices and volume; defaults to OHLCV_DTYPE
+    :return: DataFrame with a datetime64 'timestamp' column (from int64 epoch ms) and OHLCV columns
+    """
+    dtype = np.dtype(dtype or OHLCV_DTYPE)
+    n = len(klines)
+    epoch_ms = np.fromiter((row[0] for row in klines), dtype=np.int64, count=n)
+    try:
+        values = np.array([row[1:6] for row in klines], dtype=np.float64).reshape(n, 5)
+    except ValueError:
+        # Malformed numbers become NaN and are filled by the quality check
+        values = np.column_stack([
+            pd.to_numeric(pd.Series([row[i] for row in klines]), errors='coerce').to_numpy(dtype=np.float64)
+            for i in range(1, 6)
+        ]).reshape(n, 5)
+    columns = {'timestamp': (epoch_ms * 1_000_000).view('datetime64[ns]')}
+    for i, name in enumerate(['open', 'high', 'low', 'close', 'volume']):
+        columns[name] = np.ascontiguousarray(values[:, i], dtype=dtype)
+    return pd.DataFrame(columns, copy=False)
 
-    # ✅ Fixed interval validation and mapping
-    original_interval = interval
-    interval = interval.upper() if interval else None
-    if interval not in interval_mapping:
-        logging.warning(f"Invalid or missing interval '{original_interval}'. Defaulting to '1H'.")
-        interval = '1H'  # Use the key from interval_mapping
-    binance_interval = interval_mapping[interval]
+# Binance caps one klines request at 1000 bars
+KLINES_PER_REQUEST = 1000
 
+def _download_klines(symbol, binance_interval, cancel_event=None):
+    """
+    Download 3 months of klines and return a numeric OHLCV DataFrame.
+    :param cancel_event: Optional threading.Event; setting it stops the download between pages
+    """
     # Verify Binance client availability
     if not BINANCE_AVAILABLE or client is None:
         error_msg = "Binance API client is not available. This is required for production use."
         logging.error(error_msg)
         raise RuntimeError(error_msg)
 
-    try:
-        # Fetch 3 months of data
-        klines = client.get_historical_klines(symbol, binance_interval, "3 months ago UTC")
-        if not klines:
-            error_msg = f"No data returned from Binance for {symbol} with interval {interval}"
-            logging.error(error_msg)
-            raise ValueError(error_msg)
+    # Fetch 3 months of data one page at a time, so an abandoned download stops early
+    start_ms = int((pd.Timestamp.now(tz="UTC") - pd.DateOffset(months=3)).timestamp() * 1000)
+    klines = []
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            raise CancelledError(f"Download of {symbol} {binance_interval} was cancelled")
+        page = client.get_klines(symbol=symbol, interval=binance_interval, startTime=start_ms,
+                                 limit=KLINES_PER_REQUEST)
+        klines.extend(page)
+        if len(page) < KLINES_PER_REQUEST:
+            break
+        start_ms = int(page[-1][0]) + 1
+    if not klines:
+        error_msg = f"No data returned from Binance for {symbol} with interval {binance_interval}"
+        logging.error(error_msg)
+        raise ValueError(error_msg)
 
-        df = pd.DataFrame(klines, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 
-                                        'close_time', 'quote_asset_volume', 'number_of_trades', 
-                                        'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        
-        # Get only required columns
-        df = df[['timestamp', 'open', 'high', 'low', 'close', 'volume']]
-        
-        # Ensure numeric data types for all price and volume columns
-        numeric_cols = ['open', 'high', 'low', 'close', 'volume']
-        for col in numeric_cols:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-            
-        # Check for and handle NaN values
-        if df.isna().any().any():
-            logging.warning(f"NaN values found in data for {symbol}. Handling them appropriately.")
-            # Forward fill NaN values where possible
-            df = df.ffill()
-            # If any NaN values remain at the beginning, backward fill
-            df = df.bfill()
+    df = klines_to_frame(klines)
+
+    # Order, deduplicate, fill and sanity-check the bars once; the report travels with the cached frame
+    df, report = validate_ohlcv(df, binance_interval)
+    df.attrs["quality_report"] = report
+    return df
+
+def fetch_ohlc_data(symbol, interval=None, cancel_event=None):
+    """
+    Fetch OHLC data for a given symbol and interval.
+    Defaults to '1H' if no interval is provided. Any multiple of a minute, hour,
+    day, week or month is accepted (e.g. '2H', '6H'); bars are rolled up locally
+    from the finest interval already cached for the symbol, and only downloaded
+    when no cached interval can build them.
+    :param cancel_event: Optional threading.Event that aborts a download in progress
+    """
+    symbol = preprocess_symbol(symbol)
+    interval = _resolve_interval(interval)
+
+    try:
+        df = ohlc_cache.get(symbol, interval)
+        if df is None:
+            base = ohlc_cache.find_base(symbol, interval)
+            if base is None:
+                binance_interval = download_interval(interval)
+                base_df = _download_klines(symbol, binance_interval, cancel_event)
+                base_interval = normalize_interval(binance_interval)
+                ohlc_cache.put(symbol, base_interval, base_df)
+            else:
+                base_interval, base_df = base
+            if base_interval == interval:
+                df = base_df
+            else:
+                logging.info(f"Resampling {symbol} {base_interval} bars to {interval}")
+                df = resample_ohlcv(base_df, interval, base_interval)
+                df.attrs["quality_report"] = base_df.attrs.get("quality_report")
             
         # Verify we have sufficient data
         if len(df) < 20:  # Minimum data required for most indicators
@@ -104,13 +178,71 @@ def fetch_ohlc_data(symbol, interval=None):
             logging.error(error_msg)
             raise ValueError(error_msg)
             
-        return df
+        return df.copy()
 
+    except CancelledError:
+        logging.info(f"Download of {symbol} {interval} cancelled")
+        raise
     except Exception as e:
         error_msg = f"Failed to fetch data for {symbol} with interval {interval} from Binance. Error: {str(e)}"
         logging.error(error_msg)
         raise RuntimeError(error_msg)
 
+def get_quality_report(ohlc_data):
+    """
+    Return the data-quality report computed when the frame was downloaded.
+    :param ohlc_data: DataFrame returned by fetch_ohlc_data
+    :return: Report dictionary, or None for frames that did not come from the cache
+    """
+    return ohlc_data.attrs.get("quality_report") if ohlc_data is not None else None
+
+def fetch_ohlc_timeframes(symbol, intervals):
+    """
+    Fetch several timeframes for one symbol with a single download.
+    The finest Binance interval that divides every requested timeframe is
+    downloaded once (or taken from the cache) and the rest are rolled up locally.
+    :param symbol: Trading pair (e.g., BTC, BTCUSDT)
+    :param intervals: Iterable of timeframes, e.g. ['1H', '4H', '1D']
+    :return: Dictionary mapping each requested interval to its DataFrame
+    """
+    normalized = {requested: _resolve_interval(requested) for requested in intervals}
+    common = [b for b in BINANCE_INTERVALS if all(divides(b, i) for i in normalized.values())]
+    if common:
+        # Warm the cache with the shared base so every fetch below is a local rollup
+        fetch_ohlc_data(symbol, common[-1])
+    return {requested: fetch_ohlc_data(symbol, interval) for requested, interval in normalized.items()}
+
+# Exchange info changes rarely; reuse it for an hour
+EXCHANGE_INFO_TTL = 3600
+_exchange_info = {"fetched_at": 0.0, "symbols": []}
+_exchange_info_lock = threading.Lock()
+
+def get_exchange_symbols(quote_asset=None, trading_only=True):
+    """
+    List spot symbols from Binance exchange info, cached for EXCHANGE_INFO_TTL seconds.
+    :param quote_asset: Only pairs quoted in this asset (e.g. 'USDT')
+    :param trading_only: Skip halted and delisted pairs
+    :return: List of symbol names
+    """
+    with _exchange_info_lock:
+        if time.time() - _exchange_info["fetched_at"] > EXCHANGE_INFO_TTL:
+            url = f"{BINANCE_API_URL}/api/v3/exchangeInfo"
+            response = requests.get(url, timeout=10)  # Add timeout for production safety
+
+            if response.status_code != 200:
+                error_msg = f"Failed to get exchange info from Binance API. Status code: {response.status_code}"
+                logging.error(error_msg)
+                raise RuntimeError(error_msg)
+
+            _exchange_info["symbols"] = response.json()["symbols"]
+            _exchange_info["fetched_at"] = time.time()
+        symbols = _exchange_info["symbols"]
+    return [
+        s["symbol"] for s in symbols
+        if (quote_asset is None or s.get("quoteAsset") == quote_asset)
+        and (not trading_only or s.get("status", "TRADING") == "TRADING")
+    ]
+
 def is_asset_available(symbol):
     """
     Check if the asset is available on Binance.
@@ -123,16 +255,7 @@ def is_asset_available(symbol):
         raise RuntimeError(error_msg)
         
     try:
-        url = "https://api.binance.com/api/v3/exchangeInfo"
-        response = requests.get(url, timeout=10)  # Add timeout for production safety
-        
-        if response.status_code != 200:
-            error_msg = f"Failed to get exchange info from Binance API. Status code: {response.status_code}"
-            logging.error(error_msg)
-            raise RuntimeError(error_msg)
-            
-        exchange_info = response.json()
-        symbols = [s['symbol'] for s in exchange_info['symbols']]
+        symbols = get_exchange_symbols(trading_only=False)
         
         formatted_symbol = preprocess_symbol(symbol)
         is_available = formatted_symbol in symbols
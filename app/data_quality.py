@@ -0,0 +1,129 @@
+# app/data_quality.py
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.resample import is_calendar_interval
+from app.utils import interval_to_seconds
+
+PRICE_COLUMNS = ["open", "high", "low", "close"]
+
+# Robust z-score (median/MAD of log returns) above which a close is flagged as a spike
+SPIKE_THRESHOLD = 10.0
+
+# Number of example gaps/spikes kept in the report
+SAMPLE_LIMIT = 5
+
+
+def validate_ohlcv(df, interval, spike_threshold=SPIKE_THRESHOLD):
+    """
+    Check and repair an OHLCV frame in one array-based pass.
+
+    Repairs: restores timestamp order, drops duplicated timestamps (keeping the
+    latest row), fills NaNs forward then backward, and widens high/low so they
+    bound open and close. Missing candles and price spikes are only reported,
+    since inventing bars or clipping prices would change the market history.
+
+    :param df: DataFrame with a 'timestamp' column and OHLCV columns
+    :param interval: Timeframe of the bars, used to detect gaps against the grid
+    :param spike_threshold: Robust z-score of close-to-close log returns that counts as a spike
+    :return: (repaired DataFrame, quality report dictionary)
+    """
+    rows_in = len(df)
+    report = {
+        "interval": interval,
+        "rows_in": rows_in,
+        "rows_out": rows_in,
+        "reordered": False,
+        "duplicates": 0,
+        "gaps": 0,
+        "missing_bars": 0,
+        "largest_gap_bars": 0,
+        "gap_samples": [],
+        "nan_values": 0,
+        "ohlc_repairs": 0,
+        "nonpositive_prices": 0,
+        "spikes": 0,
+        "spike_samples": [],
+        "checked_at": time.time(),
+    }
+    if df.empty:
+        return df, report
+
+    ts = df["timestamp"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+    # Ordering: a stable sort keeps the original order of equal timestamps
+    if np.any(ts[1:] < ts[:-1]):
+        order = np.argsort(ts, kind="stable")
+        df = df.iloc[order]
+        ts = ts[order]
+        report["reordered"] = True
+
+    # Duplicates: keep the last row for each timestamp
+    keep = np.r_[ts[1:] != ts[:-1], True]
+    report["duplicates"] = int((~keep).sum())
+    if report["duplicates"]:
+        df = df.iloc[keep]
+        ts = ts[keep]
+    df = df.reset_index(drop=True)
+
+    # Gaps against the interval grid (calendar months have no fixed step)
+    if not is_calendar_interval(interval) and len(ts) > 1:
+        step = interval_to_seconds(interval) * 10**9
+        steps = np.diff(ts)
+        gap_idx = np.flatnonzero(steps > step)
+        if gap_idx.size:
+            missing = steps[gap_idx] // step - 1
+            report["gaps"] = int(gap_idx.size)
+            report["missing_bars"] = int(missing.sum())
+            report["largest_gap_bars"] = int(missing.max())
+            report["gap_samples"] = [
+                {"after": str(pd.Timestamp(ts[i])), "missing_bars": int(m)}
+                for i, m in zip(gap_idx[:SAMPLE_LIMIT], missing[:SAMPLE_LIMIT])
+            ]
+
+    # NaNs: same forward/backward fill the handler always applied
+    columns = [c for c in PRICE_COLUMNS + ["volume"] if c in df.columns]
+    nan_count = int(df[columns].isna().to_numpy().sum())
+    report["nan_values"] = nan_count
+    if nan_count:
+        df[columns] = df[columns].ffill().bfill()
+
+    if all(c in df.columns for c in PRICE_COLUMNS):
+        prices = df[PRICE_COLUMNS].to_numpy()
+        report["nonpositive_prices"] = int((prices <= 0).sum())
+
+        # High/low must bound open and close
+        upper = prices.max(axis=1)
+        lower = prices.min(axis=1)
+        bad = (prices[:, 1] < upper) | (prices[:, 2] > lower)
+        report["ohlc_repairs"] = int(bad.sum())
+        if report["ohlc_repairs"]:
+            df.loc[bad, "high"] = upper[bad]
+            df.loc[bad, "low"] = lower[bad]
+
+        # Spikes: returns far outside the robust spread of the series
+        close = prices[:, 3].astype(np.float64)
+        if len(close) > 2 and np.all(close > 0):
+            log_returns = np.diff(np.log(close))
+            median = np.median(log_returns)
+            mad = np.median(np.abs(log_returns - median)) * 1.4826
+            if mad > 0:
+                z = np.abs(log_returns - median) / mad
+                spike_idx = np.flatnonzero(z > spike_threshold) + 1
+                report["spikes"] = int(spike_idx.size)
+                report["spike_samples"] = [
+                    {"timestamp": str(pd.Timestamp(ts[i])), "close": float(close[i])}
+                    for i in spike_idx[:SAMPLE_LIMIT]
+                ]
+
+    report["rows_out"] = len(df)
+    if report["duplicates"] or report["gaps"] or report["spikes"] or report["reordered"] or nan_count:
+        logging.warning(
+            f"Data quality for {interval} bars: {report['duplicates']} duplicates, "
+            f"{report['gaps']} gaps ({report['missing_bars']} missing bars), "
+            f"{nan_count} NaNs, {report['spikes']} spikes"
+        )
+    return df, report
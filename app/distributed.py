@@ -0,0 +1,549 @@
+# app/distributed.py
+"""
+Distributed backtests: a coordinator shards jobs to worker processes on any host over TCP.
+
+Run a worker on each machine with
+
+    python -m app.distributed worker --host <coordinator host> --port 7070 --token <secret>
+
+and submit jobs from Python through a Coordinator (see distributed_backtest for
+a one-call version that also starts workers on localhost).
+"""
+import argparse
+import contextlib
+import hmac
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+
+from app.backtester import run_backtest
+from app.config import DATASET_STORE_DIR, DISTRIBUTED_PORT, DISTRIBUTED_TOKEN
+from app.results_store import _json_default
+from app.utils import dataset_fingerprint
+
+# Frames larger than this are refused, so a stray client cannot exhaust memory
+MAX_MESSAGE_BYTES = 512 * 1024 * 1024
+
+# How long a lease request waits for a job before the worker is told to poll again
+LEASE_POLL_SECONDS = 1.0
+
+# Jobs scanned for one whose dataset the worker already holds
+LOCALITY_WINDOW = 64
+
+# Result keys too bulky to send back unless a job asks for them
+BULKY_RESULT_KEYS = ("equity_curve", "trade_log", "code_analysis")
+
+_HEADER = struct.Struct(">I")
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(min(size - len(buffer), 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+def send_message(sock, message, payload=b""):
+    """
+    Write one frame: a 4-byte length, a JSON header and an optional binary payload.
+    The payload size travels in the header as `payload_size`.
+    """
+    if payload:
+        message = {**message, "payload_size": len(payload)}
+    header = json.dumps(message, default=_json_default).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(header)) + header + payload)
+
+
+def recv_message(sock):
+    """Read one frame written by send_message. :return: (message dict, payload bytes)"""
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if size > MAX_MESSAGE_BYTES:
+        raise ConnectionError(f"Frame of {size} bytes exceeds the limit")
+    message = json.loads(_recv_exact(sock, size))
+    payload_size = message.pop("payload_size", 0)
+    if payload_size > MAX_MESSAGE_BYTES:
+        raise ConnectionError(f"Payload of {payload_size} bytes exceeds the limit")
+    payload = _recv_exact(sock, payload_size) if payload_size else b""
+    return message, payload
+
+
+def worker_cache_dir(root=None):
+    """
+    Default DatasetStore directory for workers: a sibling of the coordinator store
+    (e.g. datasets-worker-cache next to datasets), never inside it, so worker copies
+    do not show up in the coordinator's keys().
+    """
+    root = os.path.abspath(root or DATASET_STORE_DIR)
+    return os.path.join(os.path.dirname(root), os.path.basename(root) + "-worker-cache")
+
+
+class DatasetStore:
+    """
+    Content-addressed directory of OHLCV frames, keyed by dataset_fingerprint.
+
+    Frames are written as uncompressed .npz files (one array per column plus the
+    index, no pickled objects) so workers can fetch and load them without
+    trusting the sender; a loaded frame must hash back to its key. Recently
+    used frames stay in memory, so a worker runs many jobs on one dataset
+    without reloading it.
+    """
+
+    def __init__(self, root=None, memory_entries=8):
+        # Absolute, so workers started from another directory resolve the same path
+        self.root = os.path.abspath(root or DATASET_STORE_DIR)
+        self.memory_entries = memory_entries
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.npz")
+
+    def has(self, key):
+        return key in self._frames or os.path.exists(self.path(key))
+
+    def keys(self):
+        """Keys of every stored dataset."""
+        return [name[:-4] for _, _, files in os.walk(self.root) for name in files if name.endswith(".npz")]
+
+    def recent(self):
+        """Keys of the frames held in memory, most recently used last."""
+        with self._lock:
+            return list(self._frames)
+
+    def put(self, data):
+        """
+        Store a frame and return its key. Only numeric, boolean and datetime columns are accepted.
+        """
+        arrays = {"__columns__": np.array([str(name) for name in data.columns]),
+                  "__index__": data.index.to_numpy()}
+        for i, name in enumerate(data.columns):
+            values = data[name].to_numpy()
+            if values.dtype.kind not in "biufmM":
+                raise ValueError(f"Column {name!r} has dtype {values.dtype}; only numeric and datetime columns can be shared")
+            arrays[f"c{i}"] = values
+        if arrays["__index__"].dtype.kind not in "biufmM":
+            raise ValueError("Only numeric or datetime indexes can be shared")
+        key = dataset_fingerprint(data)
+        if not os.path.exists(self.path(key)):
+            buffer = io.BytesIO()
+            np.savez(buffer, **arrays)
+            self._write(key, buffer.getvalue())
+        self._remember(key, data)
+        return key
+
+    def _write(self, key, blob):
+        directory = os.path.dirname(self.path(key))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(blob)
+        os.replace(tmp_path, self.path(key))
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._frames[key] = data
+            self._frames.move_to_end(key)
+            while len(self._frames) > self.memory_entries:
+                self._frames.popitem(last=False)
+
+    def read_bytes(self, key):
+        with open(self.path(key), "rb") as handle:
+            return handle.read()
+
+    def write_bytes(self, key, blob):
+        """Store a dataset received from elsewhere, after checking it hashes to its key."""
+        data = self._decode(blob)
+        if dataset_fingerprint(data) != key:
+            raise ValueError(f"Dataset {key} failed verification")
+        self._write(key, blob)
+        self._remember(key, data)
+        return data
+
+    @staticmethod
+    def _decode(blob):
+        with np.load(io.BytesIO(blob), allow_pickle=False) as arrays:
+            columns = list(arrays["__columns__"])
+            index = arrays["__index__"]
+            if index.dtype.kind in "iu" and np.array_equal(index, np.arange(len(index))):
+                index = pd.RangeIndex(len(index))
+            return pd.DataFrame({name: arrays[f"c{i}"] for i, name in enumerate(columns)}, index=index)
+
+    def get(self, key):
+        """Return the stored frame; raises KeyError if it is not in the store."""
+        with self._lock:
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                return self._frames[key]
+        if not os.path.exists(self.path(key)):
+            raise KeyError(key)
+        data = self._decode(self.read_bytes(key))
+        self._remember(key, data)
+        return data
+
+
+class _Job:
+    __slots__ = ("id", "strategy_code", "dataset", "params", "full", "attempts", "worker", "deadline",
+                 "last_error")
+
+    def __init__(self, job_id, strategy_code, dataset, params, full):
+        self.id = job_id
+        self.strategy_code = strategy_code
+        self.dataset = dataset
+        self.params = params or {}
+        self.full = full
+        self.attempts = 0
+        self.worker = None
+        self.deadline = None
+        self.last_error = None
+
+
+class Coordinator:
+    """
+    TCP broker that leases backtest jobs to workers and collects their results.
+
+    A job is strategy code, a dataset key in the coordinator's DatasetStore and
+    run_backtest parameters. Workers pull datasets they lack by key and cache
+    them, and leases prefer jobs on datasets the worker already holds. A lease
+    that is not answered within `lease_seconds`, or whose worker disconnects or
+    reports a failure, is requeued until the job has been tried `max_attempts`
+    times. A backtest that returns an error is a result, not a retry.
+    """
+
+    def __init__(self, host="127.0.0.1", port=DISTRIBUTED_PORT, store=None, token=DISTRIBUTED_TOKEN,
+                 lease_seconds=600, max_attempts=3):
+        """
+        :param host: Interface to listen on; use 0.0.0.0 (with a token) to accept remote workers
+        :param port: TCP port; 0 picks a free one
+        :param token: Shared secret workers must present; workers execute the submitted code
+        """
+        self.store = store or DatasetStore()
+        self.token = token
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._queue = deque()
+        self._jobs = {}
+        self._results = {}
+        self._next_id = 0
+        self._closing = False
+        self._cond = threading.Condition()
+        self.stats = {"leased": 0, "retried": 0, "datasets_sent": 0, "workers": {}}
+
+        coordinator = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                coordinator._serve(self.request, self.client_address)
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self._server = Server((host, port), Handler)
+        self.address = self._server.server_address
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logging.info(f"Coordinator listening on {self.address[0]}:{self.address[1]}")
+
+    def add_dataset(self, data):
+        """Put a frame in the dataset store and return its key."""
+        return self.store.put(data)
+
+    def submit(self, strategy_code, dataset, params=None, full=False):
+        """
+        Queue one backtest.
+        :param dataset: Key from add_dataset
+        :param params: Keyword arguments for run_backtest (JSON-serializable)
+        :param full: Send the equity curve, trade log and code analysis back as well
+        :return: Job id
+        """
+        if not self.store.has(dataset):
+            raise KeyError(f"Dataset {dataset} is not in the store")
+        with self._cond:
+            job = _Job(self._next_id, strategy_code, dataset, params, full)
+            self._next_id += 1
+            self._jobs[job.id] = job
+            self._queue.append(job)
+            self._cond.notify_all()
+        return job.id
+
+    def _expire_leases(self):
+        now = time.monotonic()
+        for job in list(self._jobs.values()):
+            if job.worker is not None and job.deadline < now:
+                self._requeue(job, f"Lease expired on {job.worker}")
+
+    def _requeue(self, job, error):
+        job.worker = None
+        job.last_error = error
+        if job.attempts >= self.max_attempts:
+            self._finish(job, {"error": f"Failed after {job.attempts} attempts: {error}"})
+        else:
+            self.stats["retried"] += 1
+            logging.warning(f"Retrying job {job.id}: {error}")
+            self._queue.appendleft(job)
+        self._cond.notify_all()
+
+    def _finish(self, job, result):
+        self._jobs.pop(job.id, None)
+        self._results[job.id] = result
+        self._cond.notify_all()
+
+    def _lease(self, worker, cached):
+        """Wait briefly for a job, preferring one on a dataset the worker already has."""
+        deadline = time.monotonic() + LEASE_POLL_SECONDS
+        with self._cond:
+            while True:
+                self._expire_leases()
+                if self._closing:
+                    return None, "shutdown"
+                if self._queue:
+                    position = next((i for i, job in enumerate(self._queue)
+                                     if i < LOCALITY_WINDOW and job.dataset in cached), 0)
+                    job = self._queue[position]
+                    del self._queue[position]
+                    job.worker = worker
+                    job.attempts += 1
+                    job.deadline = time.monotonic() + self.lease_seconds
+                    self.stats["leased"] += 1
+                    return job, "job"
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None, "wait"
+                self._cond.wait(remaining)
+
+    def _serve(self, sock, address):
+        worker = f"{address[0]}:{address[1]}"
+        try:
+            hello, _ = recv_message(sock)
+            if hello.get("type") != "hello" or (
+                    self.token and not hmac.compare_digest(str(hello.get("token", "")), self.token)):
+                send_message(sock, {"type": "rejected"})
+                logging.warning(f"Rejected worker connection from {worker}")
+                return
+            worker = f"{hello.get('name') or 'worker'}@{worker}"
+            with self._cond:
+                self.stats["workers"][worker] = 0
+            send_message(sock, {"type": "welcome"})
+            logging.info(f"Worker {worker} connected")
+            while True:
+                message, _ = recv_message(sock)
+                kind = message.get("type")
+                if kind == "lease":
+                    job, status = self._lease(worker, set(message.get("cached") or ()))
+                    if job is None:
+                        send_message(sock, {"type": status})
+                        if status == "shutdown":
+                            return
+                        continue
+                    send_message(sock, {"type": "job", "id": job.id, "strategy_code": job.strategy_code,
+                                        "dataset": job.dataset, "params": job.params, "full": job.full})
+                elif kind == "dataset":
+                    try:
+                        blob = self.store.read_bytes(message["key"])
+                    except OSError:
+                        send_message(sock, {"type": "missing", "key": message["key"]})
+                        continue
+                    send_message(sock, {"type": "dataset", "key": message["key"]}, blob)
+                    with self._cond:
+                        self.stats["datasets_sent"] += 1
+                elif kind in ("result", "failed"):
+                    with self._cond:
+                        job = self._jobs.get(message["id"])
+                        # A late answer to a lease that was already reassigned is ignored
+                        if job is None or job.worker != worker:
+                            continue
+                        if kind == "result":
+                            self.stats["workers"][worker] += 1
+                            self._finish(job, message["result"])
+                        else:
+                            self._requeue(job, message.get("error", "Worker failure"))
+                else:
+                    raise ConnectionError(f"Unexpected message {kind!r}")
+        except (ConnectionError, OSError, ValueError) as e:
+            logging.info(f"Worker {worker} disconnected: {e}")
+        finally:
+            with self._cond:
+                for job in list(self._jobs.values()):
+                    if job.worker == worker:
+                        self._requeue(job, f"Worker {worker} disconnected")
+
+    def pending(self):
+        """Number of submitted jobs without a result."""
+        with self._cond:
+            return len(self._jobs)
+
+    def wait(self, job_ids=None, timeout=None):
+        """
+        Block until the given jobs (default: all submitted) have results.
+        :return: List of result dictionaries in job order; jobs still running at the
+                 timeout get an {"error": ...} placeholder
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            job_ids = list(range(self._next_id)) if job_ids is None else list(job_ids)
+            while any(job_id not in self._results for job_id in job_ids):
+                self._expire_leases()
+                remaining = LEASE_POLL_SECONDS if deadline is None else min(LEASE_POLL_SECONDS, deadline - time.monotonic())
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return [self._results.get(job_id, {"error": "Job did not finish before the timeout"})
+                    for job_id in job_ids]
+
+    def close(self):
+        """Tell workers to exit at their next lease request and stop listening."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        # Give polling workers one lease round to receive the shutdown
+        time.sleep(min(LEASE_POLL_SECONDS, 0.2))
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _run_job(store, job):
+    data = store.get(job["dataset"])
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run_backtest(job["strategy_code"], data, **job["params"])
+    if not job.get("full"):
+        result = {k: v for k, v in result.items() if k not in BULKY_RESULT_KEYS}
+    return result
+
+
+def run_worker(host="127.0.0.1", port=DISTRIBUTED_PORT, token=DISTRIBUTED_TOKEN, cache_dir=None, name=None,
+               max_jobs=None, connect_timeout=30.0):
+    """
+    Lease and run jobs from a coordinator until it shuts down.
+    :param cache_dir: Local DatasetStore directory for pulled datasets (default: worker_cache_dir())
+    :param max_jobs: Exit after this many jobs (None runs until shutdown)
+    :param connect_timeout: Seconds to keep retrying the initial connection
+    :return: Number of jobs completed
+    """
+    store = DatasetStore(cache_dir or worker_cache_dir())
+    name = name or f"{socket.gethostname()}-{os.getpid()}"
+    deadline = time.monotonic() + connect_timeout
+    delay = 0.1
+    while True:
+        try:
+            sock = socket.create_connection((host, port))
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+    completed = 0
+    with sock:
+        send_message(sock, {"type": "hello", "name": name, "token": token or ""})
+        reply, _ = recv_message(sock)
+        if reply.get("type") != "welcome":
+            raise RuntimeError("Coordinator rejected this worker; check the token")
+        while max_jobs is None or completed < max_jobs:
+            send_message(sock, {"type": "lease", "cached": store.recent()})
+            job, _ = recv_message(sock)
+            if job["type"] == "shutdown":
+                break
+            if job["type"] != "job":
+                continue
+            try:
+                if not store.has(job["dataset"]):
+                    send_message(sock, {"type": "dataset", "key": job["dataset"]})
+                    reply, blob = recv_message(sock)
+                    if reply.get("type") != "dataset":
+                        raise KeyError(f"Coordinator has no dataset {job['dataset']}")
+                    store.write_bytes(job["dataset"], blob)
+                result = _run_job(store, job)
+                send_message(sock, {"type": "result", "id": job["id"], "result": result})
+                completed += 1
+            except (ConnectionError, OSError):
+                raise
+            except Exception as e:
+                logging.error(f"Job {job['id']} failed on {name}: {e}")
+                send_message(sock, {"type": "failed", "id": job["id"], "error": f"{type(e).__name__}: {e}"})
+    logging.info(f"Worker {name} finished after {completed} jobs")
+    return completed
+
+
+def spawn_local_workers(n, host, port, token=DISTRIBUTED_TOKEN, cache_dir=None):
+    """
+    Start `n` worker processes on this machine with `python -m app.distributed worker`.
+    :return: List of subprocess.Popen handles
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "DISTRIBUTED_TOKEN": token or ""}
+    command = [sys.executable, "-m", "app.distributed", "worker", "--host", host, "--port", str(port)]
+    if cache_dir:
+        command += ["--cache-dir", cache_dir]
+    return [subprocess.Popen(command + ["--name", f"local-{i}"], cwd=root, env=env) for i in range(n)]
+
+
+def distributed_backtest(jobs, workers=2, timeout=None, max_attempts=3, lease_seconds=600, store=None):
+    """
+    Run backtests on a private coordinator with `workers` local worker processes.
+    :param jobs: Dicts with `strategy_code`, `data` (DataFrame) or `dataset` (store key), and optional `params`
+    :return: Dictionary with `results` in job order, coordinator `stats` and `elapsed_ms`
+    """
+    start = time.perf_counter()
+    token = DISTRIBUTED_TOKEN or os.urandom(16).hex()
+    coordinator = Coordinator(port=0, store=store, token=token, max_attempts=max_attempts,
+                              lease_seconds=lease_seconds)
+    processes = []
+    try:
+        keys = {}
+        ids = []
+        for job in jobs:
+            dataset = job.get("dataset")
+            if dataset is None:
+                frame = job["data"]
+                dataset = keys.get(id(frame)) or coordinator.add_dataset(frame)
+                keys[id(frame)] = dataset
+            ids.append(coordinator.submit(job["strategy_code"], dataset, job.get("params"), job.get("full", False)))
+        processes = spawn_local_workers(workers, *coordinator.address, token=token,
+                                        cache_dir=worker_cache_dir(coordinator.store.root))
+        results = coordinator.wait(ids, timeout=timeout)
+    finally:
+        coordinator.close()
+        for process in processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    return {"results": results, "stats": coordinator.stats, "elapsed_ms": (time.perf_counter() - start) * 1000}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distributed backtest worker")
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker = commands.add_parser("worker", help="Run jobs leased from a coordinator")
+    worker.add_argument("--host", default="127.0.0.1")
+    worker.add_argument("--port", type=int, default=DISTRIBUTED_PORT)
+    worker.add_argument("--cache-dir", default=None)
+    worker.add_argument("--name", default=None)
+    worker.add_argument("--max-jobs", type=int, default=None)
+    worker.add_argument("--token", default=None, help="Shared secret (default: DISTRIBUTED_TOKEN)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    run_worker(args.host, args.port, token=args.token or DISTRIBUTED_TOKEN, cache_dir=args.cache_dir,
+               name=args.name, max_jobs=args.max_jobs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+# app/execution.py
+import logging
+
+import numpy as np
+
+# numba is optional; without it the per-bar kernel runs as plain Python
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    njit = None
+    NUMBA_AVAILABLE = False
+
+COMMISSION_MODELS = ("percent", "fixed")
+SLIPPAGE_MODELS = ("percent", "range")
+BACKENDS = ("auto", "numba", "numpy", "python")
+
+# With protective exits on, below this many bars per trade the uncompiled per-bar
+# loop beats scanning per-trade NumPy segments
+SEGMENT_BREAKEVEN_BARS = 100
+
+# Exit reasons as stored by the per-bar kernel
+EXIT_REASONS = ("signal", "stop_loss", "take_profit", "trailing_stop", "open")
+
+
+def _validate_models(commission_model, slippage_model):
+    if commission_model not in COMMISSION_MODELS:
+        raise ValueError(f"Unknown commission model '{commission_model}'. Expected one of {COMMISSION_MODELS}.")
+    if slippage_model not in SLIPPAGE_MODELS:
+        raise ValueError(f"Unknown slippage model '{slippage_model}'. Expected one of {SLIPPAGE_MODELS}.")
+
+
+def slippage_offsets(high, low, close, slippage=0.0, slippage_model="percent"):
+    """
+    Per-bar price offset applied against the trader on every fill.
+    :param slippage: Fraction of the close ("percent") or of the bar's high-low range ("range")
+    :return: Array of absolute price offsets, one per bar
+    """
+    if not slippage:
+        return np.zeros(len(close))
+    if slippage_model == "range":
+        return slippage * (high - low)
+    return slippage * close
+
+
+def _buy_units(cash, price, commission, commission_model):
+    """Return (units, fee) when investing all available cash at `price`."""
+    fee = cash * commission if commission_model == "percent" else min(commission, cash)
+    return (cash - fee) / price, fee
+
+
+def _sell_proceeds(units, price, commission, commission_model):
+    """Return (cash, fee) when liquidating `units` at `price`."""
+    gross = units * price
+    fee = gross * commission if commission_model == "percent" else min(commission, gross)
+    return gross - fee, fee
+
+
+def _first_exit(open_, high, low, start, stop, entry_price, stop_loss, take_profit, trailing_stop):
+    """
+    Find the first bar in [start, stop] whose range touches a protective level.
+    The whole segment is evaluated at once with cumulative maxima, so the cost is
+    one vectorized pass per trade instead of one Python iteration per bar.
+    :return: (bar index, raw fill price, reason) or None if no level is touched
+    """
+    if stop < start:
+        return None
+    seg = slice(start, stop + 1)
+    seg_high = high[seg]
+    seg_low = low[seg]
+    seg_open = open_[seg]
+    size = stop - start + 1
+
+    level = np.full(size, -np.inf)
+    trailing = np.zeros(size, dtype=bool)
+    if stop_loss:
+        level[:] = entry_price * (1 - stop_loss)
+    if trailing_stop:
+        # The trailing level for a bar only knows the highs of the bars before it
+        peak = np.empty(size)
+        peak[0] = entry_price
+        if size > 1:
+            peak[1:] = np.maximum.accumulate(np.maximum(seg_high[:-1], entry_price))
+        trail_level = peak * (1 - trailing_stop)
+        trailing = trail_level > level
+        level = np.maximum(level, trail_level)
+    target = entry_price * (1 + take_profit) if take_profit else np.inf
+
+    stop_hit = seg_low <= level
+    target_hit = seg_high >= target
+    hits = np.flatnonzero(stop_hit | target_hit)
+    if hits.size == 0:
+        return None
+
+    k = hits[0]
+    bar_open = seg_open[k]
+    if stop_hit[k] and (not target_hit[k] or bar_open <= level[k] or bar_open < target):
+        # Gaps through the level fill at the open; otherwise assume the stop came first
+        reason = "trailing_stop" if trailing[k] else "stop_loss"
+        return start + k, min(bar_open, level[k]), reason
+    return start + k, max(bar_open, target), "take_profit"
+
+
+def _trade_kernel(open_, high, low, close, signal, offsets, initial_capital, commission, fixed_commission,
+                  stop_loss, take_profit, trailing_stop, max_trades):
+    """
+    Per-bar trade state machine with the same fill rules as `_simulate_segments`.
+    Written with scalars and preallocated arrays only, so numba can compile it unchanged.
+    Protective levels are disabled by passing 0.
+    :return: (cash, units, trade_count, entry_index, exit_index, entry_price, exit_price,
+              trade_units, fees, entry_cash, exit_cash, reason_code)
+    """
+    n = close.shape[0]
+    cash_curve = np.empty(n)
+    unit_curve = np.empty(n)
+    entry_index = np.empty(max_trades, dtype=np.int64)
+    exit_index = np.empty(max_trades, dtype=np.int64)
+    entry_prices = np.empty(max_trades)
+    exit_prices = np.empty(max_trades)
+    trade_units = np.empty(max_trades)
+    fees = np.empty(max_trades)
+    entry_cashes = np.empty(max_trades)
+    exit_cashes = np.empty(max_trades)
+    reasons = np.empty(max_trades, dtype=np.int8)
+
+    has_stops = stop_loss > 0 or take_profit > 0 or trailing_stop > 0
+    cash = initial_capital
+    units = 0.0
+    in_position = False
+    entry_price = 0.0
+    peak = 0.0
+    count = 0
+    for t in range(n):
+        if in_position:
+            exited = False
+            raw_price = 0.0
+            if has_stops:
+                level = -np.inf
+                trailing = False
+                if stop_loss > 0:
+                    level = entry_price * (1 - stop_loss)
+                if trailing_stop > 0:
+                    trail_level = peak * (1 - trailing_stop)
+                    trailing = trail_level > level
+                    level = max(level, trail_level)
+                target = entry_price * (1 + take_profit) if take_profit > 0 else np.inf
+                stop_hit = low[t] <= level
+                target_hit = high[t] >= target
+                if stop_hit or target_hit:
+                    bar_open = open_[t]
+                    if stop_hit and (not target_hit or bar_open <= level or bar_open < target):
+                        raw_price = min(bar_open, level)
+                        reasons[count] = 3 if trailing else 1
+                    else:
+                        raw_price = max(bar_open, target)
+                        reasons[count] = 2
+                    exited = True
+                else:
+                    # The next bar's trailing level includes this bar's high
+                    peak = max(peak, high[t])
+            if not exited and signal[t] == -1:
+                raw_price = close[t]
+                reasons[count] = 0
+                exited = True
+            if exited:
+                exit_price = max(raw_price - offsets[t], 0.0)
+                gross = units * exit_price
+                fee = min(commission, gross) if fixed_commission else gross * commission
+                cash = gross - fee
+                exit_index[count] = t
+                exit_prices[count] = exit_price
+                fees[count] += fee
+                exit_cashes[count] = cash
+                units = 0.0
+                in_position = False
+                count += 1
+
+        # A stop exit leaves the bar's close free, so a buy signal here may re-enter
+        if not in_position and signal[t] == 1 and cash > 0:
+            entry_price = close[t] + offsets[t]
+            fee = min(commission, cash) if fixed_commission else cash * commission
+            units = (cash - fee) / entry_price
+            entry_index[count] = t
+            entry_prices[count] = entry_price
+            trade_units[count] = units
+            fees[count] = fee
+            entry_cashes[count] = cash
+            cash = 0.0
+            in_position = True
+            peak = entry_price
+
+        cash_curve[t] = cash
+        unit_curve[t] = units
+
+    if in_position:
+        exit_index[count] = -1
+        exit_prices[count] = np.nan
+        exit_cashes[count] = np.nan
+        reasons[count] = 4
+        count += 1
+    return (cash_curve, unit_curve, count, entry_index, exit_index, entry_prices, exit_prices,
+            trade_units, fees, entry_cashes, exit_cashes, reasons)
+
+
+_compiled_kernel = njit(cache=True, nogil=True)(_trade_kernel) if NUMBA_AVAILABLE else None
+
+
+def _simulate_kernel(open_, high, low, close, signal, offsets, initial_capital, commission,
+                     stop_loss, take_profit, trailing_stop, commission_model, compiled):
+    """Run the per-bar kernel and convert its arrays to the `simulate_trades` result format."""
+    kernel = _compiled_kernel if compiled else _trade_kernel
+    max_trades = int(np.count_nonzero(signal == 1)) + 1
+    (cash_curve, unit_curve, count, entry_index, exit_index, entry_prices, exit_prices,
+     trade_units, fees, entry_cashes, exit_cashes, reasons) = kernel(
+        open_, high, low, close, signal.astype(np.int64), offsets, float(initial_capital), float(commission),
+        commission_model == "fixed", float(stop_loss or 0.0), float(take_profit or 0.0),
+        float(trailing_stop or 0.0), max_trades)
+
+    trades = []
+    for k in range(count):
+        is_open = exit_index[k] < 0
+        trades.append({
+            "entry_index": int(entry_index[k]),
+            "exit_index": None if is_open else int(exit_index[k]),
+            "entry_price": float(entry_prices[k]),
+            "exit_price": None if is_open else float(exit_prices[k]),
+            "units": float(trade_units[k]),
+            "fees": float(fees[k]),
+            "entry_cash": float(entry_cashes[k]),
+            "exit_cash": None if is_open else float(exit_cashes[k]),
+            "reason": EXIT_REASONS[reasons[k]],
+        })
+    return {
+        "equity": cash_curve + unit_curve * close,
+        "cash": cash_curve,
+        "units": unit_curve,
+        "trades": trades,
+    }
+
+
+def resolve_backend(backend="auto", signal=None, has_stops=False):
+    """
+    Pick the simulation backend.
+    'auto' uses the compiled kernel when numba is installed. Without it, the per-trade
+    NumPy implementation is used unless protective exits are on and trades are so
+    frequent that scanning each segment costs more than a plain per-bar loop.
+    An explicit 'numba' request falls back the same way.
+    :param signal: Signal array, used to estimate the number of trades
+    :param has_stops: Whether stop loss, take profit or trailing stop is enabled
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Expected one of {BACKENDS}.")
+    if backend in ("auto", "numba"):
+        if NUMBA_AVAILABLE:
+            return "numba"
+        if backend == "numba":
+            logging.warning("numba is not installed; using the NumPy backtest backend")
+        if has_stops and signal is not None and len(signal):
+            trades = min(np.count_nonzero(signal == 1), np.count_nonzero(signal == -1) + 1)
+            if trades and len(signal) / trades < SEGMENT_BREAKEVEN_BARS:
+                return "python"
+        return "numpy"
+    return backend
+
+
+def simulate_trades(open_, high, low, close, signal, initial_capital=100.0, commission=0.0,
+                    slippage=0.0, stop_loss=None, take_profit=None, trailing_stop=None,
+                    commission_model="percent", slippage_model="percent", backend="auto"):
+    """
+    Simulate an all-in long-only strategy with costs and intrabar protective exits.
+
+    Signals are filled at the bar close. Stop-loss, take-profit and trailing-stop
+    levels are checked against each later bar's high and low before that bar's
+    close signal is processed.
+
+    :param open_, high, low, close: Price arrays of equal length without NaNs
+    :param signal: Integer array (1 buy, -1 sell, 0 no action)
+    :param commission: Fraction of notional ("percent") or flat quote amount ("fixed") per fill
+    :param slippage: See `slippage_offsets`
+    :param stop_loss, take_profit, trailing_stop: Fractions of the entry price, e.g. 0.02 for 2%
+    :param backend: 'numba' (compiled per-bar kernel), 'numpy' (vectorized per-trade segments),
+                    'python' (the per-bar kernel uncompiled) or 'auto'. All produce the same result.
+    :return: Dictionary with per-bar `equity`, `units` and `cash` arrays and a list of `trades`
+    """
+    _validate_models(commission_model, slippage_model)
+    open_ = np.asarray(open_, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    signal = np.asarray(signal)
+    offsets = slippage_offsets(high, low, close, slippage, slippage_model)
+
+    backend = resolve_backend(backend, signal, bool(stop_loss or take_profit or trailing_stop))
+    if backend in ("numba", "python"):
+        return _simulate_kernel(open_, high, low, close, signal, offsets, initial_capital, commission,
+                                stop_loss, take_profit, trailing_stop, commission_model,
+                                compiled=backend == "numba")
+    return _simulate_segments(open_, high, low, close, signal, offsets, initial_capital, commission,
+                              stop_loss, take_profit, trailing_stop, commission_model)
+
+
+def _simulate_segments(open_, high, low, close, signal, offsets, initial_capital, commission,
+                       stop_loss, take_profit, trailing_stop, commission_model):
+    """
+    NumPy backend: work is done per trade on array segments, never per bar.
+    """
+    n = len(close)
+    buy_idx = np.flatnonzero(signal == 1)
+    sell_idx = np.flatnonzero(signal == -1)
+    has_stops = bool(stop_loss or take_profit or trailing_stop)
+
+    # Cash and units only change at fills, so record change points and forward fill later
+    cash_marks = np.full(n, np.nan)
+    unit_marks = np.full(n, np.nan)
+    if n:
+        cash_marks[0] = initial_capital
+        unit_marks[0] = 0.0
+
+    trades = []
+    cash = float(initial_capital)
+    i = 0
+    while i < n:
+        b = np.searchsorted(buy_idx, i)
+        if b >= len(buy_idx) or cash <= 0:
+            break
+        entry = int(buy_idx[b])
+        entry_price = close[entry] + offsets[entry]
+        entry_cash = cash
+        units, entry_fee = _buy_units(cash, entry_price, commission, commission_model)
+        cash = 0.0
+        cash_marks[entry] = cash
+        unit_marks[entry] = units
+
+        s = np.searchsorted(sell_idx, entry, side="right")
+        sell_bar = int(sell_idx[s]) if s < len(sell_idx) else None
+        last_bar = sell_bar if sell_bar is not None else n - 1
+
+        exit_info = None
+        if has_stops:
+            exit_info = _first_exit(open_, high, low, entry + 1, last_bar, entry_price,
+                                    stop_loss, take_profit, trailing_stop)
+        if exit_info is not None:
+            exit_bar, raw_price, reason = exit_info
+            next_i = exit_bar  # flat again before the close, so a buy on this bar may re-enter
+        elif sell_bar is not None:
+            exit_bar, raw_price, reason = sell_bar, close[sell_bar], "signal"
+            next_i = sell_bar + 1
+        else:
+            trades.append({
+                "entry_index": entry, "exit_index": None, "entry_price": entry_price,
+                "exit_price": None, "units": units, "fees": entry_fee,
+                "entry_cash": entry_cash, "exit_cash": None, "reason": "open",
+            })
+            break
+
+        exit_price = max(raw_price - offsets[exit_bar], 0.0)
+        cash, exit_fee = _sell_proceeds(units, exit_price, commission, commission_model)
+        cash_marks[exit_bar] = cash
+        unit_marks[exit_bar] = 0.0
+        trades.append({
+            "entry_index": entry, "exit_index": int(exit_bar), "entry_price": entry_price,
+            "exit_price": exit_price, "units": units, "fees": entry_fee + exit_fee,
+            "entry_cash": entry_cash, "exit_cash": cash, "reason": reason,
+        })
+        i = next_i
+
+    cash_curve = _forward_fill(cash_marks)
+    unit_curve = _forward_fill(unit_marks)
+    return {
+        "equity": cash_curve + unit_curve * close,
+        "cash": cash_curve,
+        "units": unit_curve,
+        "trades": trades,
+    }
+
+
+def _forward_fill(values):
+    """Forward fill NaNs in a 1-D array without a Python loop."""
+    if not len(values):
+        return values
+    idx = np.where(np.isnan(values), 0, np.arange(len(values)))
+    np.maximum.accumulate(idx, out=idx)
+    return values[idx]
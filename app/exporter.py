@@ -0,0 +1,188 @@
+# app/exporter.py
+import gzip
+import json
+import logging
+import os
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from app.utils import code_hash
+
+# pyarrow is optional; without it only compressed CSV is available
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+    PYARROW_AVAILABLE = False
+
+EXPORT_FORMATS = ("parquet", "arrow", "csv.gz")
+
+# Per-run metadata repeated on every row so each table can be filtered on its own
+META_COLUMNS = ["run_id", "code_hash", "symbol", "interval"]
+
+EQUITY_COLUMNS = {"timestamp": "datetime64[ns]", "equity": "float64", "close": "float64"}
+TRADE_COLUMNS = {
+    "timestamp": "datetime64[ns]", "action": "string", "price": "float64", "position": "float64",
+    "equity": "float64", "profit_pct": "float64", "reason": "string",
+}
+METRIC_COLUMNS = [
+    "initial_capital", "final_value", "return", "annualized_return", "win_rate", "total_trades",
+    "profitable_trades", "losing_trades", "average_profit", "average_loss", "profit_factor",
+    "expectancy", "max_drawdown", "max_drawdown_duration", "sharpe_ratio", "sortino_ratio",
+    "calmar_ratio", "exposure", "total_fees",
+]
+
+
+def run_metadata(strategy_code, symbol, interval, config=None, run_id=None):
+    """
+    Describe one backtest run for export.
+    :param strategy_code: Source of the strategy that produced the result
+    :param config: Backtest keyword arguments (commission, stops, ...) stored as JSON
+    :return: Metadata dictionary
+    """
+    return {
+        "run_id": run_id or uuid.uuid4().hex,
+        "code_hash": code_hash(strategy_code),
+        "symbol": symbol,
+        "interval": interval,
+        "config": json.dumps(config or {}, sort_keys=True, default=str),
+        "created_at": pd.Timestamp(time.time(), unit="s"),
+    }
+
+
+class _TableWriter:
+    """Appends DataFrame chunks with a fixed schema to one Parquet, Arrow IPC or gzip CSV file."""
+
+    def __init__(self, path, fmt):
+        self.path = path
+        self.fmt = fmt
+        self._writer = None
+        self._schema = None
+        self.rows = 0
+
+    def write(self, chunk):
+        if chunk.empty:
+            return
+        if self.fmt == "csv.gz":
+            header = self._writer is None
+            if header:
+                self._writer = gzip.open(self.path, "wt", encoding="utf-8", newline="")
+            chunk.to_csv(self._writer, header=header, index=False)
+        else:
+            table = pa.Table.from_pandas(chunk, schema=self._schema, preserve_index=False)
+            if self._writer is None:
+                self._schema = table.schema
+                if self.fmt == "parquet":
+                    self._writer = pq.ParquetWriter(self.path, self._schema, compression="zstd")
+                else:
+                    self._sink = pa.OSFile(self.path, "wb")
+                    self._writer = pa_ipc.new_file(self._sink, self._schema)
+            self._writer.write_table(table)
+        self.rows += len(chunk)
+
+    def close(self):
+        if self._writer is None:
+            return
+        self._writer.close()
+        if self.fmt == "arrow":
+            self._sink.close()
+        self._writer = None
+
+
+class ResultExporter:
+    """
+    Stream equity curves, trade logs and metrics of one or many runs to disk.
+
+    Each table is written to its own file (`equity`, `trades`, `metrics`) in
+    `chunk_size` row batches, so only one chunk of one run is held in memory
+    at a time. Every row carries the run id, strategy code hash, symbol and
+    interval; the metrics table also stores the backtest config.
+    """
+
+    def __init__(self, directory, fmt="parquet", chunk_size=100_000):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format '{fmt}'. Expected one of {EXPORT_FORMATS}.")
+        if fmt != "csv.gz" and not PYARROW_AVAILABLE:
+            error_msg = f"Exporting to {fmt} requires pyarrow. Install it or use 'csv.gz'."
+            logging.error(error_msg)
+            raise RuntimeError(error_msg)
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.runs = 0
+        self._tables = {
+            name: _TableWriter(os.path.join(directory, f"{name}.{fmt}"), fmt)
+            for name in ("equity", "trades", "metrics")
+        }
+
+    @property
+    def paths(self):
+        return {name: writer.path for name, writer in self._tables.items()}
+
+    def _tag(self, frame, metadata):
+        for column in reversed(META_COLUMNS):
+            frame.insert(0, column, metadata[column])
+        return frame
+
+    def _write_records(self, table, records, columns, metadata):
+        """Convert list-of-dict records to typed frames one chunk at a time."""
+        for start in range(0, len(records), self.chunk_size):
+            chunk = pd.DataFrame.from_records(records[start:start + self.chunk_size])
+            frame = pd.DataFrame(index=chunk.index)
+            for column, dtype in columns.items():
+                values = chunk[column] if column in chunk.columns else pd.Series(None, index=chunk.index, dtype=object)
+                frame[column] = pd.to_datetime(values) if dtype == "datetime64[ns]" else values.astype(dtype)
+            self._tables[table].write(self._tag(frame, metadata))
+
+    def write_run(self, result, metadata):
+        """
+        Append one backtest result.
+        :param result: Dictionary returned by run_backtest
+        :param metadata: Dictionary from run_metadata
+        """
+        if "error" in result:
+            logging.warning(f"Skipping export of failed run {metadata['run_id']}: {result['error']}")
+            return
+        self._write_records("equity", result.get("equity_curve", []), EQUITY_COLUMNS, metadata)
+        self._write_records("trades", result.get("trade_log", []), TRADE_COLUMNS, metadata)
+
+        row = {column: metadata[column] for column in META_COLUMNS}
+        row["config"] = metadata.get("config", "{}")
+        row["created_at"] = metadata.get("created_at")
+        for column in METRIC_COLUMNS:
+            value = result.get(column)
+            row[column] = float(value) if value is not None else np.nan
+        self._tables["metrics"].write(pd.DataFrame([row]))
+        self.runs += 1
+
+    def close(self):
+        for writer in self._tables.values():
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def export_results(runs, directory, fmt="parquet", chunk_size=100_000):
+    """
+    Export an iterable of (result, metadata) pairs, consuming it lazily.
+    :param runs: Iterable or generator yielding (run_backtest result, run_metadata dict)
+    :param directory: Output directory; one file per table is created
+    :param fmt: 'parquet', 'arrow' or 'csv.gz'
+    :return: Dictionary mapping table names to file paths
+    """
+    with ResultExporter(directory, fmt=fmt, chunk_size=chunk_size) as exporter:
+        for result, metadata in runs:
+            exporter.write_run(result, metadata)
+    logging.info(f"Exported {exporter.runs} runs to {directory}")
+    return exporter.paths
@@ -0,0 +1,244 @@
+# app/indicator_cache.py
+import builtins
+import functools
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pandas_ta as ta
+
+from app.utils import dataset_fingerprint
+
+# Names pandas_ta files under an indicator category; anything else (Strategy, utilities) is passed through
+INDICATOR_NAMES = {name for names in getattr(ta, "Category", {}).values() for name in names}
+
+# Accessor kwargs that only affect how the result is attached, not its values
+_ACCESSOR_ONLY_KWARGS = {"append"}
+
+# Marker for arguments that cannot be part of a cache key
+_UNCACHEABLE = object()
+
+
+def _nbytes(value):
+    """Approximate memory held by a cached result."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=False))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    return 64
+
+
+def _copy(value):
+    return value.copy() if hasattr(value, "copy") else value
+
+
+class IndicatorCache:
+    """
+    Thread-safe LRU cache of indicator results keyed by (input fingerprint, indicator, parameters).
+    Memory is bounded by `max_bytes`; least recently used entries are evicted first.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, max_entries=4096):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def make_key(self, name, args, kwargs):
+        """
+        Build a cache key, or return None when an argument cannot be fingerprinted.
+        Series and DataFrames are hashed by content; scalars by value.
+        """
+        def normalize(value):
+            if isinstance(value, (pd.Series, pd.DataFrame)):
+                return ("data", dataset_fingerprint(value))
+            if value is None or isinstance(value, (bool, int, float, str)):
+                return value
+            if isinstance(value, (np.integer, np.floating)):
+                return value.item()
+            if isinstance(value, (tuple, list)):
+                items = tuple(normalize(v) for v in value)
+                return _UNCACHEABLE if any(i is _UNCACHEABLE for i in items) else items
+            return _UNCACHEABLE
+
+        normalized_args = tuple(normalize(a) for a in args)
+        normalized_kwargs = tuple(sorted((k, normalize(v)) for k, v in kwargs.items()))
+        if any(a is _UNCACHEABLE for a in normalized_args) or any(v is _UNCACHEABLE for _, v in normalized_kwargs):
+            return None
+        return (name, normalized_args, normalized_kwargs)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, _copy(self._entries[key][0])
+            self.misses += 1
+        return False, None
+
+    def put(self, key, value):
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (_copy(value), size)
+            self.nbytes += size
+            while self._entries and (self.nbytes > self.max_bytes or len(self._entries) > self.max_entries):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_size
+                self.evictions += 1
+
+    def cached_call(self, name, func, *args, **kwargs):
+        """Call `func` through the cache under `name`."""
+        key = self.make_key(name, args, kwargs)
+        if key is None:
+            return func(*args, **kwargs)
+        found, value = self.get(key)
+        if found:
+            return value
+        value = func(*args, **kwargs)
+        if value is not None:
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def _is_indicator(name, attr):
+    if name.startswith("_") or isinstance(attr, type) or not callable(attr):
+        return False
+    return name in INDICATOR_NAMES if INDICATOR_NAMES else True
+
+
+class CachedTA:
+    """Stand-in for the `pandas_ta` module whose indicator functions go through an IndicatorCache."""
+
+    def __init__(self, cache, module=ta):
+        self._cache = cache
+        self._module = module
+
+    def __getattr__(self, name):
+        attr = getattr(self._module, name)
+        if not _is_indicator(name, attr):
+            return attr
+        return functools.wraps(attr)(functools.partial(self._cache.cached_call, name, attr))
+
+    def __dir__(self):
+        return dir(self._module)
+
+
+class CachedIndicatorFrame(pd.DataFrame):
+    """
+    DataFrame whose `.ta` accessor memoizes indicator results.
+    The indicator is computed on the frame's OHLCV columns (plus any columns named in
+    the call) and attached afterwards when `append=True`, mirroring pandas_ta.
+    """
+
+    _metadata = ["_indicator_cache"]
+
+    @property
+    def _constructor(self):
+        return CachedIndicatorFrame
+
+    @property
+    def ta(self):
+        accessor = pd.DataFrame.ta(self)
+        cache = getattr(self, "_indicator_cache", None)
+        return _CachedAccessor(self, accessor, cache) if cache is not None else accessor
+
+
+class _CachedAccessor:
+    def __init__(self, frame, accessor, cache):
+        self._frame = frame
+        self._accessor = accessor
+        self._cache = cache
+
+    def __getattr__(self, name):
+        attr = getattr(self._accessor, name)
+        if not _is_indicator(name, attr):
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            frame = self._frame
+            columns = [c for c in ("open", "high", "low", "close", "volume") if c in frame.columns]
+            columns += [v for v in kwargs.values() if isinstance(v, str) and v in frame.columns and v not in columns]
+            inputs = pd.DataFrame(frame[columns], copy=False)
+            params = {k: v for k, v in kwargs.items() if k not in _ACCESSOR_ONLY_KWARGS}
+            key = self._cache.make_key("accessor." + name, (inputs,) + args, params)
+            if key is None:
+                return attr(*args, **kwargs)
+            found, result = self._cache.get(key)
+            if not found:
+                result = attr(*args, **dict(params, append=False))
+                if result is not None:
+                    self._cache.put(key, result)
+            if kwargs.get("append") and result is not None:
+                if isinstance(result, pd.DataFrame):
+                    for column in result.columns:
+                        frame[column] = result[column]
+                else:
+                    frame[result.name] = result
+            return result
+
+        return call
+
+
+def wrap_frame(ohlc_data, cache):
+    """Return a copy of `ohlc_data` whose `.ta` accessor uses `cache`."""
+    frame = CachedIndicatorFrame(ohlc_data.copy())
+    frame._indicator_cache = cache
+    return frame
+
+
+def caching_builtins(cached_ta):
+    """
+    Builtins for exec'd strategy code in which `import pandas_ta` resolves to `cached_ta`,
+    so strategies that import the library themselves still hit the cache.
+    """
+    real_import = builtins.__import__
+
+    def _import(name, globals=None, locals=None, fromlist=(), level=0):
+        if name == "pandas_ta" and level == 0:
+            return cached_ta
+        return real_import(name, globals, locals, fromlist, level)
+
+    namespace = dict(builtins.__dict__)
+    namespace["__import__"] = _import
+    return namespace
+
+
+def _default_max_bytes():
+    try:
+        return int(float(os.getenv("INDICATOR_CACHE_MB", "256")) * 1024 * 1024)
+    except ValueError:
+        logging.warning("Invalid INDICATOR_CACHE_MB; using 256 MB")
+        return 256 * 1024 * 1024
+
+
+# Process-wide cache shared by every backtest on this host
+shared_cache = IndicatorCache(max_bytes=_default_max_bytes())
@@ -0,0 +1,269 @@
+# app/loadtest.py
+"""
+Offline load test of the strategy pipeline against mock Azure OpenAI and Binance servers.
+
+    python -m app.loadtest --users 20 --sessions 100 --azure-latency-ms 800 --error-rate 0.02
+
+Each simulated user runs the same steps as a Streamlit session (interpret,
+fetch, generate, backtest) through the real pipeline functions; only the
+network endpoints are local mocks.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import app.data_handler as data_handler
+import app.nlp_handler as nlp_handler
+import app.strategy_generator as strategy_generator
+from app.backtester import run_backtest
+from app.mock_servers import MockAzureOpenAI, MockBinance
+from app.prefetch import Prefetcher
+from app.results_store import ResultsStore, cached_backtest
+from app.rule_engine import compile_strategy, parse_strategy_text
+
+# Session inputs: the first two are handled by the rule engine, the rest need the LLM
+SESSION_INPUTS = (
+    "Buy {asset} when RSI(14) falls below 30 on a {timeframe} timeframe, sell when RSI goes above 70",
+    "Buy {asset} when the 20-period EMA crosses above the 50-period EMA on {timeframe}, "
+    "exit when the 20-period EMA crosses below the 50-period EMA",
+    "Buy {asset} on {timeframe} when price breaks the 20-bar high on rising volume, exit on a close below the 10-bar low",
+    "Accumulate {asset} on {timeframe} after three red candles in a row and sell into the next strong rally",
+    "Trade {asset} {timeframe} momentum: buy when the fast average turns up after a pullback, sell when it rolls over",
+)
+
+SESSION_ASSETS = ("BTC", "ETH", "SOL", "BNB", "XRP")
+SESSION_TIMEFRAMES = ("15m", "1h", "4h")
+
+STAGES = ("interpret", "fetch", "generate", "backtest", "session")
+
+PERCENTILES = (50, 95, 99)
+
+
+def install_mocks(azure_url, binance_url):
+    """
+    Point the pipeline modules at mock servers. Only for dedicated load-test processes:
+    this rewires module globals (endpoints, the Binance client) for the whole process.
+    :return: Previous values, for restore_mocks
+    """
+    previous = {
+        "nlp": (nlp_handler.endpoint, nlp_handler.api_key),
+        "generator": (strategy_generator.endpoint, strategy_generator.api_key),
+        "binance": (data_handler.client, data_handler.BINANCE_AVAILABLE, data_handler.BINANCE_API_URL),
+        "client_api_url": data_handler.Client.API_URL,
+    }
+    nlp_handler.endpoint, nlp_handler.api_key = azure_url, "mock-key"
+    strategy_generator.endpoint, strategy_generator.api_key = azure_url, "mock-key"
+    # python-binance pings API_URL while constructing the client
+    data_handler.Client.API_URL = f"{binance_url}/api"
+    client = data_handler.Client("", "")
+    client.API_URL = f"{binance_url}/api"
+    data_handler.client = client
+    data_handler.BINANCE_AVAILABLE = True
+    data_handler.BINANCE_API_URL = binance_url
+    data_handler._exchange_info["fetched_at"] = 0.0
+    data_handler.ohlc_cache.clear()
+    return previous
+
+
+def restore_mocks(previous):
+    """Undo install_mocks."""
+    nlp_handler.endpoint, nlp_handler.api_key = previous["nlp"]
+    strategy_generator.endpoint, strategy_generator.api_key = previous["generator"]
+    data_handler.client, data_handler.BINANCE_AVAILABLE, data_handler.BINANCE_API_URL = previous["binance"]
+    data_handler.Client.API_URL = previous["client_api_url"]
+    data_handler._exchange_info["fetched_at"] = 0.0
+    data_handler.ohlc_cache.clear()
+
+
+def _timed(timings, errors, stage, function, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        return function(*args, **kwargs)
+    except Exception as e:
+        errors.append((stage, f"{type(e).__name__}: {str(e)[:120]}"))
+        raise
+    finally:
+        timings.append((stage, (time.perf_counter() - start) * 1000))
+
+
+def run_session(text, prefetcher, store=None, think_ms=0):
+    """
+    Run one user session through the pipeline the way main.py does.
+    :return: (list of (stage, ms), list of (stage, error))
+    """
+    timings, errors = [], []
+    start = time.perf_counter()
+    try:
+        params = parse_strategy_text(text)
+        # Inputs the rule engine understands never reach Azure and are not timed as interpretations
+        if params is None:
+            params = _timed(timings, errors, "interpret", nlp_handler.interpret_user_input, text)
+        symbol = params.get("Asset", "BTC/USDT").replace("/", "")
+        timeframe = params.get("Timeframe", "1h")
+        prefetcher.prefetch(symbol, timeframe)
+        time.sleep(think_ms / 1000)
+
+        ohlc_data = _timed(timings, errors, "fetch", prefetcher.fetch, symbol, timeframe)
+        time.sleep(think_ms / 1000)
+
+        if params.get("Rules"):
+            code = _timed(timings, errors, "generate", compile_strategy, params["Rules"])
+        else:
+            generator = strategy_generator.StrategyGenerator(params, ohlcv_data=ohlc_data)
+            code = _timed(timings, errors, "generate", generator.generate_strategy)
+        time.sleep(think_ms / 1000)
+
+        backtest_kwargs = {"interval": timeframe, "initial_capital": 100, "commission": 0.001}
+        if store is not None:
+            result = _timed(timings, errors, "backtest", cached_backtest, store, code, ohlc_data,
+                            symbol=symbol, **backtest_kwargs)
+        else:
+            result = _timed(timings, errors, "backtest", run_backtest, code, ohlc_data, **backtest_kwargs)
+        if "error" in result:
+            errors.append(("backtest", result["error"][:120]))
+    except Exception:
+        pass
+    timings.append(("session", (time.perf_counter() - start) * 1000))
+    return timings, errors
+
+
+def summarize(timings, errors, elapsed_s, sessions, failed_sessions):
+    """Per-stage latency percentiles, error counts and throughput."""
+    frame = pd.DataFrame(timings, columns=["stage", "ms"])
+    stages = {}
+    for stage in STAGES:
+        values = frame.loc[frame["stage"] == stage, "ms"].to_numpy()
+        failed = sum(1 for name, _ in errors if name == stage)
+        row = {"count": int(values.size), "errors": failed}
+        if values.size:
+            row.update({f"p{p}_ms": float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))})
+            row.update({"mean_ms": float(values.mean()), "max_ms": float(values.max())})
+        stages[stage] = row
+    messages = {}
+    for stage, message in errors:
+        messages.setdefault(stage, {})
+        messages[stage][message] = messages[stage].get(message, 0) + 1
+    return {
+        "sessions": sessions,
+        "elapsed_s": elapsed_s,
+        "throughput_sessions_per_s": sessions / elapsed_s if elapsed_s else None,
+        "stages": stages,
+        "errors": messages,
+        "failed_sessions": failed_sessions,
+    }
+
+
+def run_load_test(users=20, sessions=100, azure_latency_ms=800.0, binance_latency_ms=50.0, error_rate=0.0,
+                  think_ms=0, use_store=True, trace_memory=True, seed=0):
+    """
+    Replay `sessions` user sessions, `users` at a time, against fresh mock servers.
+    Sessions run on threads in this process, as Streamlit runs script sessions.
+    :param error_rate: Fraction of mock Azure and Binance requests that fail
+    :param think_ms: Pause between steps, as a user reading the page would
+    :param use_store: Back the backtest step with a temporary ResultsStore, as main.py does
+    :param trace_memory: Track peak Python allocations with tracemalloc (slows allocation-heavy code)
+    :return: Report dictionary with per-stage p50/p95/p99 latency, throughput, errors, peak memory
+             and mock request counts
+    """
+    rng = random.Random(seed)
+    texts = [rng.choice(SESSION_INPUTS).format(asset=rng.choice(SESSION_ASSETS),
+                                               timeframe=rng.choice(SESSION_TIMEFRAMES))
+             for _ in range(sessions)]
+    azure = MockAzureOpenAI(latency_ms=azure_latency_ms, error_rate=error_rate, seed=seed).start()
+    binance = MockBinance(latency_ms=binance_latency_ms, error_rate=error_rate, seed=seed).start()
+    previous = install_mocks(azure.url, binance.url)
+    prefetcher = Prefetcher()
+    store_dir = tempfile.TemporaryDirectory() if use_store else None
+    store = ResultsStore(f"{store_dir.name}/loadtest.db") if use_store else None
+    timings, errors = [], []
+    failed = [0]
+    lock = threading.Lock()
+
+    def _session(text):
+        session_timings, session_errors = run_session(text, prefetcher, store=store, think_ms=think_ms)
+        with lock:
+            timings.extend(session_timings)
+            errors.extend(session_errors)
+            failed[0] += bool(session_errors)
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        # The backtester prints every strategy and frame it runs; keep the report readable
+        with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink), \
+                ThreadPoolExecutor(max_workers=users) as pool:
+            list(pool.map(_session, texts))
+        elapsed = time.perf_counter() - start
+        peak_traced = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        prefetcher.shutdown()
+        restore_mocks(previous)
+        azure.close()
+        binance.close()
+        if store is not None:
+            store.close()
+            store_dir.cleanup()
+
+    report = summarize(timings, errors, elapsed, sessions, failed[0])
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == "darwin" else 1024)
+    report.update({
+        "users": users,
+        "peak_traced_mb": peak_traced / 1024 ** 2 if peak_traced is not None else None,
+        "max_rss_mb": max_rss,
+        "mock_requests": {"azure": azure.stats, "binance": binance.stats},
+    })
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the pipeline against mock Azure and Binance servers")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent sessions")
+    parser.add_argument("--sessions", type=int, default=100, help="Total sessions to run")
+    parser.add_argument("--azure-latency-ms", type=float, default=800.0)
+    parser.add_argument("--binance-latency-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--think-ms", type=float, default=0.0)
+    parser.add_argument("--no-store", action="store_true", help="Skip the results store in the backtest step")
+    parser.add_argument("--no-trace", action="store_true", help="Skip tracemalloc")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report = run_load_test(users=args.users, sessions=args.sessions, azure_latency_ms=args.azure_latency_ms,
+                           binance_latency_ms=args.binance_latency_ms, error_rate=args.error_rate,
+                           think_ms=args.think_ms, use_store=not args.no_store, trace_memory=not args.no_trace,
+                           seed=args.seed)
+    print(pd.DataFrame(report["stages"]).T.round(1).to_string())
+    print(f"\n{report['sessions']} sessions, {report['users']} users: {report['elapsed_s']:.1f}s, "
+          f"{report['throughput_sessions_per_s']:.2f} sessions/s, {report['failed_sessions']} failed")
+    if report["peak_traced_mb"] is not None:
+        print(f"Peak traced memory {report['peak_traced_mb']:.1f} MB, max RSS {report['max_rss_mb']:.1f} MB")
+    for stage, messages in report["errors"].items():
+        for message, count in messages.items():
+            print(f"{stage}: {count} x {message}")
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump(report, handle, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
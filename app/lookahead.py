@@ -0,0 +1,185 @@
+# app/lookahead.py
+import contextlib
+import io
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.backtester import StrategyExecutionError, execute_strategy, strip_code_fences
+from app.code_analyzer import analyze_strategy_code
+
+# Prefixes shorter than this are not checked; most indicators are still warming up
+MIN_PREFIX_BARS = 100
+
+# Divergent bars listed in the report
+MAX_REPORTED_BARS = 20
+
+# Per-process state for pool workers, set once by _init_worker so tasks only carry a prefix length
+_worker_state = {}
+
+
+def _init_worker(strategy_code, ohlc_data):
+    _worker_state["code"] = strategy_code
+    _worker_state["data"] = ohlc_data
+
+
+def _prefix_run(length):
+    """
+    Worker entry point: run the strategy on the first `length` bars.
+    :return: (length, {column: float64 array} for the signal and every numeric output column, error or None)
+    """
+    data = _worker_state["data"].iloc[:length]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            df = execute_strategy(_worker_state["code"], data, indicator_cache=False)
+        df = df.reindex(data.index)
+        columns = {"signal": df["signal"].fillna(0).to_numpy(dtype=np.float64)}
+        for name in df.columns:
+            if name != "signal" and df[name].dtype.kind in "biuf":
+                columns[str(name)] = df[name].to_numpy(dtype=np.float64)
+    except StrategyExecutionError as e:
+        return length, None, str(e)
+    except Exception as e:
+        return length, None, f"Strategy failed: {e}"
+    return length, columns, None
+
+
+def _compare(prefix, full, length):
+    """
+    Bars where a prefix run disagrees with the full run, and the columns that differ.
+    Indicator columns are compared as well as signals: a column that reads a future bar
+    changes on the prefix's last bars even when no signal happens to fire there.
+    """
+    changed = np.zeros(length, dtype=bool)
+    columns = []
+    for name, values in prefix.items():
+        if name not in full:
+            continue
+        differs = ~np.isclose(values, full[name][:length], rtol=1e-9, atol=0.0, equal_nan=True)
+        if differs.any():
+            changed |= differs
+            columns.append(name)
+    return np.flatnonzero(changed), columns
+
+
+def _run_lengths(lengths, pool):
+    if pool is None:
+        return [_prefix_run(length) for length in lengths]
+    return list(pool.map(_prefix_run, lengths))
+
+
+def detect_lookahead(strategy_code, ohlc_data, checkpoints=8, min_bars=MIN_PREFIX_BARS, max_workers=None,
+                     locate=True):
+    """
+    Check whether a strategy's signals depend on bars that come after them.
+
+    A causal strategy gives the same signal on bar i whether it sees the data up
+    to bar i or the whole history, so its signals and indicator columns on any
+    prefix of the data must match the full run. The strategy is run once on the
+    full data and on `checkpoints` prefixes of geometrically growing length, in
+    parallel. If a prefix disagrees, the gap between the longest agreeing and
+    the shortest disagreeing checkpoint is narrowed by a parallel k-ary (binary
+    with one worker) search until the two lengths are one bar apart, which
+    pinpoints a bar whose values are rewritten by the data after it. The total
+    cost is a few full backtests, independent of the number of bars.
+
+    :param strategy_code: Python source defining `trading_strategy(ohlc_data)`
+    :param ohlc_data: DataFrame the strategy is backtested on
+    :param checkpoints: Prefix lengths sampled before the search
+    :param min_bars: Shortest prefix checked
+    :param max_workers: Process pool size; 1 runs in-process, None uses all CPUs
+    :param locate: Search for the divergence; False stops at the checkpoints
+    :return: Dictionary with `lookahead` (bool), `first_divergence` (None or the prefix length,
+             the earliest changed bar and its timestamp), `checkpoints`, static `hints` from the
+             code analyzer, `runs`, `elapsed_ms` and `cost_multiple` (elapsed over one full run),
+             or {"error": ...}
+    """
+    start = time.perf_counter()
+    strategy_code = strip_code_fences(strategy_code)
+    analysis = analyze_strategy_code(strategy_code)
+    if not analysis["valid"]:
+        return {"error": "Strategy code failed validation: " + "; ".join(analysis["errors"])}
+    n = len(ohlc_data)
+    if n <= min_bars:
+        return {"error": f"Need more than {min_bars} bars to check for look-ahead; got {n}."}
+
+    _init_worker(strategy_code, ohlc_data)
+    _, full, error = _prefix_run(n)
+    if error:
+        return {"error": error}
+    baseline_ms = (time.perf_counter() - start) * 1000
+
+    max_workers = max_workers or os.cpu_count() or 1
+    pool = None
+    if max_workers > 1:
+        try:
+            pool = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                       initargs=(strategy_code, ohlc_data))
+        except (OSError, RuntimeError) as e:
+            logging.warning(f"Process pool unavailable ({e}); checking prefixes in-process")
+
+    runs = 1
+    checked = {}
+
+    def _check(lengths):
+        nonlocal runs
+        lengths = [length for length in lengths if length not in checked]
+        runs += len(lengths)
+        for length, columns, failure in _run_lengths(lengths, pool):
+            if failure:
+                checked[length] = {"length": length, "error": failure}
+                continue
+            changed, differing = _compare(columns, full, length)
+            checked[length] = {"length": length, "diverged": bool(changed.size), "changed_bars": int(changed.size),
+                               "first_changed": int(changed[0]) if changed.size else None,
+                               "signal_changed": "signal" in differing, "columns": differing,
+                               "changed_indices": changed[:MAX_REPORTED_BARS].tolist()}
+
+    try:
+        # Geometric spacing: look-ahead shows up at any prefix, and short prefixes are cheap
+        lengths = np.unique(np.geomspace(min_bars, n - 1, checkpoints).astype(int))
+        _check(lengths.tolist())
+        sampled = [checked[length] for length in lengths]
+        failing = [c["length"] for c in sampled if c.get("diverged")]
+        first = None
+        if failing:
+            hi = failing[0]
+            passing = [c["length"] for c in sampled if c.get("diverged") is False and c["length"] < hi]
+            lo = passing[-1] if passing else min_bars - 1
+            # Keep lo agreeing and hi disagreeing; probe max_workers evenly spaced lengths per round
+            while locate and hi - lo > 1:
+                probes = np.unique(np.linspace(lo, hi, min(max_workers, hi - lo - 1) + 2).astype(int)[1:-1])
+                _check(probes.tolist())
+                for length in probes:
+                    if checked[length].get("diverged"):
+                        hi = int(length)
+                        break
+                    if checked[length].get("diverged") is False:
+                        lo = int(length)
+                if hi - lo > 1 and all("error" in checked[length] for length in probes):
+                    break
+            first = dict(checked[hi])
+            first["timestamp"] = str(ohlc_data["timestamp"].iloc[first["first_changed"]]) \
+                if "timestamp" in ohlc_data else None
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    report = {
+        "lookahead": first is not None,
+        "first_divergence": first,
+        "checkpoints": sampled,
+        "hints": analysis["lookahead"],
+        "runs": runs,
+        "bars": n,
+        "baseline_ms": baseline_ms,
+        "elapsed_ms": elapsed_ms,
+        "cost_multiple": elapsed_ms / baseline_ms if baseline_ms else None,
+    }
+    logging.info(f"Look-ahead check: {'found' if first else 'none'} after {runs} runs "
+                 f"({report['cost_multiple']:.1f}x one full run)")
+    return report
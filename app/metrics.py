@@ -0,0 +1,200 @@
+# app/metrics.py
+import logging
+
+import numpy as np
+from app.utils import interval_to_seconds
+
+SECONDS_PER_YEAR = 365 * 86400  # Crypto markets trade every day of the year
+
+
+def periods_per_year(interval=None, timestamps=None):
+    """
+    Number of bars in a year for a timeframe.
+    :param interval: Timeframe string such as '1h' or '4H'
+    :param timestamps: Optional datetime64 array used to infer the bar length when the interval is
+                       missing or unrecognized
+    :return: Bars per year as a float
+    """
+    if interval:
+        try:
+            return SECONDS_PER_YEAR / interval_to_seconds(interval)
+        except (TypeError, ValueError):
+            # Free-form LLM timeframes such as 'hourly'; the data itself still says how long a bar is
+            logging.warning(f"Unrecognized interval '{interval}'; inferring bar length from the timestamps")
+    if timestamps is not None and len(timestamps) > 1:
+        steps = np.diff(np.asarray(timestamps, dtype="datetime64[ns]").astype(np.int64))
+        step = float(np.median(steps)) / 1e9
+        if step > 0:
+            return SECONDS_PER_YEAR / step
+    return 365.0
+
+
+def simple_returns(equity):
+    """Bar-to-bar returns along the last axis; one element shorter than the input."""
+    equity = np.asarray(equity, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.diff(equity, axis=-1) / equity[..., :-1]
+    return np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def drawdown(equity):
+    """Fractional drawdown from the running peak (0 at new highs, negative below)."""
+    equity = np.asarray(equity, dtype=np.float64)
+    peak = np.maximum.accumulate(equity, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dd = np.where(peak > 0, equity / peak - 1.0, 0.0)
+    return dd
+
+
+def max_drawdown(equity):
+    """Worst drawdown in percent (a non-positive number)."""
+    equity = np.asarray(equity, dtype=np.float64)
+    if equity.shape[-1] == 0:
+        return np.zeros(equity.shape[:-1]) if equity.ndim > 1 else 0.0
+    return drawdown(equity).min(axis=-1) * 100
+
+
+def max_drawdown_duration(equity):
+    """Longest stretch, in bars, spent below a previous equity peak."""
+    equity = np.asarray(equity, dtype=np.float64)
+    n = equity.shape[-1]
+    if n == 0:
+        return np.zeros(equity.shape[:-1], dtype=np.int64) if equity.ndim > 1 else 0
+    peak = np.maximum.accumulate(equity, axis=-1)
+    bars = np.broadcast_to(np.arange(n), equity.shape)
+    last_peak = np.maximum.accumulate(np.where(equity >= peak, bars, 0), axis=-1)
+    return (bars - last_peak).max(axis=-1)
+
+
+def sharpe_ratio(returns, periods=365.0):
+    """Annualized Sharpe ratio with a zero risk-free rate."""
+    returns = np.asarray(returns, dtype=np.float64)
+    if returns.shape[-1] < 2:
+        return np.zeros(returns.shape[:-1]) if returns.ndim > 1 else 0.0
+    std = returns.std(axis=-1, ddof=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(std > 0, returns.mean(axis=-1) / std * np.sqrt(periods), 0.0)
+    return ratio if ratio.ndim else float(ratio)
+
+
+def sortino_ratio(returns, periods=365.0):
+    """Annualized Sortino ratio using downside deviation below zero."""
+    returns = np.asarray(returns, dtype=np.float64)
+    if returns.shape[-1] < 2:
+        return np.zeros(returns.shape[:-1]) if returns.ndim > 1 else 0.0
+    downside = np.sqrt(np.mean(np.minimum(returns, 0.0) ** 2, axis=-1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(downside > 0, returns.mean(axis=-1) / downside * np.sqrt(periods), 0.0)
+    return ratio if ratio.ndim else float(ratio)
+
+
+def annualized_return(equity, periods=365.0):
+    """Compound annual growth rate in percent."""
+    equity = np.asarray(equity, dtype=np.float64)
+    n = equity.shape[-1]
+    if n < 2:
+        return np.zeros(equity.shape[:-1]) if equity.ndim > 1 else 0.0
+    first, last = equity[..., 0], equity[..., -1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = np.where(first > 0, np.maximum(last, 0.0) / first, 1.0)
+        cagr = (np.power(growth, periods / (n - 1)) - 1.0) * 100
+    cagr = np.nan_to_num(cagr, nan=0.0, posinf=0.0)
+    return cagr if cagr.ndim else float(cagr)
+
+
+def calmar_ratio(equity, periods=365.0):
+    """Annualized return divided by the absolute max drawdown."""
+    cagr = annualized_return(equity, periods)
+    mdd = np.abs(max_drawdown(equity))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(mdd > 0, cagr / mdd, 0.0)
+    return ratio if ratio.ndim else float(ratio)
+
+
+def exposure(units):
+    """Share of bars, in percent, spent holding a position."""
+    units = np.asarray(units, dtype=np.float64)
+    if units.shape[-1] == 0:
+        return np.zeros(units.shape[:-1]) if units.ndim > 1 else 0.0
+    return np.mean(units != 0, axis=-1) * 100
+
+
+def trade_statistics(trade_returns):
+    """
+    Summary statistics for closed trades.
+    :param trade_returns: Per-trade returns in percent
+    :return: Dictionary with counts, win rate, averages, profit factor and expectancy
+    """
+    r = np.asarray(trade_returns, dtype=np.float64)
+    wins = r[r > 0]
+    losses = r[r <= 0]
+    gross_profit = wins.sum()
+    gross_loss = -losses.sum()
+    if gross_loss > 0:
+        profit_factor = gross_profit / gross_loss
+    else:
+        profit_factor = float("inf") if gross_profit > 0 else 0.0
+    return {
+        "total_trades": int(r.size),
+        "profitable_trades": int(wins.size),
+        "losing_trades": int(losses.size),
+        "win_rate": wins.size / r.size * 100 if r.size else 0.0,
+        "average_profit": float(wins.mean()) if wins.size else 0.0,
+        "average_loss": float(-losses.mean()) if losses.size else 0.0,
+        "profit_factor": float(profit_factor),
+        "expectancy": float(r.mean()) if r.size else 0.0,
+        "best_trade": float(r.max()) if r.size else 0.0,
+        "worst_trade": float(r.min()) if r.size else 0.0,
+    }
+
+
+def compute_metrics(equity, interval=None, timestamps=None, units=None, trade_returns=None):
+    """
+    Full metric set for a single equity curve.
+    :param equity: 1-D equity array
+    :param interval: Timeframe used for annualization (inferred from timestamps if omitted)
+    :param units: Optional per-bar position sizes for exposure
+    :param trade_returns: Optional closed-trade returns in percent
+    :return: Dictionary of metrics
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    periods = periods_per_year(interval, timestamps)
+    returns = simple_returns(equity)
+    metrics = {
+        "periods_per_year": periods,
+        "return": float((equity[-1] / equity[0] - 1) * 100) if len(equity) and equity[0] else 0.0,
+        "annualized_return": float(annualized_return(equity, periods)),
+        "max_drawdown": float(max_drawdown(equity)),
+        "max_drawdown_duration": int(max_drawdown_duration(equity)),
+        "sharpe_ratio": float(sharpe_ratio(returns, periods)),
+        "sortino_ratio": float(sortino_ratio(returns, periods)),
+        "calmar_ratio": float(calmar_ratio(equity, periods)),
+        "volatility": float(returns.std(ddof=1) * np.sqrt(periods) * 100) if returns.size > 1 else 0.0,
+    }
+    if units is not None:
+        metrics["exposure"] = float(exposure(units))
+    if trade_returns is not None:
+        metrics.update(trade_statistics(trade_returns))
+    return metrics
+
+
+def batch_metrics(equity, interval=None, timestamps=None):
+    """
+    Evaluate many equity curves at once, one per row, for parameter sweeps.
+    :param equity: 2-D array of shape (n_curves, n_bars)
+    :return: Dictionary mapping metric names to arrays of length n_curves
+    """
+    equity = np.atleast_2d(np.asarray(equity, dtype=np.float64))
+    periods = periods_per_year(interval, timestamps)
+    returns = simple_returns(equity)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        total = np.where(equity[:, 0] != 0, (equity[:, -1] / equity[:, 0] - 1) * 100, 0.0)
+    return {
+        "return": total,
+        "annualized_return": annualized_return(equity, periods),
+        "max_drawdown": max_drawdown(equity),
+        "max_drawdown_duration": max_drawdown_duration(equity),
+        "sharpe_ratio": sharpe_ratio(returns, periods),
+        "sortino_ratio": sortino_ratio(returns, periods),
+        "calmar_ratio": calmar_ratio(equity, periods),
+    }
@@ -0,0 +1,281 @@
+# app/mock_servers.py
+import json
+import logging
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+# Pairs listed by the mock exchange
+MOCK_SYMBOLS = ("BTC", "ETH", "SOL", "BNB", "XRP", "ADA", "DOGE", "AVAX", "LINK", "DOT")
+
+# Strategy returned for code requests; plain pandas so it runs without extra indicator libraries
+MOCK_STRATEGY = '''```python
+def trading_strategy(ohlc_data):
+    df = ohlc_data.copy()
+    fast = df["close"].rolling(20).mean()
+    slow = df["close"].rolling(50).mean()
+    df["signal"] = 0
+    df.loc[(fast > slow) & (fast.shift(1) <= slow.shift(1)), "signal"] = 1
+    df.loc[(fast < slow) & (fast.shift(1) >= slow.shift(1)), "signal"] = -1
+    df["signal"] = df["signal"].astype(int)
+    return df
+```'''
+
+_INTERVAL_MS = {"m": 60_000, "h": 3_600_000, "d": 86_400_000, "w": 604_800_000}
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping idle keep-alive connections is normal under load
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class _MockServer:
+    """
+    Threaded HTTP server on localhost with configurable latency and error injection.
+    Subclasses provide `handle(handler, method, path, query, body)`.
+    """
+
+    def __init__(self, latency_ms=0.0, jitter=0.5, error_rate=0.0, seed=None, port=0):
+        """
+        :param latency_ms: Mean delay before a response (or before the first streamed chunk)
+        :param jitter: Delays are drawn uniformly from latency * (1 +/- jitter)
+        :param error_rate: Fraction of requests answered with an injected error
+        """
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _dispatch(self, method):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                server._count("requests")
+                try:
+                    server.handle(self, method, url.path, parse_qs(url.query), body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+        self._httpd = _QuietServer(("127.0.0.1", port), Handler)
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        self._thread = None
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def delay(self, scale=1.0):
+        with self._lock:
+            factor = 1 + self._random.uniform(-self.jitter, self.jitter)
+        time.sleep(max(0.0, self.latency_ms * scale * factor) / 1000)
+
+    def should_fail(self):
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.stats["errors"] += 1
+            return failed
+
+    @staticmethod
+    def send_json(handler, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        logging.info(f"{type(self).__name__} listening on {self.url}")
+        return self
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MockAzureOpenAI(_MockServer):
+    """
+    Chat completions endpoint answering like an Azure OpenAI deployment.
+
+    Interpretation prompts get a JSON parameter object built from the asset and
+    timeframe named in the user text; generation prompts get MOCK_STRATEGY.
+    Streaming requests receive server-sent events: the first chunk after the
+    configured latency, then `chunk_ms` between chunks, then a usage chunk.
+    Injected errors alternate between 429 (with Retry-After) and 500.
+    """
+
+    def __init__(self, latency_ms=500.0, chunk_ms=5.0, chunk_chars=16, **kwargs):
+        super().__init__(latency_ms=latency_ms, **kwargs)
+        self.chunk_ms = chunk_ms
+        self.chunk_chars = chunk_chars
+
+    @staticmethod
+    def _answer(messages):
+        system = messages[0]["content"] if messages else ""
+        user = messages[-1]["content"] if messages else ""
+        if "JSON" not in system:
+            return MOCK_STRATEGY
+        asset = next((token for token in re.findall(r"\b[A-Z]{2,5}\b", user) if token in MOCK_SYMBOLS), "BTC")
+        timeframe = re.search(r"\b(\d+[mhdw])\b", user, re.IGNORECASE)
+        return json.dumps({
+            "Asset": asset,
+            "Entry Condition": ["fast moving average crosses above slow moving average"],
+            "Exit Condition": ["fast moving average crosses below slow moving average"],
+            "Entry Indicators": ["SMA"],
+            "Exit Indicators": ["SMA"],
+            "Actions": ["buy", "sell"],
+            "Timeframe": timeframe.group(1).lower() if timeframe else "1h",
+            "Amount": None,
+        })
+
+    def handle(self, handler, method, path, query, body):
+        if method != "POST" or not path.endswith("/chat/completions"):
+            self.send_json(handler, 404, {"error": {"message": f"Unknown path {path}"}})
+            return
+        self.delay()
+        if self.should_fail():
+            if self.stats["errors"] % 2:
+                self.send_json(handler, 429, {"error": {"code": "429", "message": "Rate limit"}},
+                               headers={"Retry-After": "1"})
+            else:
+                self.send_json(handler, 500, {"error": {"code": "500", "message": "Injected failure"}})
+            return
+        messages = body.get("messages") or []
+        text = self._answer(messages)
+        choices = max(1, int(body.get("n") or 1))
+        usage = {"prompt_tokens": len(json.dumps(messages)) // 4, "completion_tokens": len(text) // 4 * choices}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": "chatcmpl-mock", "created": int(time.time()), "model": body.get("model") or "mock"}
+        if not body.get("stream"):
+            self.send_json(handler, 200, {
+                **base, "object": "chat.completion", "usage": usage,
+                "choices": [{"index": i, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}
+                            for i in range(choices)],
+            })
+            return
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+
+        def _event(data):
+            frame = f"data: {data}\n\n".encode("utf-8")
+            handler.wfile.write(b"%x\r\n%s\r\n" % (len(frame), frame))
+            handler.wfile.flush()
+
+        for start in range(0, len(text), self.chunk_chars):
+            _event(json.dumps({**base, "object": "chat.completion.chunk", "choices": [
+                {"index": 0, "delta": {"content": text[start:start + self.chunk_chars]}, "finish_reason": None}]}))
+            time.sleep(self.chunk_ms / 1000)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            _event(json.dumps({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}))
+        _event("[DONE]")
+        handler.wfile.write(b"0\r\n\r\n")
+
+
+class MockBinance(_MockServer):
+    """
+    Binance spot REST subset: ping, time, exchangeInfo and klines.
+
+    Prices are a deterministic function of symbol and bar time, so every page
+    and every session sees the same history without storing it. Injected
+    errors are 429 responses with Retry-After, as the real API sends under load.
+    """
+
+    def __init__(self, latency_ms=50.0, symbols=MOCK_SYMBOLS, **kwargs):
+        super().__init__(latency_ms=latency_ms, **kwargs)
+        self.symbols = [f"{asset}USDT" for asset in symbols]
+
+    @staticmethod
+    def klines(symbol, interval, start_ms=None, end_ms=None, limit=500):
+        """Build kline rows for a symbol, Binance-formatted (prices as strings)."""
+        step = int(interval[:-1]) * _INTERVAL_MS[interval[-1]]
+        now = int(time.time() * 1000)
+        end_ms = min(end_ms or now, now)
+        if start_ms is None:
+            first = (end_ms // step - limit + 1) * step
+        else:
+            first = -(-int(start_ms) // step) * step
+        opens = np.arange(first, end_ms + 1, step, dtype=np.int64)[:limit]
+        seed = zlib.crc32(symbol.encode()) % 1000
+        t = opens / 3_600_000.0
+        base = 10 + seed * 5
+        close = base * (1 + 0.15 * np.sin(t / 97 + seed) + 0.05 * np.sin(t / 11 + seed / 3)
+                        + 0.01 * np.sin(t * 12.9898 + seed))
+        previous = np.concatenate(([close[0]], close[:-1])) if len(close) else close
+        high = np.maximum(previous, close) * 1.002
+        low = np.minimum(previous, close) * 0.998
+        volume = 100 + 50 * (1 + np.sin(t / 5 + seed))
+        return [[int(o), f"{p:.4f}", f"{h:.4f}", f"{lo:.4f}", f"{c:.4f}", f"{v:.3f}", int(o + step - 1),
+                 f"{v * c:.2f}", 100, f"{v / 2:.3f}", f"{v * c / 2:.2f}", "0"]
+                for o, p, h, lo, c, v in zip(opens, previous, high, low, close, volume)]
+
+    def handle(self, handler, method, path, query, body):
+        self.delay()
+        if path.endswith("/v3/ping"):
+            self.send_json(handler, 200, {})
+            return
+        if path.endswith("/v3/time"):
+            self.send_json(handler, 200, {"serverTime": int(time.time() * 1000)})
+            return
+        if self.should_fail():
+            self.send_json(handler, 429, {"code": -1003, "msg": "Too many requests"}, headers={"Retry-After": "1"})
+            return
+        if path.endswith("/v3/exchangeInfo"):
+            self.send_json(handler, 200, {"symbols": [
+                {"symbol": symbol, "status": "TRADING", "baseAsset": symbol[:-4], "quoteAsset": "USDT"}
+                for symbol in self.symbols]})
+            return
+        if path.endswith("/v3/klines"):
+            symbol = query.get("symbol", [""])[0]
+            if symbol not in self.symbols:
+                self.send_json(handler, 400, {"code": -1121, "msg": "Invalid symbol."})
+                return
+            interval = query.get("interval", ["1h"])[0]
+            if interval[-1:] not in _INTERVAL_MS:
+                self.send_json(handler, 400, {"code": -1120, "msg": "Invalid interval."})
+                return
+            start = query.get("startTime", [None])[0]
+            end = query.get("endTime", [None])[0]
+            limit = min(int(query.get("limit", ["500"])[0]), 1000)
+            self.send_json(handler, 200, self.klines(symbol, interval, start and int(start), end and int(end), limit))
+            return
+        self.send_json(handler, 404, {"code": -1, "msg": f"Unknown path {path}"})
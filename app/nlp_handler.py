@@ -2,6 +2,7 @@ import json
 import os
 import re
 import logging
+import time
 import requests
 from dotenv import load_dotenv
 
@@ -16,27 +17,64 @@ api_key = os.getenv("AZURE_API_KEY")
 deployment_name = os.getenv("AZURE_DEPLOYMENT_NAME", "gpt-4o")
 api_version = os.getenv("AZURE_API_VERSION", "2025-01-01-preview")
 
-def interpret_user_input(user_input):
+# Fixed instructions and output schema. Keeping them in the system message leaves the user
+# message as just the strategy text, and an identical prefix lets the service cache it.
+INTERPRET_SYSTEM_MESSAGE = (
+    "You extract trading strategy parameters. Reply with one JSON object and nothing else, with keys: "
+    '"Asset" (ticker, e.g. "BTC"), "Entry Condition", "Exit Condition", "Entry Indicators", '
+    '"Exit Indicators", "Actions" (lists of short strings), "Timeframe" (e.g. "1h", "4h", "1d"), '
+    '"Amount" (null if not mentioned).'
+)
+
+
+def _stream_completion(api_url, headers, payload, on_token=None, timeout=30):
     """
-    Use Azure OpenAI to interpret user input and extract strategy parameters.
-    :param user_input: Natural language input from the user
-    :return: Dictionary containing extracted strategy parameters
+    POST a streaming chat completion and read its server-sent events.
+    :param on_token: Optional callback receiving the text generated so far after every chunk
+    :return: (completion text, stats dict with ttft_ms, total_ms and token counts when reported)
     """
-    # Build detailed prompt for strategy interpretation
-    prompt = f"""
-    Extract the following details from the user's trading strategy input and return a JSON object ONLY:
-    - Asset (e.g., BTC, ETH)
-    - Entry Condition (e.g., Buy when RSI > 30)
-    - Exit Condition (e.g., Sell when RSI > 70)
-    - Entry Indicators (e.g., RSI, Moving Averages)
-    - Exit Indicators (e.g., Trailing stop loss, stop loss)
-    - Actions (e.g., buy, sell)
-    - Timeframe (e.g., 1d, 1h, 1m)
-    - Amount (if mentioned)
+    start = time.perf_counter()
+    first_token = None
+    usage = {}
+    parts = []
+    with requests.post(api_url, headers=headers, json=payload, timeout=timeout, stream=True) as response:
+        if response.status_code != 200:
+            error_msg = f"Azure OpenAI API error: {response.status_code}, {response.text}"
+            logging.error(error_msg)
+            raise RuntimeError(error_msg)
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            event = json.loads(data)
+            usage = event.get("usage") or usage
+            for choice in event.get("choices") or []:
+                delta = (choice.get("delta") or {}).get("content")
+                if not delta:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter()
+                parts.append(delta)
+                if on_token is not None:
+                    on_token("".join(parts))
+    stats = {
+        "ttft_ms": (first_token - start) * 1000 if first_token is not None else None,
+        "total_ms": (time.perf_counter() - start) * 1000,
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "completion_tokens": usage.get("completion_tokens"),
+    }
+    return "".join(parts), stats
 
-    User Input: {user_input}
 
-    Return only a JSON object.
+def interpret_user_input(user_input, on_token=None, stats=None):
+    """
+    Use Azure OpenAI to interpret user input and extract strategy parameters.
+    :param user_input: Natural language input from the user
+    :param on_token: Optional callback receiving the streamed response so far
+    :param stats: Optional dict filled with time-to-first-token, total time and token usage
+    :return: Dictionary containing extracted strategy parameters
     """
 
     # Check if Azure OpenAI is properly configured
@@ -53,23 +91,22 @@ def interpret_user_input(user_input):
         }
         payload = {
             "messages": [
-                {"role": "system", "content": "You are a trading strategy interpreter."},
-                {"role": "user", "content": prompt}
+                {"role": "system", "content": INTERPRET_SYSTEM_MESSAGE},
+                {"role": "user", "content": user_input}
             ],
-            "max_completion_tokens": 512,
-            "temperature": 1
+            # The schema answer is ~100 tokens; the cap only guards against runaway output
+            "max_completion_tokens": 256,
+            "temperature": 1,
+            "stream": True,
+            "stream_options": {"include_usage": True}
         }
         base_endpoint = endpoint.replace("/models", "")
         api_url = f"{base_endpoint}/openai/deployments/{deployment_name}/chat/completions?api-version={api_version}"
         logging.info(f"Making Azure OpenAI API request to: {api_url}")
-        response = requests.post(api_url, headers=headers, json=payload, timeout=30)
-        if response.status_code != 200:
-            error_msg = f"Azure OpenAI API error: {response.status_code}, {response.text}"
-            logging.error(error_msg)
-            raise RuntimeError(error_msg)
-        response_data = response.json()
-        raw_output = response_data["choices"][0]["message"]["content"]
-        logging.info(f"Raw Azure OpenAI Response: {raw_output}")
+        raw_output, call_stats = _stream_completion(api_url, headers, payload, on_token=on_token)
+        if stats is not None:
+            stats.update(call_stats)
+        logging.info(f"Raw Azure OpenAI Response: {raw_output} ({call_stats})")
 
         # Extract JSON using regex in case of additional text
         match = re.search(r"\{.*\}", raw_output, re.DOTALL)
@@ -0,0 +1,476 @@
+# app/paper_trading.py
+import itertools
+import logging
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from app.backtester import coerce_numeric, execute_strategy
+from app.metrics import compute_metrics
+from app.utils import interval_to_seconds
+
+ORDER_TYPES = ("MARKET", "LIMIT", "STOP", "STOP_LIMIT")
+SIDES = ("BUY", "SELL")
+
+# Order lifecycle, following Binance's status names
+OPEN_STATUSES = ("PENDING", "NEW", "PARTIALLY_FILLED")
+
+
+class Order:
+    """One simulated order and its fills."""
+
+    __slots__ = ("id", "side", "type", "quantity", "price", "stop_price", "submitted_at", "active_at",
+                 "status", "filled", "notional", "fees", "triggered", "oco", "tag", "updated_at")
+
+    def __init__(self, order_id, side, order_type, quantity, price, stop_price, submitted_at, active_at,
+                 oco=None, tag=None):
+        self.id = order_id
+        self.side = side
+        self.type = order_type
+        self.quantity = quantity
+        self.price = price
+        self.stop_price = stop_price
+        self.submitted_at = submitted_at
+        self.active_at = active_at
+        self.status = "PENDING"
+        self.filled = 0.0
+        self.notional = 0.0
+        self.fees = 0.0
+        self.triggered = order_type in ("MARKET", "LIMIT")
+        self.oco = oco
+        self.tag = tag
+        self.updated_at = submitted_at
+
+    @property
+    def remaining(self):
+        return self.quantity - self.filled
+
+    @property
+    def average_price(self):
+        return self.notional / self.filled if self.filled else None
+
+    def to_dict(self):
+        return {
+            "id": self.id, "side": self.side, "type": self.type, "quantity": self.quantity,
+            "price": self.price, "stop_price": self.stop_price, "status": self.status,
+            "filled": self.filled, "average_price": self.average_price, "fees": self.fees,
+            "submitted_at": pd.Timestamp(self.submitted_at, unit="ns"),
+            "updated_at": pd.Timestamp(self.updated_at, unit="ns"), "tag": self.tag,
+        }
+
+
+class MatchingEngine:
+    """
+    In-process matching engine for one spot symbol, driven by candles.
+
+    Orders reach the book `latency_ms` after submission and can fill from the
+    first bar that opens at or after that moment: the engine cannot tell what
+    traded inside a bar after its open, so an order arriving mid-bar waits for
+    the next open and latency is only resolved to the bar. Within a bar the
+    engine sees only open/high/low/close, so:
+
+    - market orders fill at the bar open, plus slippage;
+    - limit orders fill at their price (or the better open on a gap) once the
+      bar trades through it;
+    - stop orders trigger when the bar touches the stop, then fill at the stop
+      (or the worse open on a gap) plus slippage; stop-limits become limits.
+
+    Each bar offers `participation` times its volume to the book, shared by
+    orders in time priority, so large orders fill partially over several bars.
+    Fills are also capped by available cash and, for sells, by the position,
+    since the account is spot and long-only like the backtester.
+    """
+
+    def __init__(self, cash=100.0, commission=0.0, maker_commission=None, slippage=0.0, participation=None,
+                 latency_ms=0):
+        """
+        :param cash: Starting quote balance
+        :param commission: Taker fee as a fraction of notional (market and stop fills)
+        :param maker_commission: Maker fee for limit fills; defaults to `commission`
+        :param slippage: Adverse price offset on taker fills, as a fraction of price
+        :param participation: Fraction of each bar's volume available to our orders; None is unlimited
+        :param latency_ms: Delay between submitting an order and it reaching the book; any delay
+                           past a bar's open defers the order to the next bar
+        """
+        self.cash = float(cash)
+        self.position = 0.0
+        self.commission = commission
+        self.maker_commission = commission if maker_commission is None else maker_commission
+        self.slippage = slippage
+        self.participation = participation
+        self.latency_ns = int(latency_ms * 1_000_000)
+        self.orders = {}
+        self.fills = []
+        self._ids = itertools.count(1)
+        self._pending = deque()
+        self._book = {}
+        self._clock = 0
+
+    def submit(self, side, order_type, quantity, price=None, stop_price=None, timestamp=None, oco=None, tag=None):
+        """
+        Submit an order; it becomes matchable after the configured latency.
+        :param side: 'BUY' or 'SELL'
+        :param order_type: 'MARKET', 'LIMIT', 'STOP' or 'STOP_LIMIT'
+        :param quantity: Base-asset quantity
+        :param price: Limit price (LIMIT, STOP_LIMIT)
+        :param stop_price: Trigger price (STOP, STOP_LIMIT)
+        :param timestamp: Submission time in epoch ns; defaults to the engine clock
+        :param oco: Group key; when an order of the group fills, the others are canceled
+        :return: The Order, with status 'REJECTED' if its parameters are invalid
+        """
+        side = side.upper()
+        order_type = order_type.upper()
+        if side not in SIDES:
+            raise ValueError(f"Unknown order side '{side}'. Expected one of {SIDES}.")
+        if order_type not in ORDER_TYPES:
+            raise ValueError(f"Unknown order type '{order_type}'. Expected one of {ORDER_TYPES}.")
+        timestamp = self._clock if timestamp is None else int(timestamp)
+        order = Order(next(self._ids), side, order_type, float(quantity), price, stop_price,
+                      timestamp, timestamp + self.latency_ns, oco=oco, tag=tag)
+        self.orders[order.id] = order
+        if (quantity <= 0 or (order_type in ("LIMIT", "STOP_LIMIT") and not price)
+                or (order_type in ("STOP", "STOP_LIMIT") and not stop_price)):
+            order.status = "REJECTED"
+            logging.warning(f"Rejected paper order {order.to_dict()}")
+            return order
+        self._pending.append(order)
+        return order
+
+    def cancel(self, order_id, timestamp=None):
+        """Cancel an open order; returns False if it was already closed."""
+        order = self.orders.get(order_id)
+        if order is None or order.status not in OPEN_STATUSES:
+            return False
+        order.status = "CANCELED"
+        order.updated_at = self._clock if timestamp is None else int(timestamp)
+        self._book.pop(order_id, None)
+        return True
+
+    def cancel_all(self, timestamp=None):
+        for order_id in [o.id for o in self._pending if o.status == "PENDING"] + list(self._book):
+            self.cancel(order_id, timestamp)
+
+    def open_orders(self):
+        return [o for o in self.orders.values() if o.status in OPEN_STATUSES]
+
+    def equity(self, price):
+        return self.cash + self.position * price
+
+    def on_bar(self, timestamp, open_, high, low, close, volume, bar_ns):
+        """
+        Match the book against one bar.
+        :param timestamp: Bar open time in epoch ns
+        :param bar_ns: Bar length in ns
+        :return: List of fills made in this bar
+        """
+        bar_end = timestamp + bar_ns
+        # Only orders already on the book at the open can trade at the open
+        while self._pending and self._pending[0].active_at <= timestamp:
+            order = self._pending.popleft()
+            if order.status == "PENDING":
+                order.status = "NEW"
+                self._book[order.id] = order
+        self._clock = bar_end
+
+        liquidity = np.inf if self.participation is None else self.participation * volume
+        fills = []
+        for order in list(self._book.values()):
+            if order.status not in OPEN_STATUSES or liquidity <= 0:
+                continue
+            price, maker = self._match_price(order, open_, high, low)
+            if price is None:
+                continue
+            quantity = min(order.remaining, liquidity)
+            fill = self._fill(order, quantity, price, maker, bar_end)
+            if fill is not None:
+                liquidity -= fill["quantity"]
+                fills.append(fill)
+        return fills
+
+    def _match_price(self, order, open_, high, low):
+        """Return (fill price, is_maker) if the order executes in this bar, else (None, False)."""
+        buy = order.side == "BUY"
+        if not order.triggered:
+            if (high >= order.stop_price) if buy else (low <= order.stop_price):
+                order.triggered = True
+                if order.type == "STOP":
+                    # Gaps through the stop fill at the open
+                    base = max(open_, order.stop_price) if buy else min(open_, order.stop_price)
+                    return self._slipped(base, buy), False
+            else:
+                return None, False
+        if order.type in ("MARKET", "STOP"):
+            return self._slipped(open_, buy), False
+        if buy and low < order.price:
+            return min(open_, order.price), True
+        if not buy and high > order.price:
+            return max(open_, order.price), True
+        return None, False
+
+    def _slipped(self, price, buy):
+        return price * (1 + self.slippage) if buy else price * (1 - self.slippage)
+
+    def _fill(self, order, quantity, price, maker, timestamp):
+        fee_rate = self.maker_commission if maker else self.commission
+        if order.side == "BUY":
+            quantity = min(quantity, self.cash / (price * (1 + fee_rate)))
+        else:
+            quantity = min(quantity, self.position)
+        if quantity <= 1e-12:
+            if order.type in ("MARKET", "STOP") or (order.side == "SELL" and self.position <= 0):
+                # Nothing affordable or nothing to sell: a taker order would never fill
+                order.status = "EXPIRED" if order.filled == 0 else "FILLED"
+                order.updated_at = timestamp
+                self._book.pop(order.id, None)
+            return None
+        notional = quantity * price
+        fee = notional * fee_rate
+        if order.side == "BUY":
+            self.cash -= notional + fee
+            self.position += quantity
+        else:
+            self.cash += notional - fee
+            self.position -= quantity
+        order.filled += quantity
+        order.notional += notional
+        order.fees += fee
+        order.updated_at = timestamp
+        done = order.remaining <= order.quantity * 1e-9
+        if done or (order.type in ("MARKET", "STOP") and order.side == "BUY" and self.cash <= 1e-9):
+            order.status = "FILLED"
+            self._book.pop(order.id, None)
+            if order.oco is not None:
+                for other in list(self._book.values()) + list(self._pending):
+                    if other.oco == order.oco and other.id != order.id:
+                        self.cancel(other.id, timestamp)
+        else:
+            order.status = "PARTIALLY_FILLED"
+        fill = {"order_id": order.id, "timestamp": timestamp, "side": order.side, "quantity": quantity,
+                "price": price, "fee": fee, "maker": maker, "tag": order.tag}
+        self.fills.append(fill)
+        return fill
+
+
+def replay_candles(ohlc_data):
+    """Yield (timestamp ns, open, high, low, close, volume) rows from an OHLCV DataFrame."""
+    ohlc_data = coerce_numeric(ohlc_data)
+    ts = ohlc_data["timestamp"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    columns = [ohlc_data[c].to_numpy(dtype=np.float64) for c in ("open", "high", "low", "close", "volume")]
+    yield from zip(ts.tolist(), *(c.tolist() for c in columns))
+
+
+def live_candles(symbol, interval, poll_seconds=5.0, max_bars=None):
+    """
+    Yield closed Binance candles as they complete, polling public kline data.
+    No orders are sent to the exchange; fills stay in the local engine.
+    """
+    from app.data_handler import BINANCE_AVAILABLE, client, klines_to_frame
+    if not BINANCE_AVAILABLE or client is None:
+        error_msg = "Binance API client is not available. Live paper trading needs market data."
+        logging.error(error_msg)
+        raise RuntimeError(error_msg)
+    last_open = None
+    emitted = 0
+    while max_bars is None or emitted < max_bars:
+        # The newest kline is still forming; the one before it is the latest closed bar
+        frame = klines_to_frame(client.get_klines(symbol=symbol, interval=interval, limit=2))
+        if len(frame) >= 2:
+            bar = next(replay_candles(frame.iloc[:1]))
+            if bar[0] != last_open:
+                last_open = bar[0]
+                emitted += 1
+                yield bar
+        time.sleep(poll_seconds)
+
+
+class PaperTrader:
+    """
+    Run a generated `trading_strategy` bar by bar against a MatchingEngine.
+
+    On every closed bar the strategy's signal for that bar is turned into
+    orders: a buy signal while flat sends an entry sized to the cash, a sell
+    signal while long closes the position. After an entry fills, optional
+    stop-loss and take-profit exits are placed as a one-cancels-other pair.
+
+    In 'batch' mode the strategy runs once over the whole replay and signals
+    are read bar by bar, which is exact for strategies without look-ahead and
+    fast enough for days of 1-minute bars. 'incremental' mode reruns the
+    strategy on the last `lookback` bars at every close, as a live deployment would.
+    """
+
+    def __init__(self, strategy_code, interval, engine=None, order_type="MARKET", limit_offset=0.0,
+                 stop_loss=None, take_profit=None, mode="batch", lookback=500):
+        """
+        :param interval: Candle timeframe, used for bar length and annualization
+        :param engine: MatchingEngine; defaults to one with 100 quote units and no costs
+        :param order_type: 'MARKET' or 'LIMIT' for signal orders
+        :param limit_offset: Limit distance from the close as a fraction (buys below, sells above)
+        :param stop_loss, take_profit: Protective exits as fractions of the entry price
+        :param mode: 'batch' or 'incremental'
+        """
+        if mode not in ("batch", "incremental"):
+            raise ValueError(f"Unknown paper trading mode '{mode}'. Expected 'batch' or 'incremental'.")
+        self.strategy_code = strategy_code
+        self.interval = interval
+        self.bar_ns = interval_to_seconds(interval) * 10**9
+        self.engine = engine or MatchingEngine()
+        self.order_type = order_type.upper()
+        self.limit_offset = limit_offset
+        self.stop_loss = stop_loss
+        self.take_profit = take_profit
+        self.mode = mode
+        self.lookback = lookback
+        self.initial_capital = self.engine.equity(0.0)
+        self._history = deque(maxlen=lookback)
+        self._entry = None
+        self._exit = None
+        self._exit_order = None
+        self._groups = itertools.count(1)
+
+    def _signals(self, bars):
+        frame = pd.DataFrame(list(bars), columns=["timestamp", "open", "high", "low", "close", "volume"])
+        frame["timestamp"] = frame["timestamp"].astype("datetime64[ns]")
+        df = execute_strategy(self.strategy_code, frame, initial_capital=self.initial_capital)
+        return df["signal"].reindex(frame.index).fillna(0).astype(int).to_numpy()
+
+    def _order_price(self, side, close):
+        if self.order_type != "LIMIT":
+            return None
+        return close * (1 - self.limit_offset) if side == "BUY" else close * (1 + self.limit_offset)
+
+    def _on_signal(self, signal, timestamp, close):
+        engine = self.engine
+        entry_open = self._entry is not None and self._entry.status in OPEN_STATUSES
+        if signal == 1 and engine.position <= 0 and not entry_open:
+            # A sell left over from the last position would close the new one
+            self._cancel_exit_order(timestamp)
+            price = self._order_price("BUY", close) or close
+            fee = max(engine.commission, engine.maker_commission)
+            quantity = engine.cash / (price * (1 + engine.slippage) * (1 + fee))
+            self._entry = engine.submit("BUY", self.order_type, quantity, price=self._order_price("BUY", close),
+                                        timestamp=timestamp, tag="entry")
+        elif signal == -1 and (engine.position > 0 or entry_open):
+            if entry_open:
+                engine.cancel(self._entry.id, timestamp)
+            self._cancel_exits(timestamp)
+            # Replace rather than stack sells: only one signal exit is live at a time
+            self._cancel_exit_order(timestamp)
+            if engine.position > 0:
+                self._exit_order = engine.submit("SELL", self.order_type, engine.position,
+                                                 price=self._order_price("SELL", close), timestamp=timestamp,
+                                                 tag="exit")
+
+    def _cancel_exit_order(self, timestamp):
+        if self._exit_order is not None:
+            self.engine.cancel(self._exit_order.id, timestamp)
+            self._exit_order = None
+
+    def _cancel_exits(self, timestamp):
+        if self._exit:
+            for order in self._exit:
+                self.engine.cancel(order.id, timestamp)
+            self._exit = None
+
+    def _protect(self, fills, timestamp):
+        """Place stop-loss / take-profit exits once an entry has filled."""
+        if not (self.stop_loss or self.take_profit):
+            return
+        if not any(f["tag"] == "entry" for f in fills) or self._entry.status in OPEN_STATUSES:
+            return
+        self._cancel_exits(timestamp)
+        entry_price = self._entry.average_price
+        group = next(self._groups)
+        self._exit = []
+        if self.stop_loss:
+            self._exit.append(self.engine.submit("SELL", "STOP", self.engine.position,
+                                                 stop_price=entry_price * (1 - self.stop_loss),
+                                                 timestamp=timestamp, oco=group, tag="stop_loss"))
+        if self.take_profit:
+            self._exit.append(self.engine.submit("SELL", "LIMIT", self.engine.position,
+                                                 price=entry_price * (1 + self.take_profit),
+                                                 timestamp=timestamp, oco=group, tag="take_profit"))
+
+    def run(self, candles, signals=None, max_bars=None):
+        """
+        Drive the engine with candles.
+        :param candles: Iterable of (timestamp ns, open, high, low, close, volume), e.g. replay_candles or live_candles
+        :param signals: Precomputed signal array aligned with `candles` (batch mode computes it if omitted)
+        :param max_bars: Stop after this many bars
+        :return: Report with equity curve, orders, fills, metrics and throughput
+        """
+        start = time.perf_counter()
+        if self.mode == "batch" and signals is None:
+            candles = list(itertools.islice(candles, max_bars))
+            signals = self._signals(candles)
+        engine = self.engine
+        timestamps, equity, units = [], [], []
+        for i, bar in enumerate(candles):
+            if max_bars is not None and i >= max_bars:
+                break
+            timestamp, open_, high, low, close, volume = bar
+            fills = engine.on_bar(timestamp, open_, high, low, close, volume, self.bar_ns)
+            if fills:
+                self._protect(fills, timestamp + self.bar_ns)
+            if self.mode == "incremental":
+                self._history.append(bar)
+                signal = self._signals(self._history)[-1]
+            else:
+                signal = signals[i]
+            if signal:
+                self._on_signal(signal, timestamp + self.bar_ns, close)
+            timestamps.append(timestamp)
+            equity.append(engine.equity(close))
+            units.append(engine.position)
+        return self._report(timestamps, equity, units, time.perf_counter() - start)
+
+    def _report(self, timestamps, equity, units, elapsed):
+        engine = self.engine
+        equity = np.asarray(equity, dtype=np.float64)
+        final_value = float(equity[-1]) if len(equity) else self.initial_capital
+        metrics = compute_metrics(np.concatenate(([self.initial_capital], equity)), interval=self.interval,
+                                  units=np.asarray(units))
+        n_orders = len(engine.orders)
+        statuses = pd.Series([o.status for o in engine.orders.values()], dtype=object).value_counts().to_dict()
+        logging.info(f"Paper trading: {len(equity)} bars, {n_orders} orders, {len(engine.fills)} fills "
+                     f"in {elapsed:.2f}s")
+        return {
+            "initial_capital": self.initial_capital,
+            "final_value": final_value,
+            "return": (final_value / self.initial_capital - 1) * 100,
+            "max_drawdown": metrics["max_drawdown"],
+            "sharpe_ratio": metrics["sharpe_ratio"],
+            "exposure": metrics["exposure"],
+            "bars": len(equity),
+            "orders": n_orders,
+            "fills": len(engine.fills),
+            "order_statuses": statuses,
+            "total_fees": float(sum(f["fee"] for f in engine.fills)),
+            "elapsed_ms": elapsed * 1000,
+            "bars_per_second": len(equity) / elapsed if elapsed else None,
+            "equity_curve": pd.DataFrame({"timestamp": pd.to_datetime(timestamps, unit="ns"), "equity": equity})
+                              .to_dict(orient="records"),
+            "order_log": [o.to_dict() for o in engine.orders.values()],
+            "fill_log": [{**f, "timestamp": pd.Timestamp(f["timestamp"], unit="ns")} for f in engine.fills],
+        }
+
+
+def run_paper_trading(strategy_code, ohlc_data, interval, initial_capital=100, commission=0.0,
+                      maker_commission=None, slippage=0.0, participation=None, latency_ms=0,
+                      order_type="MARKET", limit_offset=0.0, stop_loss=None, take_profit=None,
+                      mode="batch", lookback=500):
+    """
+    Replay an OHLCV frame through the paper trader, fully offline.
+    :return: PaperTrader report, or {"error": ...}
+    """
+    try:
+        engine = MatchingEngine(cash=initial_capital, commission=commission, maker_commission=maker_commission,
+                                slippage=slippage, participation=participation, latency_ms=latency_ms)
+        trader = PaperTrader(strategy_code, interval, engine=engine, order_type=order_type,
+                             limit_offset=limit_offset, stop_loss=stop_loss, take_profit=take_profit,
+                             mode=mode, lookback=lookback)
+        return trader.run(replay_candles(ohlc_data))
+    except Exception as e:
+        logging.error(f"Paper trading failed: {e}")
+        return {"error": str(e)}
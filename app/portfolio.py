@@ -0,0 +1,279 @@
+# app/portfolio.py
+import logging
+
+import numpy as np
+import pandas as pd
+
+from app.backtester import StrategyExecutionError, execute_strategy
+from app.metrics import batch_metrics, compute_metrics
+from app.resample import _WEEK_ORIGIN_NS, is_calendar_interval
+from app.utils import interval_to_seconds, parse_interval
+
+ALLOCATIONS = ("fixed", "active")
+
+
+def _component_frame(component, indicator_cache=None):
+    """Return a (timestamp-indexed close, signal) frame for one portfolio component."""
+    data = component["data"]
+    if "signal" in component:
+        signal = np.asarray(component["signal"])
+        if len(signal) != len(data):
+            raise ValueError(f"Signal of component '{component['name']}' does not match its data length")
+        df = data.assign(signal=signal)
+    else:
+        df = execute_strategy(component["strategy_code"], data, indicator_cache=indicator_cache)
+    index = pd.DatetimeIndex(df["timestamp"]) if "timestamp" in df.columns else pd.DatetimeIndex(df.index)
+    frame = pd.DataFrame({
+        "close": pd.to_numeric(df["close"], errors="coerce").to_numpy(dtype=np.float64),
+        "signal": df["signal"].to_numpy(),
+    }, index=index)
+    return frame[~frame.index.duplicated(keep="last")].sort_index()
+
+
+def build_signal_matrix(components, indicator_cache=None):
+    """
+    Run each component's strategy and align closes and signals on the union of timestamps.
+    :param components: List of dicts with 'name', 'data' (OHLCV DataFrame) and either
+                       'strategy_code' or a precomputed 'signal' array aligned with 'data'
+    :param indicator_cache: IndicatorCache shared by all strategies (see run_backtest)
+    :return: (closes, signals) DataFrames with one column per component; closes are
+             forward-filled, NaN before a component's first bar, and signals are 0 where
+             a component has no bar
+    """
+    names = [c["name"] for c in components]
+    if len(set(names)) != len(names):
+        raise ValueError("Portfolio component names must be unique")
+    frames = {c["name"]: _component_frame(c, indicator_cache) for c in components}
+    closes = pd.concat({name: f["close"] for name, f in frames.items()}, axis=1).sort_index()
+    signals = pd.concat({name: f["signal"] for name, f in frames.items()}, axis=1).reindex(closes.index)
+    return closes.ffill(), signals.fillna(0).astype(np.int8)
+
+
+def positions_from_signals(signals):
+    """
+    Long-only position matrix: 1 opens, -1 closes and 0 keeps the previous state,
+    the same rules simulate_trades applies, computed for all columns at once.
+    :param signals: 2-D array or DataFrame of signals, shape (n_bars, n_components)
+    :return: Float array of 0/1 positions held after each bar's close
+    """
+    state = pd.DataFrame(np.asarray(signals, dtype=np.float64))
+    state = state.where(state != 0).ffill()
+    return (state.to_numpy() > 0).astype(np.float64)
+
+
+def rebalance_points(index, rebalance):
+    """
+    Bar indices at whose close weights are reset to target.
+    :param index: DatetimeIndex of the aligned bars
+    :param rebalance: None (never), an int k (every k bars) or an interval string
+                      such as '1d', '1w' or '1M' (first bar of each period)
+    :return: Sorted int array starting with 0
+    """
+    n = len(index)
+    if rebalance is None or n == 0:
+        return np.zeros(1, dtype=np.int64)
+    if isinstance(rebalance, (int, np.integer)):
+        if rebalance < 1:
+            raise ValueError("Rebalance period must be at least one bar")
+        return np.arange(0, n, int(rebalance))
+    if is_calendar_interval(rebalance):
+        months = index.year.to_numpy() * 12 + index.month.to_numpy() - 1
+        bucket = months // parse_interval(rebalance)[0]
+    else:
+        ts = index.as_unit("ns").asi8
+        origin = _WEEK_ORIGIN_NS if parse_interval(rebalance)[1] == "w" else 0
+        bucket = (ts - origin) // (interval_to_seconds(rebalance) * 10**9)
+    return np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+
+
+def _normalize_weights(weights, names):
+    if weights is None:
+        w = np.full(len(names), 1.0 / len(names))
+    elif isinstance(weights, dict):
+        w = np.array([float(weights.get(name, 0.0)) for name in names])
+    else:
+        w = np.asarray(weights, dtype=np.float64)
+    if w.shape != (len(names),) or np.any(w < 0):
+        raise ValueError("Weights must be non-negative, one per component")
+    total = w.sum()
+    if total <= 0:
+        raise ValueError("At least one component needs a positive weight")
+    # Weights summing to less than one leave the remainder in cash
+    return w / total if total > 1 else w
+
+
+def _fixed_allocation(capital, weights, sleeve_returns, turnover_cost, points):
+    """
+    Sleeves drift with their own returns between rebalances and are reset to the
+    target weights at each point. Growth inside a block is a ratio of cumulative
+    products, so no per-bar loop is needed.
+    :return: (equity, value held per component after each close, rebalance fees)
+    """
+    growth = np.cumprod(1.0 + sleeve_returns, axis=0)
+    cash_weight = 1.0 - weights.sum()
+    n = len(growth)
+
+    # Value of each block start, compounded over the previous blocks, net of rebalance costs
+    starts, ends = points[:-1], points[1:]
+    ratio = np.divide(growth[ends], growth[starts], out=np.zeros((len(ends), growth.shape[1])),
+                      where=growth[starts] > 0)
+    drifted = weights * ratio
+    block_factor = drifted.sum(axis=1) + cash_weight
+    drift_weights = np.divide(drifted, block_factor[:, None], out=np.zeros_like(drifted),
+                              where=block_factor[:, None] > 0)
+    cost = turnover_cost * np.abs(weights - drift_weights).sum(axis=1)
+    block_value = capital * np.cumprod(np.r_[1.0, block_factor * (1.0 - cost)])
+    rebalance_fees = float((block_value[:-1] * block_factor * cost).sum())
+
+    # Each bar belongs to the last rebalance strictly before it
+    block = np.searchsorted(points, np.arange(n), side="left") - 1
+    block[0] = 0
+    start = points[block]
+    sleeves = block_value[block][:, None] * weights * np.divide(
+        growth, growth[start], out=np.zeros_like(growth), where=growth[start] > 0)
+    sleeves[0] = capital * weights
+    equity = sleeves.sum(axis=1) + block_value[block] * cash_weight
+    equity[0] = capital
+
+    # After a rebalance close the sleeves hold the target weights again
+    held = sleeves.copy()
+    held[ends] = block_value[1:, None] * weights
+    equity[ends] = block_value[1:]
+    return equity, held, rebalance_fees
+
+
+def _active_allocation(capital, weights, asset_returns, positions, turnover_cost):
+    """
+    Capital is split every bar among the components that are in a position,
+    proportionally to their weights; idle components hand their share to the others.
+    :return: (equity, value held per component after each close, fees)
+    """
+    wanted = weights * positions
+    total = wanted.sum(axis=1, keepdims=True)
+    alloc = np.divide(wanted, total, out=np.zeros_like(wanted), where=total > 0)
+    # Weights summing to less than one keep that share of capital in cash
+    alloc *= weights.sum()
+    turnover = np.abs(np.diff(alloc, axis=0, prepend=0.0)).sum(axis=1)
+    portfolio_returns = np.r_[0.0, (alloc[:-1] * asset_returns[1:]).sum(axis=1)] - turnover * turnover_cost
+    equity = capital * np.cumprod(1.0 + portfolio_returns)
+    fees = float((np.r_[capital, equity[:-1]] * turnover * turnover_cost).sum())
+    return equity, equity[:, None] * alloc, fees
+
+
+def run_portfolio_backtest(components, initial_capital=100, weights=None, rebalance=None,
+                           allocation="fixed", commission=0.0, slippage=0.0, interval=None,
+                           indicator_cache=None):
+    """
+    Backtest several strategies and/or assets sharing one pool of capital.
+
+    Signals of all components are aligned by timestamp into an (n_bars, n_components)
+    matrix and the combined equity is computed with matrix operations, so adding
+    components does not add per-bar Python loops. Fills happen at bar closes with
+    costs charged on position changes; intrabar stops are not modelled here (use
+    run_backtest for a single component's detailed fills).
+
+    :param components: List of dicts with 'name', 'data' and 'strategy_code' or 'signal'
+    :param initial_capital: Capital shared by all components
+    :param weights: Target weights as a list or {name: weight}; equal weights by default.
+                    Weights summing to less than one keep the rest in cash
+    :param rebalance: None (let sleeves drift), an int number of bars, or an interval string ('1d', '1w', '1M')
+    :param allocation: 'fixed' keeps each component's sleeve invested or in cash per its own signal;
+                       'active' splits all capital among the components currently in a position
+    :param commission: Fee per unit of turnover, as a fraction of traded value
+    :param slippage: Adverse price offset per unit of turnover, as a fraction
+    :param interval: Timeframe used to annualize ratios (inferred from timestamps if omitted)
+    :return: Dictionary of portfolio metrics, per-component breakdown and equity curve, or {"error": ...}
+    """
+    try:
+        if not components:
+            raise ValueError("A portfolio needs at least one component")
+        if allocation not in ALLOCATIONS:
+            raise ValueError(f"Unknown allocation '{allocation}'. Expected one of {ALLOCATIONS}.")
+        initial_capital = float(initial_capital)
+        closes, signals = build_signal_matrix(components, indicator_cache=indicator_cache)
+        names = list(closes.columns)
+        w = _normalize_weights(weights, names)
+        turnover_cost = float(commission) + float(slippage)
+
+        prices = closes.to_numpy(dtype=np.float64)
+        listed = ~np.isnan(prices)
+        positions = positions_from_signals(signals) * listed
+        asset_returns = np.zeros_like(prices)
+        asset_returns[1:] = np.divide(prices[1:], prices[:-1], out=np.ones_like(prices[1:]),
+                                      where=listed[:-1] & (prices[:-1] > 0)) - 1.0
+        asset_returns = np.nan_to_num(asset_returns)
+
+        # Each component on its own: held over the next bar, paying costs when it trades
+        trades = np.abs(np.diff(positions, axis=0, prepend=0.0))
+        sleeve_returns = np.zeros_like(prices)
+        sleeve_returns[1:] = positions[:-1] * asset_returns[1:]
+        sleeve_returns -= trades * turnover_cost
+
+        if allocation == "fixed":
+            points = rebalance_points(closes.index, rebalance)
+            equity, held, rebalance_fees = _fixed_allocation(initial_capital, w, sleeve_returns, turnover_cost, points)
+            trade_fees = float((np.vstack([initial_capital * w, held[:-1]]) * trades * turnover_cost).sum())
+            total_fees = trade_fees + rebalance_fees
+            pnl = (held[:-1] * sleeve_returns[1:]).sum(axis=0)
+            invested = (held * positions).sum(axis=1)
+            rebalance_count = len(points) - 1
+        else:
+            equity, held, total_fees = _active_allocation(initial_capital, w, asset_returns, positions, turnover_cost)
+            pnl = (held[:-1] * asset_returns[1:]).sum(axis=0)
+            invested = held.sum(axis=1)
+            rebalance_count = int(np.count_nonzero(np.abs(np.diff(held > 0, axis=0)).sum(axis=1)))
+
+        timestamps = closes.index.to_numpy()
+        metrics = compute_metrics(equity, interval=interval, timestamps=timestamps, units=invested)
+
+        # Every component traded alone with the full capital, for comparison
+        standalone = initial_capital * np.cumprod(1.0 + sleeve_returns, axis=0)
+        alone = batch_metrics(standalone.T, interval=interval, timestamps=timestamps)
+        component_stats = []
+        for i, name in enumerate(names):
+            component_stats.append({
+                "name": name,
+                "weight": float(w[i]),
+                "pnl": float(pnl[i]),
+                "contribution": float(pnl[i] / initial_capital * 100),
+                "exposure": float(positions[:, i].mean() * 100),
+                "standalone_return": float(alone["return"][i]),
+                "standalone_sharpe": float(alone["sharpe_ratio"][i]),
+                "standalone_max_drawdown": float(alone["max_drawdown"][i]),
+            })
+
+        correlation = pd.DataFrame(sleeve_returns[1:], columns=names).corr()
+        final_value = float(equity[-1])
+        equity_curve = pd.DataFrame({"timestamp": timestamps, "equity": equity})
+        for i, name in enumerate(names):
+            equity_curve[name] = held[:, i]
+
+        logging.info(f"Portfolio of {len(names)} components over {len(equity)} bars: final value {final_value:.2f}")
+        return {
+            "initial_capital": initial_capital,
+            "final_value": final_value,
+            "return": (final_value - initial_capital) / initial_capital * 100,
+            "annualized_return": metrics["annualized_return"],
+            "max_drawdown": metrics["max_drawdown"],
+            "max_drawdown_duration": metrics["max_drawdown_duration"],
+            "sharpe_ratio": metrics["sharpe_ratio"],
+            "sortino_ratio": metrics["sortino_ratio"],
+            "calmar_ratio": metrics["calmar_ratio"],
+            "volatility": metrics["volatility"],
+            "exposure": metrics["exposure"],
+            "periods_per_year": metrics["periods_per_year"],
+            "total_fees": float(total_fees),
+            "allocation": allocation,
+            "rebalance": rebalance,
+            "rebalance_count": rebalance_count,
+            "components": component_stats,
+            "correlation": correlation.round(4).to_dict(),
+            "equity_curve": equity_curve.to_dict(orient="records"),
+        }
+
+    except (StrategyExecutionError, ValueError) as e:
+        logging.error(f"Portfolio backtest failed: {e}")
+        return {"error": str(e)}
+    except Exception as e:
+        logging.error(f"Error during portfolio backtest: {e}")
+        return {"error": str(e)}
@@ -0,0 +1,121 @@
+# app/prefetch.py
+import logging
+import threading
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+
+from app.data_handler import _resolve_interval, fetch_ohlc_data, ohlc_cache, preprocess_symbol
+
+# Concurrent background downloads; each one is a sequence of paged kline requests
+PREFETCH_WORKERS = 4
+
+
+class Prefetcher:
+    """
+    Warm the OHLCV cache in background threads before the data is asked for.
+
+    Requests are keyed by (symbol, interval): a second request for a key that is
+    already downloading joins the running download instead of starting another.
+    Each request holds a reference to its download; cancel() drops one, and the
+    download is abandoned (between kline pages) only when no request still needs it.
+    """
+
+    def __init__(self, max_workers=PREFETCH_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.stats = {"started": 0, "coalesced": 0, "cached": 0, "cancelled": 0}
+
+    @staticmethod
+    def _key(symbol, interval):
+        # Coalescing key and fetch_ohlc_data arguments at once; the normalized interval
+        # normalizes to itself, so '1m', '1min' and '1 minute' share one download
+        return preprocess_symbol(symbol), _resolve_interval(interval)
+
+    def _run(self, key, cancel_event):
+        try:
+            return fetch_ohlc_data(*key, cancel_event=cancel_event)
+        finally:
+            with self._lock:
+                entry = self._inflight.get(key)
+                if entry is not None and entry["event"] is cancel_event:
+                    del self._inflight[key]
+
+    def prefetch(self, symbol, interval):
+        """
+        Start downloading (symbol, interval) unless it is cached or already downloading.
+        :return: Future resolving to the DataFrame from fetch_ohlc_data
+        """
+        key = self._key(symbol, interval)
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is not None:
+                entry["refs"] += 1
+                self.stats["coalesced"] += 1
+                return entry["future"]
+            if ohlc_cache.get(*key) is not None or ohlc_cache.find_base(*key) is not None:
+                self.stats["cached"] += 1
+                done = Future()
+                done.set_result(None)
+                return done
+            event = threading.Event()
+            future = self._executor.submit(self._run, key, event)
+            self._inflight[key] = {"future": future, "event": event, "refs": 1}
+            self.stats["started"] += 1
+        logging.info(f"Prefetching {key[0]} {key[1]}")
+        return future
+
+    def fetch(self, symbol, interval, timeout=None):
+        """
+        Return the data for (symbol, interval), waiting for a download in flight if there is one.
+        Errors from the download are raised here, as fetch_ohlc_data would raise them.
+        """
+        key = self._key(symbol, interval)
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is not None:
+                entry["refs"] += 1
+        if entry is None:
+            return fetch_ohlc_data(*key)
+        try:
+            entry["future"].result(timeout)
+        except CancelledError:
+            pass
+        finally:
+            self._release(key, entry)
+        # The download filled the cache; this returns a private copy (or retries a cancelled download)
+        return fetch_ohlc_data(*key)
+
+    def _release(self, key, entry):
+        with self._lock:
+            entry["refs"] -= 1
+            if entry["refs"] > 0 or self._inflight.get(key) is not entry:
+                return False
+            del self._inflight[key]
+            entry["event"].set()
+            entry["future"].cancel()
+            self.stats["cancelled"] += 1
+        logging.info(f"Cancelled prefetch of {key[0]} {key[1]}")
+        return True
+
+    def cancel(self, symbol, interval):
+        """
+        Drop one request for (symbol, interval); the download stops once nothing else needs it.
+        :return: True if the download was cancelled
+        """
+        key = self._key(symbol, interval)
+        with self._lock:
+            entry = self._inflight.get(key)
+        return entry is not None and self._release(key, entry)
+
+    def pending(self):
+        """Keys currently downloading."""
+        with self._lock:
+            return list(self._inflight)
+
+    def shutdown(self):
+        with self._lock:
+            for entry in self._inflight.values():
+                entry["event"].set()
+                entry["future"].cancel()
+            self._inflight.clear()
+        self._executor.shutdown(wait=False)
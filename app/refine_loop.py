@@ -0,0 +1,239 @@
+# app/refine_loop.py
+import asyncio
+import json
+import logging
+import time
+
+from app.backtester import run_backtest
+from app.code_analyzer import analyze_strategy_code
+from app.refine_strategy import refine_strategy
+from app.results_store import cached_backtest
+from app.strategy_generator import code_fingerprint
+from app.utils import dataset_fingerprint
+
+# Metrics repeated back to the model; the equity curve and trade log stay out of the prompt
+FEEDBACK_METRICS = ("return", "sharpe_ratio", "sortino_ratio", "max_drawdown", "win_rate",
+                    "profit_factor", "total_trades", "exposure")
+
+# Failed revisions quoted in the next prompt, so the model stops repeating them
+MAX_FEEDBACK_ERRORS = 3
+
+
+def summarize_metrics(result):
+    """Round the headline metrics of a backtest result for the generation prompt."""
+    summary = {}
+    for name in FEEDBACK_METRICS:
+        value = result.get(name)
+        if isinstance(value, (int, float)):
+            summary[name] = round(float(value), 3)
+    return summary
+
+
+def _usage_total(usage):
+    return usage["prompt_tokens"] + usage["completion_tokens"]
+
+
+class EvaluationCache:
+    """
+    Memoize backtests by (strategy syntax tree, dataset fingerprint, backtest config).
+    Revisions that only differ in formatting or comments share one evaluation, and
+    failures are cached as well so a repeated broken revision costs nothing. With a
+    ResultsStore, successful runs are also persisted through cached_backtest.
+    """
+
+    def __init__(self, ohlc_data, backtest_kwargs=None, store=None, symbol=None):
+        self.ohlc_data = ohlc_data
+        self.backtest_kwargs = backtest_kwargs or {}
+        self.store = store
+        self.symbol = symbol
+        self._prefix = (dataset_fingerprint(ohlc_data), json.dumps(self.backtest_kwargs, sort_keys=True, default=str))
+        self._results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, code):
+        return (code_fingerprint(code), *self._prefix)
+
+    def lookup(self, code):
+        """Return the cached result for this code, or None."""
+        result = self._results.get(self.key(code))
+        if result is not None:
+            self.hits += 1
+        return result
+
+    def evaluate(self, code):
+        """Backtest the code (blocking) and cache the result."""
+        key = self.key(code)
+        if key in self._results:
+            self.hits += 1
+            return self._results[key]
+        self.misses += 1
+        analysis = analyze_strategy_code(code)
+        if not analysis["valid"]:
+            result = {"error": "Strategy code failed validation: " + "; ".join(analysis["errors"])}
+        elif self.store is not None:
+            result = cached_backtest(self.store, code, self.ohlc_data, symbol=self.symbol, **self.backtest_kwargs)
+        else:
+            result = run_backtest(code, self.ohlc_data, **self.backtest_kwargs)
+        self._results[key] = result
+        return result
+
+
+async def arefine(generator, seed_code=None, ohlc_data=None, metric="sharpe_ratio", max_iterations=5,
+                  candidates=3, patience=2, min_delta=0.05, min_trades=1, token_budget=None, time_budget=None,
+                  max_concurrency=3, executor=None, backtest_kwargs=None, store=None, **variant_kwargs):
+    """
+    Refine a strategy by feeding its backtest back into the generator until it stops improving.
+
+    Each iteration asks for `candidates` revisions of the best strategy so far,
+    with its metrics and refine_strategy suggestions in the prompt. Revisions are
+    backtested as they arrive, concurrently with the remaining requests, and every
+    (code, dataset) evaluation is cached. The loop stops after `patience`
+    iterations without an improvement of at least `min_delta`, or before an
+    iteration that the token or time budget cannot cover.
+
+    :param generator: StrategyGenerator whose parameters describe the strategy
+    :param seed_code: Starting strategy; without it the first iteration generates fresh variants
+    :param ohlc_data: Data to score on; defaults to the generator's OHLCV data
+    :param metric: Result key to maximize
+    :param min_trades: Results with fewer closed trades do not count as improvements
+    :param token_budget: Maximum prompt plus completion tokens for the whole loop
+    :param time_budget: Maximum wall time in seconds; an iteration in flight is cut off at the deadline
+    :param store: Optional ResultsStore that persists successful evaluations
+    :param variant_kwargs: Extra arguments for agenerate_variants (temperature, requests_per_minute, ...)
+    :return: Dictionary with the `best` code, result and score, a per-iteration `history`,
+             `stop_reason`, `usage`, cache statistics and `elapsed_ms`
+    """
+    start = time.perf_counter()
+    deadline = start + time_budget if time_budget else None
+    ohlc_data = generator.ohlcv_data if ohlc_data is None else ohlc_data
+    if ohlc_data is None or ohlc_data.empty:
+        raise ValueError("No OHLCV data to evaluate refinements on.")
+    cache = EvaluationCache(ohlc_data, backtest_kwargs, store=store, symbol=generator.asset)
+    loop = asyncio.get_running_loop()
+    usage_start = dict(generator.usage)
+
+    def _score(result):
+        if "error" in result or (result.get("total_trades") or 0) < min_trades:
+            return None
+        value = result.get(metric)
+        return float(value) if isinstance(value, (int, float)) else None
+
+    async def _evaluate(code):
+        cached = cache.lookup(code)
+        if cached is not None:
+            return cached, True
+        return await loop.run_in_executor(executor, cache.evaluate, code), False
+
+    best = {"code": None, "result": None, "score": None, "iteration": None}
+    if seed_code:
+        result, _ = await _evaluate(seed_code)
+        best = {"code": seed_code, "result": result, "score": _score(result), "iteration": 0}
+
+    history = []
+    stale = 0
+    errors = []
+    stop_reason = "max_iterations"
+    for iteration in range(1, max_iterations + 1):
+        used = _usage_total(generator.usage) - _usage_total(usage_start)
+        if history and token_budget is not None:
+            # The next iteration costs roughly what the last one did
+            if used + history[-1]["tokens"] > token_budget:
+                stop_reason = "token_budget"
+                break
+        if deadline is not None and time.perf_counter() >= deadline:
+            stop_reason = "time_budget"
+            break
+
+        feedback = None
+        if best["code"] is not None:
+            feedback = {
+                "code": best["code"],
+                "metrics": summarize_metrics(best["result"]) if "error" not in best["result"]
+                else {"error": best["result"]["error"]},
+                "suggestions": refine_strategy(best["result"]) if "error" not in best["result"] else None,
+                "errors": errors[-MAX_FEEDBACK_ERRORS:],
+                "objective": metric,
+            }
+        usage_before = dict(generator.usage)
+        iteration_start = time.perf_counter()
+        evaluated = []
+        first_candidate = []
+
+        async def _run_iteration():
+            pending = set()
+            async for code in generator.agenerate_variants(n=candidates, max_concurrency=max_concurrency,
+                                                           feedback=feedback, **variant_kwargs):
+                if not first_candidate:
+                    first_candidate.append(time.perf_counter())
+                task = asyncio.ensure_future(_evaluate(code))
+                task.add_done_callback(lambda t, code=code: evaluated.append((code, *t.result()))
+                                       if not t.cancelled() and t.exception() is None else None)
+                pending.add(task)
+            if pending:
+                await asyncio.gather(*pending)
+
+        timed_out = False
+        try:
+            if deadline is not None:
+                await asyncio.wait_for(_run_iteration(), max(0.0, deadline - time.perf_counter()))
+            else:
+                await _run_iteration()
+        except asyncio.TimeoutError:
+            timed_out = True
+
+        improved = False
+        iteration_best = None
+        for code, result, _ in evaluated:
+            score = _score(result)
+            if "error" in result:
+                errors.append(result["error"][:200])
+            if score is None:
+                continue
+            if iteration_best is None or score > iteration_best:
+                iteration_best = score
+            if best["score"] is None or score >= best["score"] + min_delta:
+                best = {"code": code, "result": result, "score": score, "iteration": iteration}
+                improved = True
+
+        prompt_tokens = generator.usage["prompt_tokens"] - usage_before["prompt_tokens"]
+        completion_tokens = generator.usage["completion_tokens"] - usage_before["completion_tokens"]
+        history.append({
+            "iteration": iteration,
+            "candidates": len(evaluated),
+            "valid": sum(1 for _, result, _ in evaluated if "error" not in result),
+            "cache_hits": sum(1 for *_, hit in evaluated if hit),
+            "iteration_best": iteration_best,
+            "best_score": best["score"],
+            "improved": improved,
+            "latency_ms": (time.perf_counter() - iteration_start) * 1000,
+            "first_candidate_ms": (first_candidate[0] - iteration_start) * 1000 if first_candidate else None,
+            "requests": generator.usage["requests"] - usage_before["requests"],
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "tokens": prompt_tokens + completion_tokens,
+        })
+        logging.info(f"Refine iteration {iteration}: best {metric} {best['score']}, "
+                     f"{history[-1]['tokens']} tokens, {history[-1]['latency_ms']:.0f} ms")
+        if timed_out:
+            stop_reason = "time_budget"
+            break
+        stale = 0 if improved else stale + 1
+        if stale >= patience:
+            stop_reason = "plateau"
+            break
+
+    return {
+        "best": best,
+        "history": history,
+        "stop_reason": stop_reason,
+        "metric": metric,
+        "usage": {name: generator.usage[name] - usage_start[name] for name in usage_start},
+        "cache": {"hits": cache.hits, "misses": cache.misses},
+        "elapsed_ms": (time.perf_counter() - start) * 1000,
+    }
+
+
+def refine(generator, seed_code=None, **kwargs):
+    """Blocking wrapper around arefine for scripts and Streamlit callbacks."""
+    return asyncio.run(arefine(generator, seed_code=seed_code, **kwargs))
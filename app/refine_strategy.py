@@ -1,17 +1,35 @@
 # app/refine_strategy.py
-def refine_strategy(backtest_results):
+def refine_strategy(backtest_results, robustness=None):
     """
     Analyze backtest results and suggest refinements to the strategy.
     :param backtest_results: Dictionary containing backtest results
+    :param robustness: Optional report from app.robustness.analyze_robustness
     :return: Refinement suggestions as a string
     """
     sharpe_ratio = backtest_results.get('sharpe_ratio', 0)
-    returns = backtest_results.get('returns', 0)
+    returns = backtest_results.get('return', 0)
+    max_drawdown = backtest_results.get('max_drawdown', 0)
+    profit_factor = backtest_results.get('profit_factor', 0)
 
     suggestions = []
     if sharpe_ratio < 1:
         suggestions.append("Consider adding a stop-loss to reduce risk.")
     if returns < 0:
         suggestions.append("Try optimizing entry conditions to improve returns.")
+    if max_drawdown < -20:
+        suggestions.append("Drawdowns are deep; tighten exits or reduce exposure.")
+    if backtest_results.get('total_trades', 0) > 0 and profit_factor < 1:
+        suggestions.append("Losing trades outweigh winners; review exit conditions.")
+
+    # Judge the distribution of outcomes, not just the single observed path
+    bars = (robustness or {}).get("bars")
+    if bars:
+        if bars["metrics"]["sharpe_ratio"]["p5"] < 0 <= sharpe_ratio:
+            suggestions.append("The Sharpe ratio is not robust: resampled paths often turn negative.")
+        if bars["risk_of_ruin"] > 5:
+            suggestions.append(f"Risk of ruin is {bars['risk_of_ruin']:.1f}%; reduce position size or add a stop-loss.")
+    trades = (robustness or {}).get("trades")
+    if trades and trades["probability_of_loss"] > 50:
+        suggestions.append("Most resampled trade sequences lose money; the edge may be luck.")
 
     return " ".join(suggestions) if suggestions else "No refinements suggested."
\ No newline at end of file
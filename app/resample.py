@@ -0,0 +1,82 @@
+# app/resample.py
+import numpy as np
+import pandas as pd
+from app.utils import parse_interval, interval_to_seconds
+
+# Binance aligns weekly candles to Monday 00:00 UTC; the Unix epoch was a Thursday
+_WEEK_ORIGIN_NS = 4 * 86400 * 10**9
+
+OHLCV_COLUMNS = ["open", "high", "low", "close", "volume"]
+
+
+def is_calendar_interval(interval):
+    """True for month-based timeframes, which have no fixed length."""
+    return parse_interval(interval)[1] == "M"
+
+
+def divides(base_interval, target_interval):
+    """
+    True if bars of `target_interval` can be built exactly from bars of `base_interval`.
+    """
+    if is_calendar_interval(target_interval):
+        if is_calendar_interval(base_interval):
+            return parse_interval(target_interval)[0] % parse_interval(base_interval)[0] == 0
+        return 86400 % interval_to_seconds(base_interval) == 0
+    if is_calendar_interval(base_interval):
+        return False
+    return interval_to_seconds(target_interval) % interval_to_seconds(base_interval) == 0
+
+
+def resample_ohlcv(df, interval, base_interval=None):
+    """
+    Aggregate OHLCV bars into a coarser timeframe with one vectorized pass.
+    Buckets are aligned to the Unix epoch (weeks to Monday), matching Binance candles.
+    A leading bucket that starts before the data does is dropped as incomplete;
+    the trailing bucket is kept, like Binance's still-forming candle.
+    :param df: DataFrame with a 'timestamp' column and open/high/low/close/volume
+    :param interval: Target timeframe, e.g. '2h', '6H', '1d', '1M'
+    :param base_interval: Timeframe of `df`, used only to sanity-check the request
+    :return: New DataFrame with the same columns at the target timeframe
+    """
+    if base_interval is not None and not divides(base_interval, interval):
+        raise ValueError(f"Cannot build {interval} bars from {base_interval} bars")
+    if df.empty:
+        return df.copy()
+    if is_calendar_interval(interval):
+        return _resample_calendar(df, interval)
+
+    ts = df["timestamp"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    step = interval_to_seconds(interval) * 10**9
+    origin = _WEEK_ORIGIN_NS if parse_interval(interval)[1] == "w" else 0
+    bucket = (ts - origin) // step
+
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(ts)] - 1
+    bucket_start = bucket[starts] * step + origin
+
+    out = pd.DataFrame({"timestamp": pd.to_datetime(bucket_start, unit="ns")})
+    if "open" in df.columns:
+        out["open"] = df["open"].to_numpy()[starts]
+    if "high" in df.columns:
+        out["high"] = np.maximum.reduceat(df["high"].to_numpy(), starts)
+    if "low" in df.columns:
+        out["low"] = np.minimum.reduceat(df["low"].to_numpy(), starts)
+    if "close" in df.columns:
+        out["close"] = df["close"].to_numpy()[ends]
+    if "volume" in df.columns:
+        out["volume"] = np.add.reduceat(df["volume"].to_numpy(), starts)
+
+    if ts[0] > bucket_start[0]:
+        out = out.iloc[1:].reset_index(drop=True)
+    return out
+
+
+def _resample_calendar(df, interval):
+    count, _ = parse_interval(interval)
+    agg = {c: how for c, how in zip(OHLCV_COLUMNS, ["first", "max", "min", "last", "sum"]) if c in df.columns}
+    indexed = df.set_index("timestamp")
+    out = indexed.resample(f"{count}MS").agg(agg).dropna(how="all").reset_index()
+    first = indexed.index[0]
+    if first != first.normalize().replace(day=1):
+        out = out.iloc[1:].reset_index(drop=True)
+    return out
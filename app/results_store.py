@@ -0,0 +1,202 @@
+# app/results_store.py
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from app.backtester import run_backtest
+from app.utils import code_hash, dataset_fingerprint
+
+# Part of every key: bump when the execution simulator, metrics or result format change,
+# so runs computed by older code are recomputed instead of served from the store
+ENGINE_VERSION = 2
+
+# Metrics stored as indexed columns and allowed in leaderboard queries
+METRIC_COLUMNS = {
+    "return": "return_pct",
+    "sharpe_ratio": "sharpe_ratio",
+    "sortino_ratio": "sortino_ratio",
+    "calmar_ratio": "calmar_ratio",
+    "max_drawdown": "max_drawdown",
+    "win_rate": "win_rate",
+    "profit_factor": "profit_factor",
+    "total_trades": "total_trades",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    code_hash TEXT NOT NULL,
+    dataset_fp TEXT NOT NULL,
+    config_hash TEXT NOT NULL,
+    config TEXT NOT NULL,
+    symbol TEXT,
+    interval TEXT,
+    created_at REAL NOT NULL,
+    return_pct REAL,
+    sharpe_ratio REAL,
+    sortino_ratio REAL,
+    calmar_ratio REAL,
+    max_drawdown REAL,
+    win_rate REAL,
+    profit_factor REAL,
+    total_trades INTEGER,
+    strategy_code TEXT,
+    result BLOB NOT NULL,
+    UNIQUE (code_hash, dataset_fp, config_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_runs_symbol_interval ON runs (symbol, interval);
+CREATE INDEX IF NOT EXISTS idx_runs_sharpe ON runs (sharpe_ratio);
+CREATE INDEX IF NOT EXISTS idx_runs_return ON runs (return_pct);
+CREATE INDEX IF NOT EXISTS idx_runs_sortino ON runs (sortino_ratio);
+CREATE INDEX IF NOT EXISTS idx_runs_drawdown ON runs (max_drawdown);
+CREATE INDEX IF NOT EXISTS idx_runs_code ON runs (code_hash);
+"""
+
+
+def _json_default(value):
+    if isinstance(value, (np.integer, np.floating, np.bool_)):
+        return value.item()
+    return str(value)
+
+
+def _config_json(config):
+    clean = {k: v for k, v in (config or {}).items() if isinstance(v, (str, int, float, bool, type(None)))}
+    return json.dumps(clean, sort_keys=True)
+
+
+class ResultsStore:
+    """
+    SQLite store of backtest results keyed by (strategy code hash, dataset fingerprint, config).
+    Headline metrics are plain indexed columns for leaderboard queries; the full
+    result (equity curve, trade log) is kept as compressed JSON.
+    """
+
+    def __init__(self, path="results.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def make_key(self, strategy_code, ohlc_data, config=None):
+        """Return the (code_hash, dataset_fp, config_hash) lookup key; the config hash covers ENGINE_VERSION."""
+        config_text = _config_json(config)
+        return (
+            code_hash(strategy_code),
+            dataset_fingerprint(ohlc_data),
+            code_hash(f"engine={ENGINE_VERSION};{config_text}"),
+        )
+
+    def get(self, strategy_code, ohlc_data, config=None, key=None):
+        """
+        Return the stored result for this strategy, dataset and config, or None.
+        """
+        key = key or self.make_key(strategy_code, ohlc_data, config)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, result FROM runs WHERE code_hash = ? AND dataset_fp = ? AND config_hash = ?", key
+            ).fetchone()
+        if row is None:
+            return None
+        result = json.loads(zlib.decompress(row[1]))
+        result["run_id"] = row[0]
+        return result
+
+    def put(self, strategy_code, ohlc_data, config, result, symbol=None, interval=None, key=None):
+        """
+        Store a successful backtest result, replacing any previous run with the same key.
+        Non-finite metrics (an infinite profit factor when no trade lost) are stored as NULL
+        columns, so they never top a leaderboard; the full result keeps the original value.
+        :return: Row id of the stored run, or None if the result was an error
+        """
+        if "error" in result:
+            return None
+        key = key or self.make_key(strategy_code, ohlc_data, config)
+        payload = zlib.compress(json.dumps(result, default=_json_default).encode("utf-8"))
+        metrics = [result.get(name) for name in METRIC_COLUMNS]
+        metrics = [float(v) if v is not None and np.isfinite(v) else None for v in metrics]
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR REPLACE INTO runs (code_hash, dataset_fp, config_hash, config, symbol, interval, created_at, "
+                "return_pct, sharpe_ratio, sortino_ratio, calmar_ratio, max_drawdown, win_rate, profit_factor, total_trades, "
+                "strategy_code, result) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, _config_json(config), symbol, interval, time.time(), *metrics[:-1],
+                 int(metrics[-1] or 0), strategy_code, payload)
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def leaderboard(self, metric="sharpe_ratio", symbol=None, interval=None, limit=20, min_trades=1, ascending=False):
+        """
+        Best stored runs by a metric, optionally filtered by symbol and interval.
+        :param metric: One of METRIC_COLUMNS
+        :param min_trades: Ignore runs with fewer closed trades
+        :return: DataFrame of run ids, metadata and headline metrics
+        """
+        if metric not in METRIC_COLUMNS:
+            raise ValueError(f"Unknown leaderboard metric '{metric}'. Expected one of {list(METRIC_COLUMNS)}.")
+        column = METRIC_COLUMNS[metric]
+        clauses = ["total_trades >= ?", f"{column} IS NOT NULL"]
+        params = [min_trades]
+        if symbol:
+            clauses.append("symbol = ?")
+            params.append(symbol)
+        if interval:
+            clauses.append("interval = ?")
+            params.append(interval)
+        order = "ASC" if ascending else "DESC"
+        query = (
+            "SELECT id AS run_id, symbol, interval, code_hash, config, created_at, "
+            + ", ".join(f"{col} AS \"{name}\"" for name, col in METRIC_COLUMNS.items())
+            + f" FROM runs WHERE {' AND '.join(clauses)} ORDER BY {column} {order} LIMIT ?"
+        )
+        params.append(int(limit))
+        with self._lock:
+            frame = pd.read_sql_query(query, self._conn, params=params)
+        frame["created_at"] = pd.to_datetime(frame["created_at"], unit="s")
+        return frame
+
+    def get_code(self, run_id):
+        """Return the strategy source stored with a run."""
+        with self._lock:
+            row = self._conn.execute("SELECT strategy_code FROM runs WHERE id = ?", (run_id,)).fetchone()
+        return row[0] if row else None
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def cached_backtest(store, strategy_code, ohlc_data, symbol=None, **backtest_kwargs):
+    """
+    Run a backtest unless an identical strategy/data/config run is already stored.
+    :param store: ResultsStore instance
+    :param symbol: Asset symbol recorded with the run for leaderboard filtering
+    :param backtest_kwargs: Keyword arguments for run_backtest (also form part of the key)
+    :return: Result dictionary; `cached` is True when it came from the store
+    """
+    key = store.make_key(strategy_code, ohlc_data, backtest_kwargs)
+    result = store.get(strategy_code, ohlc_data, key=key)
+    if result is not None:
+        logging.info(f"Loaded backtest result {result['run_id']} from the results store")
+        result["cached"] = True
+        return result
+    result = run_backtest(strategy_code, ohlc_data, **backtest_kwargs)
+    run_id = store.put(strategy_code, ohlc_data, backtest_kwargs, result,
+                       symbol=symbol, interval=backtest_kwargs.get("interval"), key=key)
+    if run_id is not None:
+        result["run_id"] = run_id
+    result["cached"] = False
+    return result
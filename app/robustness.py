@@ -0,0 +1,186 @@
+# app/robustness.py
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.metrics import (annualized_return, calmar_ratio, max_drawdown, sharpe_ratio,
+                         simple_returns, sortino_ratio)
+
+# Paths simulated per task; also fixes how seeds are split, so results do not depend on worker count
+CHUNK_PATHS = 500
+
+# Default percentiles reported for every metric
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def trade_returns_from_result(result):
+    """Closed-trade returns as fractions, net of fees, from a run_backtest result."""
+    returns = [row["profit_pct"] for row in result.get("trade_log", [])
+               if row.get("action") == "SELL" and row.get("profit_pct") is not None]
+    return np.asarray(returns, dtype=np.float64) / 100
+
+
+def bar_returns_from_result(result):
+    """Bar-to-bar strategy returns from a run_backtest equity curve, starting from the initial capital."""
+    equity = [result.get("initial_capital", 100.0)] + [row["equity"] for row in result.get("equity_curve", [])]
+    return simple_returns(np.asarray(equity, dtype=np.float64))
+
+
+def resample_trades(trade_returns, n_paths, rng, method="bootstrap"):
+    """
+    Synthetic trade sequences, one per row.
+    :param method: 'shuffle' permutes the observed trades (same final return, different path);
+                   'bootstrap' draws trades with replacement
+    :return: Array of shape (n_paths, n_trades)
+    """
+    k = len(trade_returns)
+    if method == "shuffle":
+        order = np.argsort(rng.random((n_paths, k)), axis=1)
+    elif method == "bootstrap":
+        order = rng.integers(0, k, size=(n_paths, k))
+    else:
+        raise ValueError(f"Unknown trade resampling method '{method}'")
+    return trade_returns[order]
+
+
+def block_bootstrap(returns, n_paths, block_size, rng):
+    """
+    Circular moving-block bootstrap: paths are stitched from random blocks of
+    consecutive bars, which keeps short-range autocorrelation and volatility clusters.
+    :return: Array of shape (n_paths, len(returns))
+    """
+    n = len(returns)
+    block_size = max(1, min(int(block_size), n))
+    n_blocks = -(-n // block_size)
+    starts = rng.integers(0, n, size=(n_paths, n_blocks, 1))
+    index = (starts + np.arange(block_size)) % n
+    return returns[index.reshape(n_paths, -1)[:, :n]]
+
+
+def default_block_size(n_bars):
+    """Block length growing with the cube root of the sample, a common rule of thumb."""
+    return max(1, int(round(n_bars ** (1 / 3))))
+
+
+def path_metrics(returns, initial_capital, periods, ruin_level):
+    """
+    Metrics for many return paths at once.
+    :param returns: Array of shape (n_paths, n_steps)
+    :param periods: Steps per year for annualized ratios, or None to skip them
+    :param ruin_level: Equity fraction of the initial capital counted as ruin
+    :return: Dictionary of arrays of length n_paths
+    """
+    equity = initial_capital * np.cumprod(1.0 + returns, axis=1)
+    equity = np.concatenate([np.full((len(returns), 1), float(initial_capital)), equity], axis=1)
+    metrics = {
+        "return": (equity[:, -1] / initial_capital - 1) * 100,
+        "max_drawdown": max_drawdown(equity),
+        "ruined": equity.min(axis=1) <= initial_capital * ruin_level,
+    }
+    if periods:
+        metrics.update({
+            "annualized_return": annualized_return(equity, periods),
+            "sharpe_ratio": sharpe_ratio(returns, periods),
+            "sortino_ratio": sortino_ratio(returns, periods),
+            "calmar_ratio": calmar_ratio(equity, periods),
+        })
+    return metrics
+
+
+def _simulate_chunk(task):
+    """Worker entry point: simulate one chunk of paths with its own seed."""
+    kind, data, n_paths, seed, initial_capital, periods, ruin_level, option = task
+    rng = np.random.default_rng(seed)
+    if kind == "trades":
+        paths = resample_trades(data, n_paths, rng, method=option)
+    else:
+        paths = block_bootstrap(data, n_paths, option, rng)
+    return path_metrics(paths, initial_capital, periods, ruin_level)
+
+
+def _run_tasks(tasks, max_workers):
+    """Run chunk tasks in a process pool, or in-process when a pool is not worth it or not possible."""
+    if max_workers == 1 or len(tasks) == 1:
+        return [_simulate_chunk(task) for task in tasks]
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(_simulate_chunk, tasks))
+    except (OSError, RuntimeError) as e:
+        logging.warning(f"Process pool unavailable ({e}); running robustness simulation in-process")
+        return [_simulate_chunk(task) for task in tasks]
+
+
+def _summarize(chunks, percentiles):
+    merged = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+    ruined = merged.pop("ruined")
+    summary = {
+        name: {
+            "mean": float(values.mean()),
+            **{f"p{p}": float(v) for p, v in zip(percentiles, np.percentile(values, percentiles))},
+        }
+        for name, values in merged.items()
+    }
+    return summary, float(ruined.mean() * 100), float((merged["return"] < 0).mean() * 100)
+
+
+def analyze_robustness(result, n_paths=5000, trade_method="bootstrap", block_size=None, ruin_level=0.5,
+                       percentiles=PERCENTILES, seed=None, max_workers=None):
+    """
+    Monte Carlo robustness of one backtest, reusing its trade log and equity curve.
+
+    Two views are simulated: resampled sequences of the closed trades, and
+    block-bootstrapped bar returns of the equity curve. Each is evaluated in
+    NumPy batches of CHUNK_PATHS paths spread across a process pool, with seeds
+    spawned from one SeedSequence so a given seed reproduces the same numbers.
+
+    :param result: Dictionary returned by run_backtest
+    :param n_paths: Synthetic paths per view
+    :param trade_method: 'bootstrap' (with replacement) or 'shuffle' (permutation) of trades
+    :param block_size: Bars per bootstrap block; defaults to the cube root of the number of bars
+    :param ruin_level: A path is ruined if its equity ever falls to this fraction of the initial capital
+    :param percentiles: Percentiles reported for every metric
+    :param seed: Seed for reproducible paths
+    :param max_workers: Process pool size; 1 runs in-process, None uses all CPUs
+    :return: Dictionary with per-view metric distributions, risk of ruin and probability of loss
+    """
+    if "error" in result:
+        return {"error": f"Cannot analyze a failed backtest: {result['error']}"}
+    start = time.perf_counter()
+    initial_capital = float(result.get("initial_capital", 100.0))
+    periods = result.get("periods_per_year") or 365.0
+    trade_returns = trade_returns_from_result(result)
+    bar_returns = bar_returns_from_result(result)
+    block_size = block_size or default_block_size(len(bar_returns))
+    max_workers = max_workers or os.cpu_count() or 1
+
+    n_chunks = -(-n_paths // CHUNK_PATHS)
+    sizes = [min(CHUNK_PATHS, n_paths - i * CHUNK_PATHS) for i in range(n_chunks)]
+    trade_seeds, bar_seeds = np.random.SeedSequence(seed).spawn(2)
+
+    tasks = []
+    if len(trade_returns) >= 2:
+        tasks += [("trades", trade_returns, size, s, initial_capital, None, ruin_level, trade_method)
+                  for size, s in zip(sizes, trade_seeds.spawn(n_chunks))]
+    n_trade_tasks = len(tasks)
+    if len(bar_returns) >= 2:
+        tasks += [("bars", bar_returns, size, s, initial_capital, periods, ruin_level, block_size)
+                  for size, s in zip(sizes, bar_seeds.spawn(n_chunks))]
+    if not tasks:
+        return {"error": "Not enough trades or bars to resample."}
+
+    outputs = _run_tasks(tasks, max_workers)
+    report = {"n_paths": n_paths, "seed": seed, "ruin_level": ruin_level}
+    if n_trade_tasks:
+        metrics, ruin, loss = _summarize(outputs[:n_trade_tasks], percentiles)
+        report["trades"] = {"count": len(trade_returns), "method": trade_method, "metrics": metrics,
+                            "risk_of_ruin": ruin, "probability_of_loss": loss}
+    if len(outputs) > n_trade_tasks:
+        metrics, ruin, loss = _summarize(outputs[n_trade_tasks:], percentiles)
+        report["bars"] = {"count": len(bar_returns), "block_size": block_size, "metrics": metrics,
+                          "risk_of_ruin": ruin, "probability_of_loss": loss}
+    report["elapsed_ms"] = (time.perf_counter() - start) * 1000
+    logging.info(f"Robustness analysis of {n_paths} paths per view took {report['elapsed_ms']:.0f} ms")
+    return report
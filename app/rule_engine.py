@@ -0,0 +1,463 @@
+# app/rule_engine.py
+import logging
+import re
+import time
+
+from app.utils import normalize_interval
+
+# Phrases mapped to the short names the patterns below expect
+_SYNONYMS = [
+    (r"exponential moving averages?", "ema"),
+    (r"simple moving averages?", "sma"),
+    (r"moving averages?", "sma"),
+    (r"relative strength index", "rsi"),
+    (r"bollinger bands?", "bollinger band"),
+    (r"\bbb\b", "bollinger band"),
+    (r"\b(?:cross(?:es|ed|ing)?)\s+(?:over|above)\b", "crosses above"),
+    (r"\b(?:cross(?:es|ed|ing)?)\s+(?:under|below)\b", "crosses below"),
+    (r"\bperiods?\b", "period"),
+]
+
+# Anything mentioning these needs the LLM; the templates would silently drop it
+UNSUPPORTED_TERMS = re.compile(
+    r"\b(volume|stoch\w*|adx|atr|vwap|ichimoku|divergence|support|resistance|fibonacci|pattern|engulfing|doji|"
+    r"hammer|obv|cci|williams|parabolic|sar|supertrend|news|sentiment|breakout|short(?:ing)?|keltner|donchian|pivot)\b"
+)
+
+# Negated conditions can't be expressed by the templates; parsing around them would invert the strategy
+_NEGATION = re.compile(r"\b(?:unless|except|not|never|without|no)\b|n't\b")
+
+# Words that carry no condition of their own. Anything else left once the conditions, stops and
+# timeframe are recognised is text the templates would drop, so the description goes to the LLM.
+_FILLER = frozenset("""
+    a an the and or then also if when whenever once as soon while on at in for of to from with by it its this that
+    i we me my our you your please want would like should can could will let's strategy trading
+    buy buying bought purchase long enter entry go get sell selling sold exit exits exiting close closing out
+    position positions trade trades
+    is are be goes crosses price line
+    timeframe time frame chart charts candle candles candlestick bar bars interval period periods length
+    min mins minute minutes hr hrs hour hours day days week weeks hourly daily weekly
+    usdt usdc busd fdusd crypto coin coins
+""".split())
+
+KNOWN_ASSETS = [
+    "BTC", "ETH", "BNB", "SOL", "XRP", "ADA", "DOGE", "AVAX", "DOT", "MATIC", "LINK", "LTC", "TRX", "SHIB",
+    "ATOM", "UNI", "BCH", "NEAR", "APT", "ARB", "OP", "PEPE", "TON", "SUI", "FIL", "ETC", "XLM",
+]
+_ASSET_NAMES = {"bitcoin": "BTC", "ethereum": "ETH", "solana": "SOL", "ripple": "XRP", "cardano": "ADA", "dogecoin": "DOGE"}
+
+_INDICATOR_LABELS = {"rsi": "RSI", "ma_cross": "Moving Averages", "price_ma": "Moving Averages",
+                     "macd": "MACD", "bbands": "Bollinger Bands"}
+
+_NUM = r"(\d+(?:\.\d+)?)"
+_PCT = _NUM + r"\s*(?:%|percent)"
+_EXIT_START = re.compile(r"\b(sell|exit|close (?:the |my )?(?:position|trade)|get out)\b")
+
+# Moving average mentioned as '20 ema', '20-day ema', 'ema(20)' or 'ema 20'
+_MA = (r"(?:(?P<{p}n1>\d+)[- ]?(?:period|day|bar|hour|candle)?s?\s*(?P<{p}k1>ema|sma|ma)\b"
+       r"|\b(?P<{p}k2>ema|sma|ma)\s*\(?\s*(?P<{p}n2>\d+)\s*\)?)")
+_MA_CROSS = re.compile(_MA.format(p="a") + r"\s+(?:line\s+)?crosses\s+(?P<dir>above|below)\s+(?:the\s+)?" + _MA.format(p="b"))
+_PRICE_MA = re.compile(
+    r"\b(?:price|close|closing price)\s+(?:(?P<cross>crosses)|is|closes|moves|goes|trades|stays|breaks)?\s*"
+    r"(?P<dir>above|below|over|under)\s+(?:the\s+|its\s+)?" + _MA.format(p="m")
+)
+_NAMED_CROSS = re.compile(r"\b(golden|death) cross\b")
+_RSI = re.compile(
+    r"\brsi\s*(?:\(\s*(?P<len>\d+)\s*\)|(?P<len2>\d+)\b)?\s*(?:line\s+)?"
+    r"(?:(?P<cross>crosses)\s+|is\s+|falls\s+|drops\s+|goes\s+|rises\s+|moves\s+|climbs\s+|gets\s+|dips\s+)?"
+    r"(?P<op><=|>=|<|>|below|under|less than|above|over|exceeds|greater than|reaches)\s*(?P<value>\d+(?:\.\d+)?)"
+)
+_RSI_ZONE = re.compile(r"\brsi\s*(?:\(\s*(?P<len>\d+)\s*\))?\s*(?:is\s+|becomes\s+|turns\s+|gets\s+)?(?P<zone>oversold|overbought)")
+_MACD = re.compile(
+    r"\bmacd(?:\s*\(\s*(?P<f>\d+)\s*,\s*(?P<s>\d+)\s*,\s*(?P<g>\d+)\s*\))?(?:\s+line)?\s+"
+    r"(?:(?P<cross>crosses)|is|moves|goes|turns|stays)\s+(?P<dir>above|below)\s+(?:the\s+)?(?P<ref>signal|zero)"
+)
+_MACD_NAMED = re.compile(r"\b(bullish|bearish) macd(?: crossover| cross)?\b|\bmacd (?:histogram )?(?:turns |is |becomes )?(positive|negative)\b")
+_BBANDS = re.compile(
+    r"(?:\b(?:price|close)\s+)?(?:(?P<verb>crosses|touches|hits|falls|drops|closes|is|goes|moves|breaks|rises|trades)\s+)?"
+    r"(?P<dir>above|below|under|over|outside|to|at)?\s*(?:the\s+)?(?P<band>upper|lower|middle)\s+(?:bollinger\s+)?band"
+    r"(?:\s*\(\s*(?P<len>\d+)\s*,\s*(?P<std>\d+(?:\.\d+)?)\s*\))?"
+)
+
+_TRAILING = [
+    re.compile(r"trailing\s+stop(?:[- ]loss)?\s*(?:of|at|=)?\s*" + _PCT),
+    re.compile(_PCT + r"\s*trailing(?:\s+stop(?:[- ]?loss)?)?"),
+    re.compile(r"(?:drops?|falls?|declines?|retraces?)\s*" + _PCT + r"\s*(?:from|off)\s*(?:the\s+|its\s+)?(?:peak|high|highest|top)"),
+]
+_STOP_LOSS = [
+    re.compile(r"stop[- ]?loss\s*(?:of|at|=)?\s*" + _PCT),
+    re.compile(_PCT + r"\s*stop(?:[- ]?loss)?"),
+    re.compile(r"(?:drops?|falls?|declines?|loses?)\s*" + _PCT + r"(?:\s*(?:from|below)\s*(?:the\s+)?entry)?"),
+]
+_TAKE_PROFIT = [
+    re.compile(r"take[- ]?profit\s*(?:of|at|=)?\s*" + _PCT),
+    re.compile(_PCT + r"\s*(?:take[- ]?profit|profit target|profit|gain)"),
+    re.compile(r"(?:rises?|gains?|increases?|is up|goes up|climbs?)\s*" + _PCT),
+]
+
+
+def _normalize_text(text):
+    text = text.lower()
+    for pattern, replacement in _SYNONYMS:
+        text = re.sub(pattern, replacement, text)
+    return re.sub(r"\s+", " ", text)
+
+
+def _ma(match, p):
+    """Return ('ema'|'sma', length) from a _MA group set with prefix `p`."""
+    kind = match.group(f"{p}k1") or match.group(f"{p}k2")
+    length = int(match.group(f"{p}n1") or match.group(f"{p}n2"))
+    return ("sma" if kind == "ma" else kind), length
+
+
+def _find_percent(text, patterns):
+    """Return the first matched percentage as a fraction, and the text with the match blanked out."""
+    for pattern in patterns:
+        match = pattern.search(text)
+        if match:
+            start, end = match.span()
+            return float(match.group(1)) / 100, text[:start] + " " * (end - start) + text[end:]
+    return None, text
+
+
+def _parse_conditions(clause):
+    """
+    Extract every supported condition from one entry or exit clause.
+    :return: (list of condition dictionaries in the order they appear, the clause with matches blanked out)
+    """
+    found = []
+    spans = []
+    for match in list(_MA_CROSS.finditer(clause)):
+        fast, slow = _ma(match, "a"), _ma(match, "b")
+        found.append((match.start(), {"type": "ma_cross", "fast": fast, "slow": slow, "direction": match.group("dir")}))
+    clause = _MA_CROSS.sub(lambda m: " " * len(m.group(0)), clause)
+
+    for match in _NAMED_CROSS.finditer(clause):
+        spans.append(match.span())
+        direction = "above" if match.group(1) == "golden" else "below"
+        found.append((match.start(), {"type": "ma_cross", "fast": ("sma", 50), "slow": ("sma", 200), "direction": direction}))
+
+    for match in _PRICE_MA.finditer(clause):
+        spans.append(match.span())
+        direction = "above" if match.group("dir") in ("above", "over") else "below"
+        found.append((match.start(), {"type": "price_ma", "ma": _ma(match, "m"), "direction": direction,
+                                      "cross": bool(match.group("cross"))}))
+
+    for match in _RSI.finditer(clause):
+        spans.append(match.span())
+        op = ">" if match.group("op") in (">", ">=", "above", "over", "exceeds", "greater than", "reaches") else "<"
+        length = int(match.group("len") or match.group("len2") or 14)
+        found.append((match.start(), {"type": "rsi", "length": length, "op": op, "value": float(match.group("value")),
+                                      "cross": bool(match.group("cross"))}))
+    for match in _RSI_ZONE.finditer(clause):
+        spans.append(match.span())
+        oversold = match.group("zone") == "oversold"
+        found.append((match.start(), {"type": "rsi", "length": int(match.group("len") or 14), "op": "<" if oversold else ">",
+                                      "value": 30.0 if oversold else 70.0, "cross": False}))
+
+    for match in _MACD.finditer(clause):
+        spans.append(match.span())
+        params = tuple(int(match.group(g) or d) for g, d in (("f", 12), ("s", 26), ("g", 9)))
+        found.append((match.start(), {"type": "macd", "params": params, "direction": match.group("dir"),
+                                      "reference": match.group("ref"), "cross": bool(match.group("cross"))}))
+    for match in _MACD_NAMED.finditer(clause):
+        spans.append(match.span())
+        bullish = match.group(1) == "bullish" or match.group(2) == "positive"
+        found.append((match.start(), {"type": "macd", "params": (12, 26, 9), "direction": "above" if bullish else "below",
+                                      "reference": "signal", "cross": match.group(1) is not None}))
+
+    for match in _BBANDS.finditer(clause):
+        spans.append(match.span())
+        band = match.group("band")
+        direction = match.group("dir") or ""
+        if direction in ("above", "over"):
+            op = ">"
+        elif direction in ("below", "under"):
+            op = "<"
+        else:
+            # 'touches the lower band' / 'breaks the upper band' mean reaching the band from inside
+            op = "<" if band == "lower" else ">"
+        found.append((match.start(), {"type": "bbands", "band": band, "op": op,
+                                      "length": int(match.group("len") or 20), "std": float(match.group("std") or 2.0),
+                                      "cross": match.group("verb") == "crosses"}))
+
+    for start, end in spans:
+        clause = clause[:start] + " " * (end - start) + clause[end:]
+    return [condition for _, condition in sorted(found, key=lambda item: item[0])], clause
+
+
+def _unparsed_words(text):
+    """Words in `text` that are neither filler, numbers, timeframes nor asset names."""
+    assets = {asset.lower() for asset in KNOWN_ASSETS} | set(_ASSET_NAMES)
+    words = []
+    for word in re.findall(r"[a-z0-9.']+", text):
+        word = word.strip(".'")
+        if not word or word in _FILLER or word in assets:
+            continue
+        if re.fullmatch(r"\d+(?:\.\d+)?(?:[mhdw]|min|hr)?", word):
+            continue
+        if re.fullmatch(r"[a-z0-9]{2,10}(?:usdt|usdc|busd|fdusd)", word):
+            continue
+        words.append(word)
+    return words
+
+
+def _detect_asset(text):
+    upper = text.upper()
+    pair = re.search(r"\b([A-Z0-9]{2,10})\s*/?\s*(?:USDT|USDC|BUSD|FDUSD)\b", upper)
+    if pair and pair.group(1) not in ("RSI", "EMA", "SMA", "MACD"):
+        return pair.group(1)
+    for asset in KNOWN_ASSETS:
+        if re.search(rf"\b{asset}\b", upper):
+            return asset
+    for name, asset in _ASSET_NAMES.items():
+        if name in text.lower():
+            return asset
+    return "BTC"
+
+
+def _detect_timeframe(text):
+    lower = text.lower()
+    short = re.search(r"\b(\d+)\s?(m|h|d|w)\b(?!\s*(?:ema|sma|ma|rsi)\b)", text, re.IGNORECASE)
+    # Minutes use the canonical 'min' spelling, which no casing can turn into months
+    if short:
+        if short.group(2) == "m":
+            return f"{int(short.group(1))}min"
+        return normalize_interval(short.group(1) + short.group(2))
+    long_form = re.search(
+        r"\b(\d+)[- ]?(minute|min|hour|hr|day|week)s?\s+(?:timeframe|time frame|chart|candles?|bars?|interval)", lower
+    )
+    if long_form:
+        unit = {"minute": "min", "min": "min", "hour": "h", "hr": "h", "day": "d", "week": "w"}[long_form.group(2)]
+        return f"{int(long_form.group(1))}min" if unit == "min" else normalize_interval(long_form.group(1) + unit)
+    for word, interval in (("hourly", "1h"), ("daily", "1d"), ("weekly", "1w")):
+        if re.search(rf"\b{word}\b", lower):
+            return interval
+    return "1h"
+
+
+def _detect_amount(text):
+    match = re.search(r"\b(?:buy|purchase|long)\s+(\d+(?:\.\d+)?)\s+[a-z]{2,10}\b", text.lower())
+    return match.group(1) if match else "1"
+
+
+def describe_condition(condition):
+    """Human-readable form of a parsed condition, as shown in the strategy parameters."""
+    kind = condition["type"]
+    if kind == "rsi":
+        verb = "crosses " + ("above" if condition["op"] == ">" else "below") if condition["cross"] else condition["op"]
+        return f"RSI({condition['length']}) {verb} {condition['value']:g}"
+    if kind == "ma_cross":
+        (fk, fl), (sk, sl) = condition["fast"], condition["slow"]
+        return f"{fk.upper()}({fl}) crosses {condition['direction']} {sk.upper()}({sl})"
+    if kind == "price_ma":
+        kind_, length = condition["ma"]
+        verb = "crosses" if condition["cross"] else "is"
+        return f"Price {verb} {condition['direction']} {kind_.upper()}({length})"
+    if kind == "macd":
+        f, s, g = condition["params"]
+        verb = "crosses" if condition["cross"] else "is"
+        reference = "signal line" if condition["reference"] == "signal" else "zero"
+        return f"MACD({f},{s},{g}) {verb} {condition['direction']} {reference}"
+    if kind == "bbands":
+        side = "above" if condition["op"] == ">" else "below"
+        verb = "crosses" if condition["cross"] else "closes"
+        return f"Price {verb} {side} {condition['band']} Bollinger Band({condition['length']},{condition['std']:g})"
+    return str(condition)
+
+
+def parse_strategy_text(text):
+    """
+    Interpret common strategy descriptions without calling the LLM.
+    Recognises RSI thresholds and zones, EMA/SMA crossovers, price vs. moving average,
+    MACD signal/zero-line crosses, Bollinger Band touches, and percentage stop loss,
+    take profit and trailing stops. Descriptions with negations or with words left over
+    after those are recognised are not guessed at: they go to the LLM instead.
+    :param text: Natural language strategy description
+    :return: Parameter dictionary in the same shape as interpret_user_input, with a
+             'Rules' entry for compile_strategy, or None if the text needs the LLM
+    """
+    start = time.perf_counter()
+    normalized = _normalize_text(text)
+    unsupported = UNSUPPORTED_TERMS.search(normalized)
+    if unsupported:
+        logging.info(f"Rule engine: '{unsupported.group(0)}' is not supported, deferring to the LLM")
+        return None
+    negation = _NEGATION.search(normalized)
+    if negation:
+        logging.info(f"Rule engine: negated condition ('{negation.group(0)}'), deferring to the LLM")
+        return None
+
+    remaining = normalized
+    trailing_stop, remaining = _find_percent(remaining, _TRAILING)
+    stop_loss, remaining = _find_percent(remaining, _STOP_LOSS)
+    take_profit, remaining = _find_percent(remaining, _TAKE_PROFIT)
+
+    exit_start = _EXIT_START.search(remaining)
+    split = exit_start.start() if exit_start else len(remaining)
+    entry_clause, exit_clause = remaining[:split], remaining[split:]
+    entry, entry_rest = _parse_conditions(entry_clause)
+    exit_, exit_rest = _parse_conditions(exit_clause)
+    unparsed = _unparsed_words(entry_rest + " " + exit_rest)
+    if unparsed:
+        logging.info(f"Rule engine: could not interpret {' '.join(unparsed[:5])!r}, deferring to the LLM")
+        return None
+
+    if not entry:
+        logging.info("Rule engine: no recognisable entry condition, deferring to the LLM")
+        return None
+    if not exit_ and stop_loss is None and take_profit is None and trailing_stop is None:
+        logging.info("Rule engine: no recognisable exit condition, deferring to the LLM")
+        return None
+
+    rules = {
+        "entry": entry,
+        "entry_logic": "any" if re.search(r"\bor\b", entry_clause) else "all",
+        "exit": exit_,
+        "exit_logic": "any" if re.search(r"\bor\b", exit_clause) else "all",
+        "stop_loss": stop_loss,
+        "take_profit": take_profit,
+        "trailing_stop": trailing_stop,
+    }
+    exit_descriptions = [describe_condition(c) for c in exit_]
+    exit_indicators = []
+    if stop_loss is not None:
+        exit_descriptions.append(f"Stop loss at {stop_loss * 100:g}%")
+        exit_indicators.append("Stop Loss")
+    if take_profit is not None:
+        exit_descriptions.append(f"Take profit at {take_profit * 100:g}%")
+        exit_indicators.append("Take Profit")
+    if trailing_stop is not None:
+        exit_descriptions.append(f"Trailing stop at {trailing_stop * 100:g}%")
+        exit_indicators.append("Trailing Stop")
+
+    asset = _detect_asset(text)
+    params = {
+        "Asset": f"{asset}/USDT",
+        "Entry Condition": [describe_condition(c) for c in entry],
+        "Exit Condition": exit_descriptions,
+        "Entry Indicators": sorted({_INDICATOR_LABELS[c["type"]] for c in entry}),
+        "Exit Indicators": sorted({_INDICATOR_LABELS[c["type"]] for c in exit_}) + exit_indicators,
+        "Actions": ["Buy", "Sell"],
+        "Timeframe": _detect_timeframe(text),
+        "Amount": _detect_amount(text),
+        "Rules": rules,
+    }
+    logging.info(f"Rule engine parsed strategy in {(time.perf_counter() - start) * 1000:.2f} ms")
+    return params
+
+
+def _indicator_lines(conditions):
+    """Indicator assignments needed by the conditions, each computed once."""
+    lines = {}
+    for c in conditions:
+        if c["type"] == "rsi":
+            lines[f"rsi_{c['length']}"] = f"ta.rsi(close, length={c['length']})"
+        elif c["type"] in ("ma_cross", "price_ma"):
+            for kind, length in ([c["fast"], c["slow"]] if c["type"] == "ma_cross" else [c["ma"]]):
+                lines[f"{kind}_{length}"] = f"ta.{kind}(close, length={length})"
+        elif c["type"] == "macd":
+            f, s, g = c["params"]
+            name = f"macd_{f}_{s}_{g}"
+            lines[name] = f"ta.macd(close, fast={f}, slow={s}, signal={g})"
+            # pandas-ta column order: MACD line, histogram, signal line
+            lines[f"{name}_line"] = f"{name}.iloc[:, 0]"
+            lines[f"{name}_signal"] = f"{name}.iloc[:, 2]"
+        elif c["type"] == "bbands":
+            name = f"bb_{c['length']}_{str(c['std']).replace('.', '_')}"
+            lines[name] = f"ta.bbands(close, length={c['length']}, std={c['std']})"
+            # pandas-ta column order: lower, middle, upper
+            for i, band in enumerate(("lower", "middle", "upper")):
+                lines[f"{name}_{band}"] = f"{name}.iloc[:, {i}]"
+    return lines
+
+
+def _cross(a, b, direction, constant=False):
+    """Expression true on the bar where `a` crosses `b`; `constant` marks `b` as a number."""
+    b_prev = b if constant else f"{b}.shift(1)"
+    if direction == "above":
+        return f"(({a} > {b}) & ({a}.shift(1) <= {b_prev}))"
+    return f"(({a} < {b}) & ({a}.shift(1) >= {b_prev}))"
+
+
+def _condition_expr(c):
+    kind = c["type"]
+    if kind == "rsi":
+        series, value = f"rsi_{c['length']}", f"{c['value']:g}"
+        if c["cross"]:
+            return _cross(series, value, "above" if c["op"] == ">" else "below", constant=True)
+        return f"({series} {c['op']} {value})"
+    if kind == "ma_cross":
+        return _cross("{}_{}".format(*c["fast"]), "{}_{}".format(*c["slow"]), c["direction"])
+    if kind == "price_ma":
+        ma = "{}_{}".format(*c["ma"])
+        if c["cross"]:
+            return _cross("close", ma, c["direction"])
+        return f"(close {'>' if c['direction'] == 'above' else '<'} {ma})"
+    if kind == "macd":
+        name = "macd_{}_{}_{}".format(*c["params"])
+        reference = f"{name}_signal" if c["reference"] == "signal" else "0"
+        if c["cross"]:
+            return _cross(f"{name}_line", reference, c["direction"], constant=c["reference"] == "zero")
+        return f"({name}_line {'>' if c['direction'] == 'above' else '<'} {reference})"
+    if kind == "bbands":
+        band = f"bb_{c['length']}_{str(c['std']).replace('.', '_')}_{c['band']}"
+        if c["cross"]:
+            return _cross("close", band, "above" if c["op"] == ">" else "below")
+        return f"(close {c['op']} {band})"
+    raise ValueError(f"Unknown condition type '{kind}'")
+
+
+_LOGIC_WORDS = {"all": " AND ", "any": " OR "}
+
+
+def _combine(conditions, logic):
+    joiner = " | " if logic == "any" else " & "
+    return joiner.join(_condition_expr(c) for c in conditions)
+
+
+def compile_strategy(rules):
+    """
+    Render parsed rules as a `trading_strategy(ohlc_data)` function using pandas-ta.
+    Stop loss, take profit and trailing stops are left to the backtester's execution
+    settings, which fill them intrabar.
+    :param rules: The 'Rules' dictionary from parse_strategy_text
+    :return: Python source code
+    """
+    indicators = _indicator_lines(rules["entry"] + rules["exit"])
+    lines = [
+        "import pandas as pd",
+        "import numpy as np",
+        "import pandas_ta as ta",
+        "",
+        "",
+        "def trading_strategy(ohlc_data):",
+        "    df = ohlc_data.copy()",
+        "    close = pd.to_numeric(df['close'], errors='coerce')",
+        "",
+        "    # Indicators",
+    ]
+    lines += [f"    {name} = {expr}" for name, expr in indicators.items()]
+    lines += [
+        "",
+        "    # Entry: " + _LOGIC_WORDS[rules["entry_logic"]].join(describe_condition(c) for c in rules["entry"]),
+        f"    entry = {_combine(rules['entry'], rules['entry_logic'])}",
+    ]
+    if rules["exit"]:
+        lines += [
+            "    # Exit: " + _LOGIC_WORDS[rules["exit_logic"]].join(describe_condition(c) for c in rules["exit"]),
+            f"    exit_ = {_combine(rules['exit'], rules['exit_logic'])}",
+        ]
+    else:
+        lines += ["    # Exits come from the stop loss / take profit / trailing stop settings",
+                  "    exit_ = pd.Series(False, index=df.index)"]
+    lines += [
+        "",
+        "    df['signal'] = 0",
+        "    df.loc[exit_ & ~entry, 'signal'] = -1",
+        "    df.loc[entry, 'signal'] = 1",
+        "    df['signal'] = df['signal'].astype(int)",
+        "    return df",
+        "",
+    ]
+    return "\n".join(lines)
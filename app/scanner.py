@@ -0,0 +1,234 @@
+# app/scanner.py
+import contextlib
+import io
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import app.data_handler as data_handler
+from app.backtester import StrategyExecutionError, execute_strategy, strip_code_fences
+from app.code_analyzer import analyze_strategy_code
+from app.data_cache import OHLCVCache
+from app.data_handler import (KLINES_PER_REQUEST, _resolve_interval, download_interval, get_exchange_symbols,
+                              klines_to_frame)
+from app.resample import resample_ohlcv
+from app.utils import interval_to_seconds, normalize_interval
+
+# Concurrent kline downloads; klines cost 2 request weight each, far below the 6000/minute limit
+FETCH_WORKERS = 16
+
+# Symbols evaluated per process-pool task
+EVAL_BATCH = 16
+
+# Bars used for the quote-volume ranking
+VOLUME_BARS = 24
+
+
+def _fetch_since(symbol, interval, start_ms):
+    """Download all klines from start_ms to now, one page of KLINES_PER_REQUEST at a time."""
+    rows = []
+    while True:
+        page = data_handler.client.get_klines(symbol=symbol, interval=interval, startTime=int(start_ms),
+                                              limit=KLINES_PER_REQUEST)
+        rows.extend(page)
+        if len(page) < KLINES_PER_REQUEST:
+            return rows
+        start_ms = int(page[-1][0]) + 1
+
+
+def _evaluate_batch(task):
+    """
+    Worker entry point: run the strategy on each frame and summarize its latest signal.
+    :return: List of row dictionaries, one per symbol
+    """
+    strategy_code, frames, initial_capital = task
+    rows = []
+    for symbol, frame in frames:
+        try:
+            # execute_strategy echoes the code on every call; keep worker output readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                df = execute_strategy(strategy_code, frame, indicator_cache=False, initial_capital=initial_capital)
+        except StrategyExecutionError as e:
+            rows.append({"symbol": symbol, "error": str(e)})
+            continue
+        except Exception as e:
+            rows.append({"symbol": symbol, "error": f"Strategy failed: {e}"})
+            continue
+        signal = df["signal"].reindex(frame.index).fillna(0).to_numpy()
+        close = frame["close"].to_numpy(dtype=np.float64)
+        volume = frame["volume"].to_numpy(dtype=np.float64)
+        fired = np.flatnonzero(signal)
+        row = {
+            "symbol": symbol,
+            "close": close[-1],
+            "quote_volume": float((close[-VOLUME_BARS:] * volume[-VOLUME_BARS:]).sum()),
+            "window_change_pct": (close[-1] / close[0] - 1) * 100,
+            "signal": None,
+            "bars_since_signal": None,
+        }
+        if fired.size:
+            last = fired[-1]
+            row.update({
+                "signal": "BUY" if signal[last] > 0 else "SELL",
+                "bars_since_signal": int(len(signal) - 1 - last),
+                "signal_time": frame["timestamp"].iloc[last],
+                "signal_price": close[last],
+                "change_since_signal_pct": (close[-1] / close[last] - 1) * 100,
+            })
+        rows.append(row)
+    return rows
+
+
+class MarketScanner:
+    """
+    Evaluate one strategy across many symbols on a rolling window of recent bars.
+
+    Windows are kept in an OHLCVCache (separate from the backtest cache so
+    short windows never replace full downloads) and topped up incrementally:
+    after the first scan only bars newer than the cached ones are downloaded.
+    Downloads run on a thread pool; each finished batch of symbols is handed
+    straight to a process pool, so evaluation overlaps the network wait.
+    """
+
+    def __init__(self, interval="1h", window=500, fetch_workers=FETCH_WORKERS, max_workers=None, cache=None):
+        """
+        :param interval: Timeframe the strategy runs on; non-native intervals are rolled up from a Binance base
+        :param window: Closed bars handed to the strategy per symbol
+        :param max_workers: Process pool size; 1 evaluates in-process, None uses all CPUs
+        :param cache: OHLCVCache for the windows; defaults to a private in-memory cache
+        """
+        self.interval = _resolve_interval(interval)
+        # Binance spelling for the kline requests; the normalized one for the cache and comparisons
+        self._binance_interval = download_interval(self.interval)
+        self.base_interval = normalize_interval(self._binance_interval)
+        self.window = window
+        self.fetch_workers = fetch_workers
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.cache = cache or OHLCVCache(max_entries=4096, ttl=None)
+        ratio = max(1, interval_to_seconds(self.interval) // interval_to_seconds(self.base_interval))
+        # One extra target bar absorbs the bar that is still forming
+        self._base_bars = (window + 1) * ratio
+
+    def top_up(self, symbol, now_ms=None):
+        """
+        Bring one symbol's cached window up to date and return its closed bars at the scan interval.
+        """
+        now_ms = now_ms or int(time.time() * 1000)
+        base_ms = interval_to_seconds(self.base_interval) * 1000
+        frame = self.cache.get(symbol, self.base_interval)
+        if frame is None or frame.empty:
+            start_ms = now_ms - self._base_bars * base_ms
+        else:
+            # Refetch the newest cached bar as well, since it may have been forming
+            start_ms = int(frame["timestamp"].iloc[-1].value // 1_000_000)
+        klines = _fetch_since(symbol, self._binance_interval, start_ms)
+        if klines:
+            new = klines_to_frame(klines)
+            if frame is not None and not frame.empty:
+                new = pd.concat([frame[frame["timestamp"] < new["timestamp"].iloc[0]], new], ignore_index=True)
+            frame = new.iloc[-self._base_bars:].reset_index(drop=True)
+            self.cache.put(symbol, self.base_interval, frame)
+        if frame is None or frame.empty:
+            raise ValueError(f"No klines returned for {symbol}")
+
+        bars = frame if self.base_interval == self.interval else resample_ohlcv(frame, self.interval,
+                                                                                 self.base_interval)
+        closed = bars["timestamp"] + pd.Timedelta(seconds=interval_to_seconds(self.interval)) \
+            <= pd.Timestamp(now_ms, unit="ms")
+        return bars[closed].iloc[-self.window:].reset_index(drop=True)
+
+    def scan(self, strategy_code, symbols=None, fresh_within=1, only_firing=True, initial_capital=100):
+        """
+        Run the strategy on every symbol and rank those with a recent signal.
+        :param symbols: Symbols to scan; defaults to every trading USDT pair
+        :param fresh_within: A signal on any of the last N closed bars counts as firing
+        :param only_firing: Drop symbols without a fresh signal from the table
+        :return: DataFrame ranked by signal freshness, then quote volume; timings and
+                 per-symbol errors are in `attrs`
+        """
+        start = time.perf_counter()
+        analysis = analyze_strategy_code(strip_code_fences(strategy_code))
+        if not analysis["valid"]:
+            raise StrategyExecutionError("Strategy code failed validation: " + "; ".join(analysis["errors"]))
+        if not data_handler.BINANCE_AVAILABLE or data_handler.client is None:
+            error_msg = "Binance API client is not available. Cannot scan the market."
+            logging.error(error_msg)
+            raise RuntimeError(error_msg)
+        symbols = symbols or get_exchange_symbols(quote_asset="USDT")
+
+        errors = {}
+        rows = []
+        now_ms = int(time.time() * 1000)
+        in_process = self.max_workers == 1
+        pool = None
+        if not in_process:
+            try:
+                pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            except (OSError, RuntimeError) as e:
+                logging.warning(f"Process pool unavailable ({e}); scanning in-process")
+        evaluations = []
+
+        def _dispatch(batch):
+            task = (strategy_code, batch, initial_capital)
+            if pool is None:
+                rows.extend(_evaluate_batch(task))
+            else:
+                evaluations.append(pool.submit(_evaluate_batch, task))
+
+        try:
+            batch = []
+            with ThreadPoolExecutor(max_workers=self.fetch_workers) as fetchers:
+                futures = {fetchers.submit(self.top_up, symbol, now_ms): symbol for symbol in symbols}
+                for future in as_completed(futures):
+                    symbol = futures[future]
+                    try:
+                        frame = future.result()
+                    except Exception as e:
+                        errors[symbol] = f"Data: {e}"
+                        continue
+                    if len(frame) < 2:
+                        errors[symbol] = f"Only {len(frame)} closed bars"
+                        continue
+                    batch.append((symbol, frame))
+                    if len(batch) >= EVAL_BATCH:
+                        _dispatch(batch)
+                        batch = []
+            fetch_ms = (time.perf_counter() - start) * 1000
+            if batch:
+                _dispatch(batch)
+            for future in evaluations:
+                rows.extend(future.result())
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        for row in rows:
+            if "error" in row:
+                errors[row["symbol"]] = row["error"]
+        table = pd.DataFrame([row for row in rows if "error" not in row])
+        if not table.empty:
+            table["firing"] = table["bars_since_signal"].notna() & (table["bars_since_signal"] < fresh_within)
+            if only_firing:
+                table = table[table["firing"]]
+            table = table.sort_values(["firing", "bars_since_signal", "quote_volume"],
+                                      ascending=[False, True, False], na_position="last").reset_index(drop=True)
+            table.index = table.index + 1
+            table.index.name = "rank"
+        elapsed = time.perf_counter() - start
+        table.attrs.update({"scanned": len(symbols), "errors": errors, "fetch_ms": fetch_ms,
+                            "elapsed_ms": elapsed * 1000, "interval": self.interval})
+        logging.info(f"Scanned {len(symbols)} symbols in {elapsed:.1f}s: {len(table)} rows, {len(errors)} errors")
+        return table
+
+
+def scan_market(strategy_code, interval="1h", symbols=None, window=500, fresh_within=1, only_firing=True,
+                max_workers=None):
+    """
+    One-off market scan; see MarketScanner.scan. Reuse a MarketScanner for incremental top-ups.
+    """
+    scanner = MarketScanner(interval=interval, window=window, max_workers=max_workers)
+    return scanner.scan(strategy_code, symbols=symbols, fresh_within=fresh_within, only_firing=only_firing)
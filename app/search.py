@@ -0,0 +1,317 @@
+# app/search.py
+import contextlib
+import io
+import itertools
+import logging
+import math
+import os
+import string
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from app.backtester import run_backtest
+from app.metrics import compute_metrics
+
+# Metrics a search can rank by; all are "higher is better" (max_drawdown is non-positive)
+SEARCH_METRICS = ("sharpe_ratio", "sortino_ratio", "calmar_ratio", "return", "profit_factor", "expectancy",
+                  "max_drawdown", "win_rate")
+
+# Fewest bars in one slice, so indicators have room to warm up
+MIN_BARS = 400
+
+# Unscored history run before each slice to prime indicators
+WARMUP_BARS = 200
+
+ANCHORS = ("spread", "random", "end")
+
+
+def expand_grid(template, grid):
+    """
+    Fill a strategy template with every combination of parameter values.
+    :param template: Strategy source with string.Template placeholders, e.g. `ta.rsi(close, length=$length)`
+    :param grid: Dictionary mapping placeholder names to lists of values
+    :return: List of candidate dictionaries with 'name', 'params' and 'code'
+    """
+    names = sorted(grid)
+    candidates = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        params = dict(zip(names, values))
+        candidates.append({
+            "name": ", ".join(f"{k}={v}" for k, v in params.items()),
+            "params": params,
+            "code": string.Template(template).substitute(params),
+        })
+    return candidates
+
+
+def sample_candidates(candidates, n, seed=None):
+    """Reproducible random subset of n candidates."""
+    rng = np.random.default_rng(seed)
+    picked = sorted(rng.choice(len(candidates), size=min(n, len(candidates)), replace=False))
+    return [candidates[i] for i in picked]
+
+
+def _normalize(candidates):
+    normalized = []
+    for i, candidate in enumerate(candidates):
+        if isinstance(candidate, str):
+            candidate = {"code": candidate}
+        normalized.append({"name": candidate.get("name") or f"candidate {i + 1}",
+                           "params": candidate.get("params") or {}, "code": candidate["code"]})
+    return normalized
+
+
+def rung_lengths(n_bars, eta=3, min_bars=MIN_BARS, max_rungs=None):
+    """
+    Window lengths of each rung: the full series, divided by eta per step down, never below min_bars.
+    :return: Increasing list of bar counts ending with n_bars
+    """
+    lengths = [n_bars]
+    while lengths[0] / eta >= min_bars and (max_rungs is None or len(lengths) < max_rungs):
+        lengths.insert(0, int(math.ceil(lengths[0] / eta)))
+    return lengths
+
+
+def rung_slices(n_bars, length, slices=4, min_bars=MIN_BARS, anchor="spread", rng=None):
+    """
+    (start, stop) row ranges totalling about `length` bars for one rung.
+    :param anchor: 'spread' (slices evenly spaced over the history, so every regime is sampled),
+                   'random' (slices at seeded random offsets) or 'end' (one window ending at the latest bar)
+    """
+    if anchor not in ANCHORS:
+        raise ValueError(f"Unknown window anchor '{anchor}'. Expected one of {ANCHORS}.")
+    if length >= n_bars:
+        return [(0, n_bars)]
+    if anchor == "end":
+        return [(n_bars - length, n_bars)]
+    count = max(1, min(slices, length // min_bars))
+    size = length // count
+    if anchor == "random":
+        starts = np.sort(rng.integers(0, n_bars - size + 1, size=count))
+    else:
+        starts = np.linspace(0, n_bars - size, count).round().astype(int)
+    return [(int(s), int(s) + size) for s in starts]
+
+
+def _evaluate(task):
+    """
+    Worker entry point: backtest one candidate on one slice and keep only headline metrics.
+    The first `warmup` bars only prime indicators; metrics cover the bars after them.
+    """
+    code, data, warmup, backtest_kwargs = task
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run_backtest(code, data.copy(), **backtest_kwargs)
+    if "error" in result:
+        # A slice without any signal is a flat equity curve, not a broken strategy
+        return {"error": result["error"], "flat": result.get("signal_count") == 0}
+    if not warmup:
+        return {name: result.get(name) for name in SEARCH_METRICS + ("total_trades",)}
+    curve = result["equity_curve"]
+    if "timestamp" in data.columns:
+        # The curve skips rows the backtest or the strategy dropped (NaN closes, dropna after slow
+        # indicators), so the warm-up boundary is found by time rather than by row position
+        scored_from = pd.Timestamp(data["timestamp"].iloc[warmup])
+        stamps = pd.DatetimeIndex([row["timestamp"] for row in curve])
+        first = int(stamps.searchsorted(scored_from))
+    else:
+        scored_from, stamps = None, None
+        first = min(warmup, len(curve))
+    if first >= len(curve):
+        return {"error": "No bars left to score after the warm-up", "flat": True}
+    equity = np.array([result["initial_capital"]] + [row["equity"] for row in curve], dtype=np.float64)[first:]
+    trade_returns = [row["profit_pct"] for row in result["trade_log"]
+                     if row.get("action") == "SELL"
+                     and (scored_from is None or pd.Timestamp(row["timestamp"]) >= scored_from)]
+    metrics = compute_metrics(equity, interval=backtest_kwargs.get("interval"),
+                              timestamps=stamps[first:].to_numpy() if stamps is not None else None,
+                              trade_returns=trade_returns)
+    return {name: metrics.get(name) for name in SEARCH_METRICS + ("total_trades",)}
+
+
+def _run_tasks(tasks, max_workers):
+    """Backtest in a process pool, or in-process when a pool is not worth it or not possible."""
+    if max_workers == 1 or len(tasks) <= 1:
+        return [_evaluate(task) for task in tasks]
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(_evaluate, tasks))
+    except (OSError, RuntimeError) as e:
+        logging.warning(f"Process pool unavailable ({e}); running search backtests in-process")
+        return [_evaluate(task) for task in tasks]
+
+
+def _score(slice_metrics, metric, min_trades):
+    """Mean of the metric over a candidate's slices; broken code or too few trades score -inf."""
+    values = []
+    for metrics in slice_metrics:
+        if "error" in metrics:
+            if not metrics.get("flat"):
+                return -np.inf
+            values.append(0.0)
+            continue
+        value = metrics.get(metric)
+        values.append(float(value) if value is not None and np.isfinite(value) else -np.inf)
+    if sum(m.get("total_trades") or 0 for m in slice_metrics) < min_trades:
+        return -np.inf
+    return float(np.mean(values))
+
+
+def successive_halving(candidates, ohlc_data, metric="sharpe_ratio", eta=3, min_bars=MIN_BARS, max_rungs=3,
+                       slices=4, anchor="spread", warmup_bars=WARMUP_BARS, top_k=1, min_trades=1, budget_bars=None, seed=None,
+                       max_workers=1, backtest_kwargs=None):
+    """
+    Rank candidate strategies with successive halving over growing data windows.
+
+    Every candidate is first backtested on a small share of the bars, split
+    into a few slices spread over the history and scored by the mean of
+    `metric` across them. Only the best 1/eta are promoted to a rung with eta
+    times more bars, until the survivors run on the full data. Cost is
+    counted in bars simulated, so the report can be compared with an
+    exhaustive search of n_candidates * n_bars.
+
+    :param candidates: Strategy sources, or dictionaries with 'code' (and optional 'name', 'params')
+    :param ohlc_data: Full OHLCV DataFrame
+    :param metric: One of SEARCH_METRICS
+    :param eta: Reduction factor between rungs
+    :param min_bars: Shortest slice, so indicators can warm up
+    :param max_rungs: Most rungs, so the first one still sees 1/eta**(max_rungs - 1) of the data;
+                      very short first windows mostly measure noise. None allows as many as min_bars permits
+    :param slices: Most slices per rung; see rung_slices
+    :param anchor: Where slices are taken from; see rung_slices
+    :param warmup_bars: Unscored history run before each slice so slow indicators are primed
+    :param top_k: Never keep fewer than this many candidates before the final rung
+    :param min_trades: Candidates with fewer closed trades on a window score -inf there
+    :param budget_bars: Stop promoting once this many bars have been simulated
+    :param seed: Seed for random slices and tie breaking; the same seed gives the same search
+    :param max_workers: Process pool size for backtests; 1 runs in-process, None uses all CPUs
+    :param backtest_kwargs: Keyword arguments for run_backtest (commission, stops, interval, ...)
+    :return: Dictionary with a ranking DataFrame, per-rung history and budget accounting
+    """
+    if metric not in SEARCH_METRICS:
+        raise ValueError(f"Unknown search metric '{metric}'. Expected one of {SEARCH_METRICS}.")
+    start = time.perf_counter()
+    candidates = _normalize(candidates)
+    backtest_kwargs = backtest_kwargs or {}
+    max_workers = max_workers or os.cpu_count() or 1
+    rng = np.random.default_rng(seed)
+    lengths = rung_lengths(len(ohlc_data), eta, min_bars, max_rungs)
+    # A fixed random order breaks score ties the same way on every run
+    tie_break = rng.permutation(len(candidates))
+
+    alive = list(range(len(candidates)))
+    reached = {i: {"rung": -1, "bars": 0, "score": -np.inf, "metrics": {}} for i in alive}
+    rungs = []
+    bars_used = 0
+    stopped_early = False
+    for rung, length in enumerate(lengths):
+        ranges = rung_slices(len(ohlc_data), length, slices, min_bars, anchor, rng)
+        # Each slice is preceded by up to warmup_bars of history that prime indicators but are not scored
+        datasets = [(ohlc_data.iloc[max(0, a - warmup_bars):b].reset_index(drop=True), a - max(0, a - warmup_bars))
+                    for a, b in ranges]
+        rung_bars = sum(len(data) for data, _ in datasets) * len(alive)
+        if budget_bars is not None and rung > 0 and bars_used + rung_bars > budget_bars:
+            # The first rung always runs; later ones only if they fit the budget
+            stopped_early = True
+            break
+        outputs = _run_tasks([(candidates[i]["code"], data, warm, backtest_kwargs)
+                              for i in alive for data, warm in datasets], max_workers)
+        bars_used += rung_bars
+        for k, i in enumerate(alive):
+            slice_metrics = outputs[k * len(datasets):(k + 1) * len(datasets)]
+            reached[i] = {"rung": rung, "bars": length, "score": _score(slice_metrics, metric, min_trades),
+                          "metrics": {"total_trades": sum(m.get("total_trades") or 0 for m in slice_metrics),
+                                      "error": next((m["error"] for m in slice_metrics
+                                                     if "error" in m and not m.get("flat")), None)}}
+        ordered = sorted(alive, key=lambda i: (-reached[i]["score"], tie_break[i]))
+        keep = len(ordered) if rung == len(lengths) - 1 else max(top_k, int(math.ceil(len(ordered) / eta)))
+        rungs.append({"rung": rung, "bars": length, "slices": ranges, "evaluated": len(alive), "promoted": min(keep, len(ordered)),
+                      "best": candidates[ordered[0]]["name"], "best_score": reached[ordered[0]]["score"]})
+        logging.info(f"Successive halving rung {rung}: {len(alive)} candidates on {length} bars, "
+                     f"best {candidates[ordered[0]]['name']} ({metric} {reached[ordered[0]]['score']:.3f})")
+        alive = ordered[:keep]
+
+    ranking = _ranking(candidates, reached, metric, tie_break)
+    exhaustive = len(candidates) * len(ohlc_data)
+    return {
+        "metric": metric,
+        "seed": seed,
+        "ranking": ranking,
+        "best": ranking.iloc[0].to_dict() if len(ranking) else None,
+        "rungs": rungs,
+        "budget": {
+            "bars_simulated": bars_used,
+            "backtests": sum(r["evaluated"] * len(r["slices"]) for r in rungs),
+            "exhaustive_bars": exhaustive,
+            "fraction_of_exhaustive": bars_used / exhaustive if exhaustive else 0.0,
+            "budget_bars": budget_bars,
+            "stopped_early": stopped_early,
+        },
+        "elapsed_ms": (time.perf_counter() - start) * 1000,
+    }
+
+
+def _ranking(candidates, reached, metric, tie_break):
+    """Candidates ordered by the furthest rung reached, then by score there."""
+    rows = []
+    for i, candidate in enumerate(candidates):
+        state = reached[i]
+        rows.append({
+            "name": candidate["name"], **{f"param_{k}": v for k, v in candidate["params"].items()},
+            "rung": state["rung"], "bars": state["bars"], metric: state["score"],
+            "total_trades": state["metrics"].get("total_trades"), "error": state["metrics"].get("error"),
+            "_tie": tie_break[i], "_index": i,
+        })
+    frame = pd.DataFrame(rows).sort_values(["rung", metric, "_tie"], ascending=[False, False, True])
+    frame = frame.drop(columns="_tie").set_index("_index")
+    frame.index.name = "candidate"
+    return frame
+
+
+def exhaustive_search(candidates, ohlc_data, metric="sharpe_ratio", min_trades=1, max_workers=1,
+                      backtest_kwargs=None):
+    """Backtest every candidate on the full data; the reference successive halving is measured against."""
+    return successive_halving(candidates, ohlc_data, metric=metric, max_rungs=1, min_trades=min_trades, max_workers=max_workers,
+                              backtest_kwargs=backtest_kwargs)
+
+
+def hyperband(candidates, ohlc_data, metric="sharpe_ratio", eta=3, min_bars=MIN_BARS, top_k=1, min_trades=1,
+              seed=None, max_workers=1, backtest_kwargs=None):
+    """
+    Hyperband: several successive-halving brackets from aggressive (many candidates,
+    short first window) to conservative (few candidates, full data), hedging
+    against strategies that only look good once they have enough history.
+    Each bracket draws its own seeded sample of candidates.
+    :return: Dictionary with the merged full-data ranking, per-bracket reports and total budget
+    """
+    candidates = _normalize(candidates)
+    n_bars = len(ohlc_data)
+    s_max = len(rung_lengths(n_bars, eta, min_bars)) - 1
+    seeds = np.random.SeedSequence(seed).spawn(s_max + 1)
+    brackets = []
+    finals = {}
+    for s in range(s_max, -1, -1):
+        n = min(len(candidates), int(math.ceil((s_max + 1) / (s + 1) * eta ** s)))
+        sample_seed = int(seeds[s].generate_state(1)[0])
+        sample = sample_candidates(candidates, n, seed=sample_seed)
+        report = successive_halving(sample, ohlc_data, metric=metric, eta=eta, min_bars=min_bars,
+                                    max_rungs=s + 1, top_k=top_k, min_trades=min_trades, seed=sample_seed,
+                                    max_workers=max_workers, backtest_kwargs=backtest_kwargs)
+        brackets.append(report)
+        finished = report["ranking"][report["ranking"]["bars"] == n_bars]
+        for _, row in finished.iterrows():
+            finals[row["name"]] = row
+    ranking = pd.DataFrame(list(finals.values())).sort_values(metric, ascending=False).reset_index(drop=True)
+    bars = sum(b["budget"]["bars_simulated"] for b in brackets)
+    return {
+        "metric": metric,
+        "seed": seed,
+        "ranking": ranking,
+        "best": ranking.iloc[0].to_dict() if len(ranking) else None,
+        "brackets": brackets,
+        "budget": {"bars_simulated": bars, "backtests": sum(b["budget"]["backtests"] for b in brackets),
+                   "exhaustive_bars": len(candidates) * n_bars,
+                   "fraction_of_exhaustive": bars / (len(candidates) * n_bars) if candidates else 0.0},
+    }
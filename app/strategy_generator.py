@@ -1,11 +1,18 @@
 import os
+import ast
+import asyncio
+import functools
+import hashlib
 import logging
+import time
 import pandas as pd
 import pandas_ta as ta
 import requests
 import json
 from app.data_handler import fetch_ohlc_data  # Ensure proper import
-from openai import AzureOpenAI
+from app.backtester import run_backtest
+from app.code_analyzer import analyze_strategy_code
+from openai import AzureOpenAI, AsyncAzureOpenAI, RateLimitError, APITimeoutError, APIConnectionError
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -16,36 +23,110 @@ api_key = os.getenv("AZURE_API_KEY")
 deployment_name = os.getenv("AZURE_DEPLOYMENT_NAME", "gpt-4o")
 api_version = os.getenv("AZURE_API_VERSION", "2025-01-01-preview")
 
+SYSTEM_MESSAGE = (
+    "You are an expert quant trader. Generate a fully executable Python function named `trading_strategy(ohlc_data)` "
+    "that returns a DataFrame with original columns and integer `signal` column (1 buy, -1 sell, 0 no action). "
+    "Use pandas-ta for indicators, convert numeric types, and vectorize operations. "
+    "Output only code, no explanations."
+)
+
+# Columns the generated function receives, stated once instead of dumping a frame into every prompt
+OHLCV_SCHEMA = "timestamp (datetime64), open, high, low, close, volume (float)"
+
+# Rows of real data shown to the model
+SAMPLE_ROWS = 3
+
+
+def compact_sample(ohlcv_data, rows=SAMPLE_ROWS):
+    """
+    Render the first rows of an OHLCV frame as fixed-schema CSV with six significant digits.
+    About a third of the size of `head().to_dict()`, which repeats every column name and Timestamp repr.
+    """
+    if not isinstance(ohlcv_data, pd.DataFrame) or ohlcv_data.empty:
+        return ""
+    lines = []
+    for row in ohlcv_data.head(rows).itertuples(index=False):
+        row = row._asdict()
+        stamp = pd.Timestamp(row["timestamp"]).strftime("%Y-%m-%dT%H:%M") if "timestamp" in row else ""
+        values = [f"{row[name]:.6g}" for name in ("open", "high", "low", "close", "volume") if name in row]
+        lines.append(",".join([stamp, *values]))
+    return "\n".join(lines)
+
+
+def _format_conditions(conditions):
+    """Join a list of conditions with semicolons; strings pass through unchanged."""
+    if isinstance(conditions, (list, tuple)):
+        return "; ".join(str(condition) for condition in conditions)
+    return str(conditions)
+
 class StrategyGenerator:
-    def __init__(self, strategy_data):
+    def __init__(self, strategy_data, ohlcv_data=None):
         self.strategy_data = strategy_data
         self.asset = strategy_data.get("Asset", "BTC")
         self.timeframe = strategy_data.get("Timeframe", "1H")
         self.amount = strategy_data.get("Amount", "1")
         self.entry_conditions = strategy_data.get("Entry Condition", [])
         self.exit_conditions = strategy_data.get("Exit Condition", [])
+        self.usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        # Timing and token counts of the latest generate_strategy call
+        self.last_call = {}
         
-        # Fetch OHLCV data dynamically if needed
-        try:
-            self.ohlcv_data = fetch_ohlc_data(self.asset, self.timeframe)
-        except Exception as e:
-            logging.error(f"Error fetching OHLCV data: {e}")
-            self.ohlcv_data = pd.DataFrame()
+        # Reuse data the caller already holds; fetch it only when none was passed
+        if ohlcv_data is not None:
+            self.ohlcv_data = ohlcv_data
+        else:
+            try:
+                self.ohlcv_data = fetch_ohlc_data(self.asset, self.timeframe)
+            except Exception as e:
+                logging.error(f"Error fetching OHLCV data: {e}")
+                self.ohlcv_data = pd.DataFrame()
 
-    def generate_strategy(self):
-        """Generates trading strategy code using Azure OpenAI."""
-        
-        # Convert fetched OHLCV data to a sample format for GPT understanding
-        sample_ohlcv = self.ohlcv_data.head(3).to_dict() if isinstance(self.ohlcv_data, pd.DataFrame) and not self.ohlcv_data.empty else {}
-
-        # Concise system and user prompts to avoid token limits
-        system_message = (
-            "You are an expert quant trader. Generate a fully executable Python function named `trading_strategy(ohlc_data)` "
-            "that returns a DataFrame with original columns and integer `signal` column (1 buy, -1 sell, 0 no action). "
-            "Use pandas-ta for indicators, convert numeric types, and vectorize operations. Relax strict entry/exit conditions to increase signals. "
-            "Output only code, no explanations."
+    def _build_messages(self, variant=None, feedback=None):
+        """
+        Build the chat messages for one completion, optionally asking for a distinct variant.
+        :param feedback: Optional dict with the `code` of a previous attempt, a `metrics` summary of its
+                         backtest and `suggestions`; the model is asked to revise that code
+        """
+        user_message = (
+            f"Asset: {self.asset}\nTimeframe: {self.timeframe}\n"
+            f"Entry: {_format_conditions(self.entry_conditions)}\nExit: {_format_conditions(self.exit_conditions)}\n"
+            f"Columns: {OHLCV_SCHEMA}\n"
         )
-        user_message = f"Asset: {self.asset}\nTimeframe: {self.timeframe}\nEntry Conditions: {self.entry_conditions}\nExit Conditions: {self.exit_conditions}\nSample OHLCV: {sample_ohlcv}\nGenerate code now."
+        sample = compact_sample(self.ohlcv_data)
+        if sample:
+            user_message += f"Sample rows:\n{sample}\n"
+        if variant is not None:
+            user_message += (
+                f"Variant #{variant + 1}: keep the stated conditions but choose your own reasonable "
+                "indicator settings and confirmation filters so this variant differs from others.\n"
+            )
+        if feedback:
+            user_message += (
+                f"Previous attempt:\n{feedback['code']}\n"
+                f"Its backtest on this data: {feedback.get('metrics', {})}\n"
+            )
+            if feedback.get("suggestions"):
+                user_message += f"Suggestions: {feedback['suggestions']}\n"
+            if feedback.get("errors"):
+                user_message += f"Other revisions failed with: {'; '.join(feedback['errors'])}\n"
+            user_message += (
+                f"Revise the previous attempt to improve {feedback.get('objective', 'the Sharpe ratio')} "
+                "without looking ahead. "
+            )
+        user_message += "Generate code now."
+        return [
+            {"role": "system", "content": SYSTEM_MESSAGE},
+            {"role": "user", "content": user_message}
+        ]
+
+    def generate_strategy(self, on_token=None):
+        """
+        Generates trading strategy code using Azure OpenAI.
+        The completion is streamed; timing and token usage are recorded in `last_call`.
+        :param on_token: Optional callback receiving the text generated so far after every chunk
+        :return: Cleaned code
+        """
+        messages = self._build_messages()
 
         # Check if Azure OpenAI is properly configured
         if not endpoint or not api_key:
@@ -60,17 +141,44 @@ class StrategyGenerator:
                 api_version=api_version,
                 api_key=api_key
             )
-            response = client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_message}
-                ],
+            start = time.perf_counter()
+            first_token = None
+            usage = None
+            parts = []
+            stream = client.chat.completions.create(
+                messages=messages,
                 max_completion_tokens=2000,
-                model=deployment_name
+                model=deployment_name,
+                stream=True,
+                stream_options={"include_usage": True}
             )
+            for chunk in stream:
+                # The final chunk carries usage and no choices
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter()
+                parts.append(delta)
+                if on_token is not None:
+                    on_token("".join(parts))
+            self.usage["requests"] += 1
+            if usage is not None:
+                self.usage["prompt_tokens"] += usage.prompt_tokens or 0
+                self.usage["completion_tokens"] += usage.completion_tokens or 0
+            self.last_call = {
+                "ttft_ms": (first_token - start) * 1000 if first_token is not None else None,
+                "total_ms": (time.perf_counter() - start) * 1000,
+                "prompt_tokens": usage.prompt_tokens if usage is not None else None,
+                "completion_tokens": usage.completion_tokens if usage is not None else None,
+            }
+            logging.info(f"Strategy generation: {self.last_call}")
             # Extract and clean the generated code
-            generated_code = response.choices[0].message.content.strip()
-            generated_code = generated_code.replace("```python", "").replace("```", "").strip()
+            generated_code = clean_generated_code("".join(parts))
             # Validate output
             if not generated_code:
                 error_msg = "Generated code is empty. Azure OpenAI did not provide a valid response."
@@ -81,4 +189,184 @@ class StrategyGenerator:
         except Exception as e:
             error_msg = f"Azure OpenAI API request failed: {str(e)}"
             logging.error(error_msg)
-            raise RuntimeError(error_msg)
\ No newline at end of file
+            raise RuntimeError(error_msg)
+
+    async def _request_variants(self, client, variant, choices, limiter, semaphore, temperature, max_retries,
+                                feedback=None):
+        """Send one completion request for `choices` variants, retrying on rate limits and transient errors."""
+        delay = 1.0
+        for attempt in range(max_retries + 1):
+            async with semaphore:
+                if limiter is not None:
+                    await limiter.acquire()
+                try:
+                    response = await client.chat.completions.create(
+                        messages=self._build_messages(variant, feedback),
+                        max_completion_tokens=2000,
+                        model=deployment_name,
+                        temperature=temperature,
+                        n=choices
+                    )
+                    usage = getattr(response, "usage", None)
+                    self.usage["requests"] += 1
+                    if usage is not None:
+                        self.usage["prompt_tokens"] += usage.prompt_tokens or 0
+                        self.usage["completion_tokens"] += usage.completion_tokens or 0
+                    return [clean_generated_code(choice.message.content) for choice in response.choices]
+                except (RateLimitError, APITimeoutError, APIConnectionError) as e:
+                    if attempt == max_retries:
+                        raise
+                    retry_after = _retry_after_seconds(e)
+                    wait = retry_after if retry_after is not None else delay
+                    logging.warning(f"Variant request {variant + 1} throttled or failed ({type(e).__name__}); retrying in {wait:.1f}s")
+            await asyncio.sleep(wait)
+            delay = min(delay * 2, 30.0)
+        return []
+
+    async def agenerate_variants(self, n=4, max_concurrency=4, choices_per_request=1,
+                                 requests_per_minute=None, temperature=0.9, max_retries=3, feedback=None):
+        """
+        Asynchronously generate up to `n` distinct strategy implementations.
+        Requests run concurrently (bounded by `max_concurrency` and an optional
+        requests-per-minute limit); each unique variant is yielded as soon as it arrives.
+        :param n: Number of variants to request
+        :param choices_per_request: Completions per request (`n` choices in the API call)
+        :param feedback: Previous attempt and its metrics to revise (see _build_messages)
+        :return: Async iterator of cleaned code strings, with duplicates removed
+        """
+        if not endpoint or not api_key:
+            error_msg = "Azure OpenAI configuration is missing. This is required for production use."
+            logging.error(error_msg)
+            raise RuntimeError(error_msg)
+
+        choices_per_request = max(1, min(choices_per_request, n))
+        client = AsyncAzureOpenAI(
+            azure_endpoint=endpoint,
+            api_version=api_version,
+            api_key=api_key,
+            max_retries=0
+        )
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        limiter = AsyncRateLimiter(requests_per_minute) if requests_per_minute else None
+        tasks = []
+        remaining = n
+        variant = 0
+        while remaining > 0:
+            choices = min(choices_per_request, remaining)
+            tasks.append(asyncio.ensure_future(self._request_variants(
+                client, variant, choices, limiter, semaphore, temperature, max_retries, feedback)))
+            remaining -= choices
+            variant += 1
+
+        seen = set()
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    codes = await next_done
+                except Exception as e:
+                    logging.error(f"Variant request failed: {e}")
+                    continue
+                for code in codes:
+                    if not code:
+                        continue
+                    key = code_fingerprint(code)
+                    if key in seen:
+                        logging.info("Dropping duplicate strategy variant")
+                        continue
+                    seen.add(key)
+                    yield code
+        finally:
+            for task in tasks:
+                task.cancel()
+            await client.close()
+
+    async def abacktest_variants(self, n=4, executor=None, backtest_kwargs=None, **variant_kwargs):
+        """
+        Generate variants and backtest each one the moment it arrives.
+        :param executor: Optional concurrent.futures executor for run_backtest (default thread pool)
+        :param backtest_kwargs: Extra keyword arguments for run_backtest
+        :return: Async iterator of (code, backtest_results) in completion order
+        """
+        loop = asyncio.get_running_loop()
+        ohlc_data = self.ohlcv_data
+        backtest_kwargs = backtest_kwargs or {}
+
+        async def backtest(code):
+            # Invalid code never reaches the executor
+            analysis = analyze_strategy_code(code)
+            if not analysis["valid"]:
+                return code, {"error": "Strategy code failed validation: " + "; ".join(analysis["errors"]), "code_analysis": analysis}
+            result = await loop.run_in_executor(
+                executor, functools.partial(run_backtest, code, ohlc_data, **backtest_kwargs))
+            return code, result
+
+        variants = self.agenerate_variants(n=n, **variant_kwargs).__aiter__()
+        next_variant = asyncio.ensure_future(variants.__anext__())
+        pending = set()
+        try:
+            while next_variant is not None or pending:
+                waiting = pending | ({next_variant} if next_variant is not None else set())
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task is next_variant:
+                        try:
+                            code = task.result()
+                        except StopAsyncIteration:
+                            next_variant = None
+                            continue
+                        pending.add(asyncio.ensure_future(backtest(code)))
+                        next_variant = asyncio.ensure_future(variants.__anext__())
+                    else:
+                        pending.discard(task)
+                        yield task.result()
+        finally:
+            if next_variant is not None:
+                next_variant.cancel()
+            for task in pending:
+                task.cancel()
+            await variants.aclose()
+
+
+class AsyncRateLimiter:
+    """Spaces requests evenly so no more than `requests_per_minute` start per minute."""
+
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / requests_per_minute
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def clean_generated_code(text):
+    """Strip markdown fences and surrounding whitespace from a completion."""
+    return (text or "").replace("```python", "").replace("```", "").strip()
+
+
+def code_fingerprint(code):
+    """
+    Hash code by its syntax tree so formatting and comment differences do not count as new variants.
+    Falls back to whitespace-normalized text when the code does not parse.
+    """
+    try:
+        normalized = ast.dump(ast.parse(code))
+    except SyntaxError:
+        normalized = " ".join(code.split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _retry_after_seconds(error):
+    """Read a Retry-After header from an OpenAI error response, if present."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,252 @@
+# app/tick_backtest.py
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.backtester import StrategyExecutionError, execute_strategy, strip_code_fences
+from app.code_analyzer import analyze_strategy_code
+from app.execution import _buy_units, _forward_fill, _sell_proceeds, _validate_models
+from app.metrics import compute_metrics
+from app.tick_store import CHUNK_ROWS, TickStore
+from app.utils import interval_to_seconds
+
+
+def _first_tick_exit(series, first, last, entry_price, stop_loss, take_profit, trailing_stop, chunk_rows):
+    """
+    Find the first tick in [first, last) that trades through a protective level.
+    The segment is scanned in chunks, carrying the trailing peak across chunk
+    boundaries, so a long position never loads more than chunk_rows prices.
+    :return: (tick index, tick price, reason) or None
+    """
+    stop_level = entry_price * (1 - stop_loss) if stop_loss else -np.inf
+    target = entry_price * (1 + take_profit) if take_profit else np.inf
+    peak = entry_price
+    for offset, chunk in series.iter_chunks(first, last, ["price"], chunk_rows):
+        price = chunk["price"]
+        level = np.full(len(price), stop_level)
+        trailing = np.zeros(len(price), dtype=bool)
+        if trailing_stop:
+            running_peak = np.maximum.accumulate(np.maximum(price, peak))
+            trail_level = running_peak * (1 - trailing_stop)
+            trailing = trail_level > level
+            level = np.maximum(level, trail_level)
+            peak = running_peak[-1]
+        stop_hit = price <= level
+        hits = np.flatnonzero(stop_hit | (price >= target))
+        if hits.size:
+            k = hits[0]
+            if stop_hit[k]:
+                return offset + int(k), float(price[k]), "trailing_stop" if trailing[k] else "stop_loss"
+            return offset + int(k), float(price[k]), "take_profit"
+    return None
+
+
+def replay_signals(series, bar_start, bar_close, signal, interval, initial_capital=100.0, commission=0.0,
+                   slippage=0.0, stop_loss=None, take_profit=None, trailing_stop=None, commission_model="percent",
+                   latency_ms=0, first=0, last=None, chunk_rows=CHUNK_ROWS):
+    """
+    Fill bar signals against recorded ticks instead of bar closes.
+
+    A signal on a bar is known once the bar closes, so its order fills at the
+    first tick at or after the bar's end plus `latency_ms`. While a position is
+    open, every tick until the exit fill is checked against the protective
+    levels and a touch fills at that tick's price. Only the ticks of open
+    positions are scanned, in chunks, through the memory-mapped series.
+
+    :param series: TickSeries from TickStore.series
+    :param bar_start: int64 epoch-ns open times of the signal bars
+    :param bar_close: Bar close prices, used to mark open positions to market
+    :param signal: Integer array (1 buy, -1 sell, 0 no action)
+    :param interval: Bar timeframe; a bar ends one interval after it opens
+    :param slippage: Fraction of the tick price paid on every fill
+    :return: Dictionary with per-bar `equity`, `units`, `cash` arrays and a list of `trades`
+    """
+    _validate_models(commission_model, "percent")
+    ts = series["ts"]
+    last = len(series) if last is None else last
+    n = len(bar_start)
+    bar_end = bar_start + interval_to_seconds(interval) * 10**9
+    decision = bar_end + int(latency_ms * 1_000_000)
+
+    # One binary search over the mapped timestamps per signal, not per tick
+    buy_bars = np.flatnonzero(signal == 1)
+    sell_bars = np.flatnonzero(signal == -1)
+    buy_fill = np.searchsorted(ts[first:last], decision[buy_bars]) + first
+    sell_fill = np.searchsorted(ts[first:last], decision[sell_bars]) + first
+    has_stops = bool(stop_loss or take_profit or trailing_stop)
+
+    def _bar_of(tick):
+        return int(np.searchsorted(bar_start, ts[tick], side="right")) - 1
+
+    cash_marks = np.full(n, np.nan)
+    unit_marks = np.full(n, np.nan)
+    if n:
+        cash_marks[0] = initial_capital
+        unit_marks[0] = 0.0
+
+    trades = []
+    cash = float(initial_capital)
+    flat_from = first
+    while cash > 0:
+        b = np.searchsorted(buy_fill, flat_from)
+        if b >= len(buy_fill) or buy_fill[b] >= last:
+            break
+        signal_bar, entry = int(buy_bars[b]), int(buy_fill[b])
+        entry_price = float(series["price"][entry]) * (1 + slippage)
+        entry_cash = cash
+        units, entry_fee = _buy_units(cash, entry_price, commission, commission_model)
+        cash = 0.0
+        entry_bar = _bar_of(entry)
+        cash_marks[entry_bar] = cash
+        unit_marks[entry_bar] = units
+
+        s = np.searchsorted(sell_fill, entry, side="right")
+        sell_tick = int(sell_fill[s]) if s < len(sell_fill) and sell_fill[s] < last else None
+        exit_info = None
+        if has_stops:
+            exit_info = _first_tick_exit(series, entry + 1, (sell_tick if sell_tick is not None else last - 1) + 1,
+                                         entry_price, stop_loss, take_profit, trailing_stop, chunk_rows)
+        if exit_info is None and sell_tick is not None:
+            exit_info = (sell_tick, float(series["price"][sell_tick]), "signal")
+        trade = {
+            "entry_index": entry_bar, "signal_index": signal_bar, "entry_tick": entry,
+            "entry_time": int(ts[entry]), "entry_price": entry_price, "units": units,
+            "entry_cash": entry_cash, "fees": entry_fee,
+            "entry_delay_ms": (int(ts[entry]) - int(bar_end[signal_bar])) / 1e6,
+            "entry_drift_pct": (entry_price / bar_close[signal_bar] - 1) * 100,
+        }
+        if exit_info is None:
+            trade.update({"exit_index": None, "exit_tick": None, "exit_time": None, "exit_price": None,
+                          "exit_cash": None, "reason": "open"})
+            trades.append(trade)
+            break
+
+        exit_tick, raw_price, reason = exit_info
+        exit_price = raw_price * (1 - slippage)
+        cash, exit_fee = _sell_proceeds(units, exit_price, commission, commission_model)
+        exit_bar = _bar_of(exit_tick)
+        cash_marks[exit_bar] = cash
+        unit_marks[exit_bar] = 0.0
+        trade.update({"exit_index": exit_bar, "exit_tick": exit_tick, "exit_time": int(ts[exit_tick]),
+                      "exit_price": exit_price, "exit_cash": cash, "reason": reason})
+        trade["fees"] += exit_fee
+        trades.append(trade)
+        flat_from = exit_tick + 1
+
+    cash_curve = _forward_fill(cash_marks)
+    unit_curve = _forward_fill(unit_marks)
+    return {
+        "equity": cash_curve + unit_curve * bar_close,
+        "cash": cash_curve,
+        "units": unit_curve,
+        "trades": trades,
+    }
+
+
+def run_tick_backtest(strategy_code, symbol, interval, start=None, end=None, store=None, kind="aggTrades",
+                      initial_capital=100, commission=0.0, slippage=0.0, stop_loss=None, take_profit=None,
+                      trailing_stop=None, commission_model="percent", latency_ms=0, chunk_rows=CHUNK_ROWS,
+                      indicator_cache=None):
+    """
+    Backtest a strategy on candles built from stored ticks, with fills replayed on the ticks.
+    Signals come from the same generated code as run_backtest; only execution differs.
+    :param symbol: Symbol of a series in the tick store, e.g. 'BTCUSDT'
+    :param interval: Candle timeframe the strategy runs on
+    :param start, end: Optional time bounds
+    :param store: TickStore; defaults to one at TICK_STORE_DIR
+    :param latency_ms: Delay between a bar close and the order reaching the market
+    :return: run_backtest-style dictionary plus tick fill statistics, or {"error": ...}
+    """
+    try:
+        begin = time.perf_counter()
+        store = store or TickStore()
+        series = store.series(symbol, kind)
+        if not len(series):
+            return {"error": f"No {kind} ticks stored for {symbol}."}
+        first, last = series.locate(start, end)
+        candles = store.candles(symbol, interval, start, end, kind=kind, chunk_rows=chunk_rows)
+        if candles.empty:
+            return {"error": f"No {symbol} ticks between {start} and {end}."}
+        logging.info(f"Built {len(candles)} {interval} candles from {last - first} ticks")
+
+        initial_capital = float(initial_capital)
+        analysis = analyze_strategy_code(strip_code_fences(strategy_code))
+        if not analysis["valid"]:
+            return {"error": "Strategy code failed validation: " + "; ".join(analysis["errors"]),
+                    "code_analysis": analysis}
+        try:
+            df = execute_strategy(strategy_code, candles, indicator_cache=indicator_cache,
+                                  analysis=analysis, initial_capital=initial_capital)
+        except StrategyExecutionError as e:
+            return {"error": str(e)}
+
+        # Strategies may drop warm-up rows; realign signals to the candles
+        signal = df["signal"].reindex(candles.index).fillna(0).astype(int).to_numpy()
+        if not (signal == 1).any():
+            return {"error": "No trading signals were generated by the strategy on the stored ticks.",
+                    "signal_count": 0}
+        bar_start = candles["timestamp"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        bar_close = candles["close"].to_numpy(dtype=np.float64)
+
+        simulation = replay_signals(series, bar_start, bar_close, signal, interval, initial_capital=initial_capital,
+                                    commission=commission, slippage=slippage, stop_loss=stop_loss,
+                                    take_profit=take_profit, trailing_stop=trailing_stop,
+                                    commission_model=commission_model, latency_ms=latency_ms,
+                                    first=first, last=last, chunk_rows=chunk_rows)
+        equity = simulation["equity"]
+        timestamps = candles["timestamp"].to_numpy()
+
+        trade_log = []
+        trade_returns = []
+        for trade in simulation["trades"]:
+            trade_log.append({
+                "timestamp": str(pd.Timestamp(trade["entry_time"], unit="ns")),
+                "action": "BUY",
+                "price": trade["entry_price"],
+                "position": trade["units"],
+                "equity": trade["entry_cash"],
+                "reason": "signal",
+            })
+            if trade["exit_index"] is None:
+                continue
+            trade_profit = (trade["exit_cash"] - trade["entry_cash"]) / trade["entry_cash"] * 100
+            trade_returns.append(trade_profit)
+            trade_log.append({
+                "timestamp": str(pd.Timestamp(trade["exit_time"], unit="ns")),
+                "action": "SELL",
+                "price": trade["exit_price"],
+                "position": trade["units"],
+                "equity": trade["exit_cash"],
+                "profit_pct": trade_profit,
+                "reason": trade["reason"],
+            })
+
+        metrics = compute_metrics(np.concatenate(([initial_capital], equity)), interval=interval,
+                                  timestamps=timestamps, units=simulation["units"], trade_returns=trade_returns)
+        final_value = float(equity[-1])
+        trades = simulation["trades"]
+        return {
+            "initial_capital": initial_capital,
+            "final_value": final_value,
+            "return": (final_value - initial_capital) / initial_capital * 100,
+            **{name: metrics[name] for name in (
+                "annualized_return", "win_rate", "total_trades", "profitable_trades", "losing_trades",
+                "average_profit", "average_loss", "profit_factor", "expectancy", "max_drawdown",
+                "max_drawdown_duration", "sharpe_ratio", "sortino_ratio", "calmar_ratio", "exposure",
+                "periods_per_year")},
+            "total_fees": float(sum(t["fees"] for t in trades)),
+            "ticks": last - first,
+            "candles": len(candles),
+            "average_entry_delay_ms": float(np.mean([t["entry_delay_ms"] for t in trades])) if trades else 0.0,
+            "average_entry_drift_pct": float(np.mean([t["entry_drift_pct"] for t in trades])) if trades else 0.0,
+            "elapsed_ms": (time.perf_counter() - begin) * 1000,
+            "code_analysis": analysis,
+            "equity_curve": pd.DataFrame({"timestamp": timestamps, "equity": equity, "close": bar_close})
+                              .to_dict(orient="records"),
+            "trade_log": trade_log,
+        }
+    except Exception as e:
+        logging.error(f"Tick backtest failed: {e}")
+        return {"error": str(e)}
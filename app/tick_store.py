@@ -0,0 +1,376 @@
+# app/tick_store.py
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+import requests
+
+from app.config import BINANCE_DATA_URL, OHLCV_DTYPE, TICK_STORE_DIR
+from app.resample import _WEEK_ORIGIN_NS, is_calendar_interval
+from app.utils import interval_to_seconds, parse_interval
+
+# pyarrow is optional; it streams CSV dumps several times faster than pandas chunks
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+    PYARROW_AVAILABLE = False
+
+# One memory-mapped file per column. Prices stay float64 (float32 cannot hold
+# cent precision above ~65k); quantities only need relative precision.
+TICK_COLUMNS = {
+    "id": np.dtype(np.int64),
+    "ts": np.dtype(np.int64),  # epoch nanoseconds, viewable as datetime64[ns]
+    "price": np.dtype(np.float64),
+    "qty": np.dtype(np.float32),
+    "is_buyer_maker": np.dtype(np.bool_),
+}
+
+# Positions of (id, price, qty, time, is_buyer_maker) in Binance CSV dumps, spot and futures alike
+TICK_KINDS = {
+    "aggTrades": (0, 1, 2, 5, 6),
+    "trades": (0, 1, 2, 4, 5),
+}
+
+# Rows handled per ingest batch, candle pass and replay scan; bounds peak memory
+CHUNK_ROWS = 2_000_000
+
+# Spot dumps switched from millisecond to microsecond timestamps in 2025
+_MICROSECOND_THRESHOLD = 10**14
+
+
+def _open_source(path):
+    """Open a CSV or a Binance .zip dump (one CSV inside) as a binary file object."""
+    if path.endswith(".zip"):
+        archive = zipfile.ZipFile(path)
+        return archive.open(archive.namelist()[0])
+    return open(path, "rb")
+
+
+def _sniff_layout(path):
+    """Return (has_header, column_count) from the first line of a dump."""
+    with _open_source(path) as handle:
+        first = handle.readline().decode("utf-8").strip().split(",")
+    try:
+        float(first[0])
+        return False, len(first)
+    except ValueError:
+        return True, len(first)
+
+
+def _to_nanoseconds(times):
+    times = np.asarray(times, dtype=np.int64)
+    if len(times) and times[0] >= _MICROSECOND_THRESHOLD:
+        return times * 1_000
+    return times * 1_000_000
+
+
+def _read_chunks(path, kind, chunk_rows):
+    """
+    Stream a dump as dictionaries of TICK_COLUMNS arrays, `chunk_rows` rows at a time.
+    """
+    positions = TICK_KINDS[kind]
+    has_header, width = _sniff_layout(path)
+    names = [f"c{i}" for i in range(width)]
+    picked = [names[p] for p in positions]
+
+    def _convert(ids, prices, qtys, times, makers):
+        return {
+            "id": np.asarray(ids, dtype=np.int64),
+            "ts": _to_nanoseconds(times),
+            "price": np.asarray(prices, dtype=np.float64),
+            "qty": np.asarray(qtys, dtype=np.float32),
+            "is_buyer_maker": np.asarray(makers, dtype=np.bool_),
+        }
+
+    if PYARROW_AVAILABLE:
+        types = dict(zip(picked, [pa.int64(), pa.float64(), pa.float64(), pa.int64(), pa.bool_()]))
+        # ~60 bytes of text per aggTrade row
+        read_options = pa_csv.ReadOptions(column_names=names, skip_rows=int(has_header),
+                                          block_size=max(1 << 20, chunk_rows * 60))
+        convert_options = pa_csv.ConvertOptions(column_types=types, include_columns=picked)
+        with _open_source(path) as handle:
+            for batch in pa_csv.open_csv(handle, read_options=read_options, convert_options=convert_options):
+                yield _convert(*(batch.column(name).to_numpy(zero_copy_only=False) for name in picked))
+        return
+
+    with _open_source(path) as handle:
+        reader = pd.read_csv(handle, header=None, names=names, usecols=picked, skiprows=int(has_header),
+                             chunksize=chunk_rows, true_values=["True", "true"], false_values=["False", "false"])
+        for chunk in reader:
+            yield _convert(*(chunk[name].to_numpy() for name in picked))
+
+
+class TickSeries:
+    """
+    Read-only, memory-mapped view of one stored tick series.
+    Columns are numpy memmaps; pages are read from disk only when touched, so
+    slicing or binary-searching tens of millions of ticks costs almost no RAM.
+    """
+
+    def __init__(self, directory, rows):
+        self.directory = directory
+        self.rows = rows
+        self._columns = {}
+        for name, dtype in TICK_COLUMNS.items():
+            path = os.path.join(directory, f"{name}.bin")
+            if rows:
+                self._columns[name] = np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+            else:
+                self._columns[name] = np.empty(0, dtype=dtype)
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    @property
+    def start(self):
+        return pd.Timestamp(int(self["ts"][0]), unit="ns") if self.rows else None
+
+    @property
+    def end(self):
+        return pd.Timestamp(int(self["ts"][-1]), unit="ns") if self.rows else None
+
+    def locate(self, start=None, end=None):
+        """
+        Row range [first, last) of ticks with start <= time < end, by binary search on the mapped timestamps.
+        """
+        ts = self["ts"]
+        first = 0 if start is None else int(np.searchsorted(ts, pd.Timestamp(start).value, side="left"))
+        last = self.rows if end is None else int(np.searchsorted(ts, pd.Timestamp(end).value, side="left"))
+        return first, max(first, last)
+
+    def iter_chunks(self, first=0, last=None, columns=None, chunk_rows=CHUNK_ROWS):
+        """
+        Yield (offset, {column: array}) for rows [first, last) in slices of at most chunk_rows.
+        Arrays are views into the mapped files, not copies.
+        """
+        last = self.rows if last is None else last
+        columns = columns or list(TICK_COLUMNS)
+        for offset in range(first, last, chunk_rows):
+            stop = min(offset + chunk_rows, last)
+            yield offset, {name: self[name][offset:stop] for name in columns}
+
+
+class TickStore:
+    """
+    Append-only columnar store of exchange ticks (Binance aggTrades or raw trades).
+
+    Each (symbol, kind) series lives in its own directory with one raw binary
+    file per column and a small `meta.json`. Appends write new rows to the end
+    of every column file and then atomically replace the metadata, which is the
+    commit point: rows past the recorded count (from an interrupted ingest) are
+    truncated on the next append. Reads memory-map the files, so a month of
+    ticks opens instantly and only the slices in use are paged in.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or TICK_STORE_DIR
+        os.makedirs(self.root, exist_ok=True)
+
+    def _directory(self, symbol, kind):
+        if kind not in TICK_KINDS:
+            raise ValueError(f"Unknown tick kind '{kind}'. Expected one of {list(TICK_KINDS)}.")
+        return os.path.join(self.root, f"{symbol.upper()}_{kind}")
+
+    def _read_meta(self, directory):
+        path = os.path.join(directory, "meta.json")
+        if not os.path.exists(path):
+            return {"rows": 0, "last_id": None, "last_ts": None}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_meta(self, directory, meta):
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(directory, "meta.json"))
+
+    def series(self, symbol, kind="aggTrades"):
+        """Open the stored ticks of a symbol as a memory-mapped TickSeries."""
+        directory = self._directory(symbol, kind)
+        return TickSeries(directory, self._read_meta(directory)["rows"])
+
+    def has_ticks(self, symbol, kind="aggTrades"):
+        return self._read_meta(self._directory(symbol, kind))["rows"] > 0
+
+    def append(self, symbol, chunk, kind="aggTrades", meta=None):
+        """
+        Append one chunk of ticks (dictionary of TICK_COLUMNS arrays).
+        Rows whose id is not past the last stored id are dropped, so re-ingesting
+        a file is a no-op; out-of-order timestamps are dropped to keep time sorted.
+        :return: Number of rows written
+        """
+        directory = self._directory(symbol, kind)
+        os.makedirs(directory, exist_ok=True)
+        meta = meta or self._read_meta(directory)
+
+        keep = np.ones(len(chunk["id"]), dtype=bool)
+        if meta["last_id"] is not None:
+            keep &= chunk["id"] > meta["last_id"]
+        ts = chunk["ts"]
+        running_max = np.maximum.accumulate(ts) if len(ts) else ts
+        if meta["last_ts"] is not None:
+            running_max = np.maximum(running_max, meta["last_ts"])
+        unordered = ts < running_max
+        if unordered[keep].any():
+            logging.warning(f"Dropping {int(unordered[keep].sum())} out-of-order ticks for {symbol}")
+        keep &= ~unordered
+        n = int(keep.sum())
+        if not n:
+            return 0
+
+        for name, dtype in TICK_COLUMNS.items():
+            path = os.path.join(directory, f"{name}.bin")
+            with open(path, "ab") as f:
+                # Cut off anything an interrupted append left past the committed rows
+                f.truncate(meta["rows"] * dtype.itemsize)
+                f.write(np.ascontiguousarray(chunk[name][keep], dtype=dtype).tobytes())
+        meta["rows"] += n
+        meta["last_id"] = int(chunk["id"][keep][-1])
+        meta["last_ts"] = int(ts[keep][-1])
+        self._write_meta(directory, meta)
+        return n
+
+    def ingest_csv(self, path, symbol, kind="aggTrades", chunk_rows=CHUNK_ROWS):
+        """
+        Append a Binance aggTrades or trades dump (CSV or the .zip from data.binance.vision).
+        The file is streamed in chunks, so memory stays bounded whatever its size.
+        Dumps must be ingested in chronological order.
+        :return: Number of new rows stored
+        """
+        start = time.perf_counter()
+        directory = self._directory(symbol, kind)
+        os.makedirs(directory, exist_ok=True)
+        meta = self._read_meta(directory)
+        written = 0
+        for chunk in _read_chunks(path, kind, chunk_rows):
+            written += self.append(symbol, chunk, kind, meta=meta)
+        elapsed = time.perf_counter() - start
+        logging.info(f"Ingested {written} {kind} rows for {symbol} from {os.path.basename(path)} in {elapsed:.1f}s")
+        return written
+
+    def ingest_binance(self, symbol, period, kind="aggTrades", market="spot", keep_download=False):
+        """
+        Download a daily ('YYYY-MM-DD') or monthly ('YYYY-MM') dump from Binance's
+        public data archive and ingest it.
+        :param market: 'spot', 'futures/um' or 'futures/cm'
+        :return: Number of new rows stored
+        """
+        path = download_dump(symbol, period, kind=kind, market=market, directory=self.root)
+        try:
+            return self.ingest_csv(path, symbol, kind)
+        finally:
+            if not keep_download:
+                os.remove(path)
+
+    def candles(self, symbol, interval, start=None, end=None, kind="aggTrades", chunk_rows=CHUNK_ROWS, dtype=None):
+        """
+        Build OHLCV candles from stored ticks in one chunked pass.
+        Buckets are aligned like Binance klines (epoch, weeks on Monday). Bars with
+        no trades are omitted.
+        :param interval: Any fixed timeframe, including seconds ('1s', '15s', '5m', '1h')
+        :param start, end: Optional time bounds of the ticks used
+        :return: DataFrame with 'timestamp' and open/high/low/close/volume columns, like fetch_ohlc_data
+        """
+        if is_calendar_interval(interval):
+            raise ValueError("Month candles cannot be built from ticks; use a fixed interval such as '1min' or '1d'")
+        series = self.series(symbol, kind)
+        first, last = series.locate(start, end)
+        step = interval_to_seconds(interval) * 10**9
+        origin = _WEEK_ORIGIN_NS if parse_interval(interval)[1] == "w" else 0
+
+        parts = []
+        pending = None
+        for _, chunk in series.iter_chunks(first, last, ["ts", "price", "qty"], chunk_rows):
+            price = chunk["price"]
+            bucket = (chunk["ts"] - origin) // step
+            starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+            ends = np.r_[starts[1:], len(bucket)] - 1
+            bars = {
+                "bucket": bucket[starts],
+                "open": price[starts],
+                "high": np.maximum.reduceat(price, starts),
+                "low": np.minimum.reduceat(price, starts),
+                "close": price[ends],
+                "volume": np.add.reduceat(chunk["qty"].astype(np.float64), starts),
+            }
+            if pending is not None:
+                if pending["bucket"][0] == bars["bucket"][0]:
+                    # A bar split across chunk boundaries
+                    bars["open"][0] = pending["open"][0]
+                    bars["high"][0] = max(bars["high"][0], pending["high"][0])
+                    bars["low"][0] = min(bars["low"][0], pending["low"][0])
+                    bars["volume"][0] += pending["volume"][0]
+                else:
+                    parts.append(pending)
+            # The last bar may continue in the next chunk
+            parts.append({name: values[:-1] for name, values in bars.items()})
+            pending = {name: values[-1:] for name, values in bars.items()}
+        if pending is not None:
+            parts.append(pending)
+
+        dtype = np.dtype(dtype or OHLCV_DTYPE)
+        merged = {name: np.concatenate([p[name] for p in parts]) if parts else np.empty(0)
+                  for name in ("bucket", "open", "high", "low", "close", "volume")}
+        columns = {"timestamp": (merged["bucket"].astype(np.int64) * step + origin).view("datetime64[ns]")}
+        for name in ("open", "high", "low", "close", "volume"):
+            columns[name] = merged[name].astype(dtype)
+        return pd.DataFrame(columns, copy=False)
+
+    def symbols(self):
+        """List stored (symbol, kind, rows) series."""
+        stored = []
+        for name in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, name)
+            if not os.path.isdir(directory) or "_" not in name:
+                continue
+            symbol, kind = name.rsplit("_", 1)
+            if kind in TICK_KINDS:
+                stored.append((symbol, kind, self._read_meta(directory)["rows"]))
+        return stored
+
+    def delete(self, symbol, kind="aggTrades"):
+        directory = self._directory(symbol, kind)
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+
+
+def download_dump(symbol, period, kind="aggTrades", market="spot", directory="."):
+    """
+    Stream one archive from data.binance.vision to disk.
+    :param period: 'YYYY-MM' for a monthly file or 'YYYY-MM-DD' for a daily file
+    :return: Path of the downloaded .zip
+    """
+    if kind not in TICK_KINDS:
+        raise ValueError(f"Unknown tick kind '{kind}'. Expected one of {list(TICK_KINDS)}.")
+    symbol = symbol.upper().replace("/", "")
+    frequency = "daily" if period.count("-") == 2 else "monthly"
+    name = f"{symbol}-{kind}-{period}.zip"
+    url = f"{BINANCE_DATA_URL}/data/{market}/{frequency}/{kind}/{symbol}/{name}"
+    path = os.path.join(directory, name)
+    try:
+        with requests.get(url, stream=True, timeout=30) as response:
+            if response.status_code != 200:
+                error_msg = f"Failed to download {url}. Status code: {response.status_code}"
+                logging.error(error_msg)
+                raise RuntimeError(error_msg)
+            with open(path, "wb") as f:
+                for block in response.iter_content(chunk_size=1 << 20):
+                    f.write(block)
+    except requests.RequestException as e:
+        error_msg = f"Failed to download {url}: {e}"
+        logging.error(error_msg)
+        raise RuntimeError(error_msg)
+    logging.info(f"Downloaded {name} ({os.path.getsize(path) / 1e6:.1f} MB)")
+    return path
@@ -1,5 +1,8 @@
 # app/utils.py
+import hashlib
 import logging
+import numpy as np
+import pandas as pd
 
 def setup_logger():
     """
@@ -19,4 +22,98 @@ def validate_input(user_input):
     """
     if not user_input or len(user_input.strip()) == 0:
         return False
-    return True
\ No newline at end of file
+    return True
+
+_INTERVAL_UNITS = {
+    "S": "s", "SEC": "s",
+    "M": "m", "MIN": "m", "MINS": "m", "MINUTE": "m", "MINUTES": "m", "T": "m",
+    "H": "h", "HR": "h", "HOUR": "h", "HOURS": "h",
+    "D": "d", "DAY": "d", "DAYS": "d",
+    "W": "w", "WK": "w", "WEEK": "w", "WEEKS": "w",
+    "MO": "M", "MON": "M", "MONTH": "M", "MONTHS": "M",
+}
+
+_UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800, "M": 2629746}
+
+def parse_interval(interval):
+    """
+    Parse a timeframe string into a (count, unit) pair.
+    Units are 's', 'm', 'h', 'd', 'w' and 'M' (calendar month). As on Binance, '1m'
+    is one minute and '1M' one month; for backwards compatibility '15M' and '30M'
+    are minutes too, since only a bare upper-case '1M' was ever used for months.
+    :param interval: Timeframe such as '1h', '4H', '15M', '1m', '5min', '1d' or '1M'
+    :return: Tuple (count, unit)
+    """
+    raw = str(interval).strip().replace(" ", "")
+    text = raw.upper()
+    split = len(text) - len(text.lstrip("0123456789"))
+    count_text, unit_text = text[:split], text[split:]
+    if unit_text not in _INTERVAL_UNITS:
+        raise ValueError(f"Unrecognized interval '{interval}'")
+    count = int(count_text) if count_text else 1
+    if count <= 0:
+        raise ValueError(f"Interval count must be positive, got '{interval}'")
+    unit = _INTERVAL_UNITS[unit_text]
+    if raw[split:] == "M" and count == 1:
+        unit = "M"
+    return count, unit
+
+def interval_to_seconds(interval):
+    """
+    Length of a timeframe in seconds. Months use the average Gregorian month.
+    :param interval: Timeframe string accepted by parse_interval
+    :return: Duration in seconds
+    """
+    count, unit = parse_interval(interval)
+    return count * _UNIT_SECONDS[unit]
+
+def dataset_fingerprint(data):
+    """
+    Content hash of a Series or DataFrame (values, index and column names).
+    Numeric and datetime buffers are hashed directly without copying.
+    :param data: pandas Series or DataFrame
+    :return: Hex digest string
+    """
+    digest = hashlib.blake2b(digest_size=16)
+
+    def _update(values):
+        array = np.asarray(values)
+        if array.dtype.kind in "biufcmM":
+            digest.update(array.dtype.str.encode())
+            digest.update(np.ascontiguousarray(array).view(np.uint8))
+        else:
+            digest.update(pd.util.hash_pandas_object(pd.Series(array), index=False).to_numpy().view(np.uint8))
+
+    if isinstance(data, pd.Series):
+        digest.update(str(data.name).encode())
+        _update(data.to_numpy())
+    else:
+        for name in data.columns:
+            digest.update(str(name).encode())
+            _update(data[name].to_numpy())
+    _update(data.index.to_numpy())
+    return digest.hexdigest()
+
+def code_hash(strategy_code):
+    """
+    Stable hash of strategy source with markdown fences and surrounding whitespace removed.
+    :param strategy_code: Python source
+    :return: Hex digest string
+    """
+    code = (strategy_code or "").replace("```python", "").replace("```", "").strip()
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+def normalize_interval(interval):
+    """
+    Canonical spelling of a timeframe, e.g. '4H' -> '4h', '15M' -> '15min', '1m' -> '1min', '1M' -> '1M'.
+    Minutes are spelled 'min' and months longer than one 'mo', so the result parses back to the
+    same timeframe however it is cased. Binance's spelling is picked by data_handler.download_interval.
+    :param interval: Timeframe string accepted by parse_interval
+    :return: Canonical interval string
+    """
+    count, unit = parse_interval(interval)
+    if unit == "m":
+        return f"{count}min"
+    if unit == "M" and count > 1:
+        return f"{count}mo"
+    return f"{count}{unit}"
@@ -1,8 +1,13 @@
 import streamlit as st
 import sys
+import logging
 import os
 import importlib
 import traceback
+import asyncio
+import gzip
+import time
+import uuid
 
 # Function to check if required modules are available
 def check_dependencies():
@@ -54,8 +59,22 @@ try:
     import pandas as pd
     from app.nlp_handler import interpret_user_input
     from app.strategy_generator import StrategyGenerator
-    from app.backtester import run_backtest
-    from app.data_handler import fetch_ohlc_data
+    from app.data_handler import get_quality_report, get_exchange_symbols
+    from app.code_analyzer import analyze_strategy_code
+    from app.chart_data import chart_cache, downsample_series
+    from app.results_store import ResultsStore, cached_backtest
+    from app.portfolio import run_portfolio_backtest
+    from app.rule_engine import parse_strategy_text, compile_strategy
+    from app.robustness import analyze_robustness
+    from app.refine_strategy import refine_strategy
+    from app.tick_store import TickStore
+    from app.tick_backtest import run_tick_backtest
+    from app.paper_trading import run_paper_trading
+    from app.scanner import MarketScanner
+    from app.refine_loop import refine
+    from app.lookahead import detect_lookahead
+    from app.prefetch import Prefetcher
+    from app.config import RESULTS_DB_PATH, TICK_STORE_DIR
 except ImportError as e:
     st.error(f"Error importing required modules: {e}")
     st.info("Please install missing packages with: pip install -r requirements.txt")
@@ -65,6 +84,73 @@ except ImportError as e:
 
 # Version display
 VERSION = "1.0.0"
+
+# Point budget per chart; longer series are downsampled before reaching the browser
+CHART_POINTS = 2000
+
+
+@st.cache_resource
+def get_results_store():
+    # One SQLite connection per server process; results survive reruns, resets and restarts
+    return ResultsStore(RESULTS_DB_PATH)
+
+
+@st.cache_resource
+def get_market_scanner(interval, window):
+    # Kept per process so later scans only download the bars that closed since the last one
+    return MarketScanner(interval=interval, window=window)
+
+
+@st.cache_resource
+def get_tick_store():
+    return TickStore(TICK_STORE_DIR)
+
+
+@st.cache_resource
+def get_prefetcher():
+    # Shared by all sessions so concurrent requests for the same data share one download
+    return Prefetcher()
+
+
+def start_prefetch(params):
+    # Warm the cache for the interpreted asset and timeframe while the user reads the parameters
+    key = (params.get('Asset', 'BTC/USDT').replace('/', ''), params.get('Timeframe', '1h'))
+    previous = st.session_state.get('prefetch_key')
+    if previous == key:
+        return
+    try:
+        if previous:
+            get_prefetcher().cancel(*previous)
+        get_prefetcher().prefetch(*key)
+        st.session_state.prefetch_key = key
+    except Exception as e:
+        # Prefetching is best effort; the fetch step reports real errors
+        st.session_state.prefetch_key = None
+        logging.warning(f"Prefetch not started: {e}")
+
+
+def stream_to(placeholder, language, min_interval=0.1):
+    # Redraw streamed text at most every min_interval seconds; every chunk would flood the browser
+    last_draw = [0.0]
+
+    def _update(text):
+        now = time.monotonic()
+        if now - last_draw[0] >= min_interval:
+            last_draw[0] = now
+            placeholder.code(text, language=language)
+    return _update
+
+
+def describe_call(stats):
+    # One-line latency and token summary of a streamed completion
+    parts = []
+    if stats.get("ttft_ms") is not None:
+        parts.append(f"first token after {stats['ttft_ms']:.0f} ms")
+    parts.append(f"done in {stats['total_ms']:.0f} ms")
+    if stats.get("prompt_tokens") is not None:
+        parts.append(f"{stats['prompt_tokens']} prompt + {stats['completion_tokens']} completion tokens")
+    return "Azure OpenAI: " + ", ".join(parts)
+
 st.set_page_config(
     page_title="Crypto Trading Strategy Generator",
     page_icon="📈",
@@ -108,6 +194,7 @@ with st.expander("How to Enter Your Strategy"):
     - **Timeframe**: Specify the timeframe (e.g., '1h' for 1-hour candles).
     
     This application uses **Azure OpenAI** to interpret your natural language description and generate executable Python code.
+    Common RSI, EMA/SMA crossover, MACD and Bollinger Band strategies are recognised locally and compiled instantly without an API call.
     """)
 
     # Add example strategies
@@ -134,14 +221,29 @@ else:
 # Step 1: Interpret user input
 if st.button("Generate Strategy"):
     if user_input:
-        with st.spinner("Interpreting strategy with Azure OpenAI..."):
-            try:
-                st.session_state.strategy_params = interpret_user_input(user_input)
-                st.session_state.data_visualized = False
-                st.session_state.code_generated = False
-            except Exception as e:
-                st.error(f"Error interpreting strategy: {str(e)}")
-                st.error(f"Details: {traceback.format_exc()}")
+        # Common indicator strategies are parsed locally; anything else goes to Azure OpenAI
+        local_params = parse_strategy_text(user_input)
+        if local_params:
+            st.session_state.strategy_params = local_params
+            start_prefetch(local_params)
+            st.session_state.data_visualized = False
+            st.session_state.code_generated = False
+            st.caption("Interpreted locally by the rule engine (no API call).")
+        else:
+            with st.spinner("Interpreting strategy with Azure OpenAI..."):
+                try:
+                    preview = st.empty()
+                    call_stats = {}
+                    st.session_state.strategy_params = interpret_user_input(
+                        user_input, on_token=stream_to(preview, "json"), stats=call_stats)
+                    preview.empty()
+                    start_prefetch(st.session_state.strategy_params)
+                    st.caption(describe_call(call_stats))
+                    st.session_state.data_visualized = False
+                    st.session_state.code_generated = False
+                except Exception as e:
+                    st.error(f"Error interpreting strategy: {str(e)}")
+                    st.error(f"Details: {traceback.format_exc()}")
     else:
         st.error("Please enter a valid strategy.")
 
@@ -157,14 +259,26 @@ if st.session_state.strategy_params and not st.session_state.data_visualized:
         st.write(f"Fetching historical data for {symbol}...")
         with st.spinner("Fetching data from Binance..."):
             try:
-                st.session_state.ohlc_data = fetch_ohlc_data(symbol, timeframe)
+                # Joins the download started after interpretation, or reads the data it cached
+                st.session_state.ohlc_data = get_prefetcher().fetch(symbol, timeframe)
+                st.session_state.prefetch_key = None
                 if st.session_state.ohlc_data is not None and not st.session_state.ohlc_data.empty:
                     st.write("Fetched Data:", st.session_state.ohlc_data.head())
+                    quality_report = get_quality_report(st.session_state.ohlc_data)
+                    if quality_report:
+                        if quality_report["gaps"] or quality_report["duplicates"] or quality_report["spikes"]:
+                            st.warning(
+                                f"Data quality: {quality_report['gaps']} gaps ({quality_report['missing_bars']} missing bars), "
+                                f"{quality_report['duplicates']} duplicates, {quality_report['spikes']} price spikes"
+                            )
+                        with st.expander("Data Quality Report"):
+                            st.json(quality_report)
                     st.session_state.data_visualized = True
                     
                     # Show a quick chart of the closing prices
                     st.subheader(f"{symbol} Price Chart ({timeframe})")
-                    st.line_chart(st.session_state.ohlc_data.set_index('timestamp')['close'])
+                    close_series = st.session_state.ohlc_data.set_index('timestamp')['close']
+                    st.line_chart(downsample_series(close_series, CHART_POINTS, method="minmax"))
                 else:
                     st.error(f"Failed to fetch data. No data returned from Binance for {symbol} with timeframe {timeframe}.")
             except ValueError as e:
@@ -178,15 +292,145 @@ if st.session_state.strategy_params and not st.session_state.data_visualized:
 # Step 3: Generate strategy code
 if st.session_state.data_visualized and not st.session_state.code_generated:
     if st.button("Get Code"):
-        with st.spinner("Generating strategy code with Azure OpenAI..."):
-            try:
-                # Pass both strategy parameters and OHLCV data to the generator
-                strategy_generator = StrategyGenerator(st.session_state.strategy_params)
-                st.session_state.strategy_code = strategy_generator.generate_strategy()
+        rules = st.session_state.strategy_params.get("Rules")
+        if rules:
+            # Rule-engine strategies compile from a template instantly
+            st.session_state.strategy_code = compile_strategy(rules)
+            st.session_state.code_generated = True
+        else:
+            with st.spinner("Generating strategy code with Azure OpenAI..."):
+                try:
+                    # Pass both strategy parameters and OHLCV data to the generator
+                    strategy_generator = StrategyGenerator(st.session_state.strategy_params,
+                                                           ohlcv_data=st.session_state.ohlc_data)
+                    # Show the code as it streams; the full listing replaces it below
+                    preview = st.empty()
+                    st.session_state.strategy_code = strategy_generator.generate_strategy(
+                        on_token=stream_to(preview, "python"))
+                    preview.empty()
+                    st.caption(describe_call(strategy_generator.last_call))
+                    st.session_state.code_generated = True
+                except Exception as e:
+                    st.error(f"Error generating strategy code: {str(e)}")
+                    st.error(f"Details: {traceback.format_exc()}")
+
+# Step 3b: Generate several variants and backtest each as it arrives
+if st.session_state.data_visualized:
+    with st.expander("Generate and Backtest Variants"):
+        variant_count = st.number_input("Number of variants", min_value=2, max_value=20, value=4)
+        variant_concurrency = st.number_input("Concurrent requests", min_value=1, max_value=10, value=4)
+        if st.button("Run Variants"):
+            async def _collect_variants(placeholder):
+                generator = StrategyGenerator(st.session_state.strategy_params, ohlcv_data=st.session_state.ohlc_data)
+                rows = []
+                async for code, result in generator.abacktest_variants(
+                    n=int(variant_count),
+                    max_concurrency=int(variant_concurrency),
+                    backtest_kwargs={"interval": st.session_state.strategy_params.get('Timeframe')}
+                ):
+                    rows.append({
+                        "variant": len(rows) + 1,
+                        "return": result.get("return"),
+                        "sharpe_ratio": result.get("sharpe_ratio"),
+                        "max_drawdown": result.get("max_drawdown"),
+                        "total_trades": result.get("total_trades"),
+                        "error": result.get("error"),
+                        "code": code
+                    })
+                    placeholder.dataframe(pd.DataFrame(rows).drop(columns=["code"]))
+                return rows
+
+            with st.spinner("Generating and backtesting variants with Azure OpenAI..."):
+                try:
+                    st.session_state.variant_results = asyncio.run(_collect_variants(st.empty()))
+                except Exception as e:
+                    st.error(f"Error generating variants: {str(e)}")
+                    st.error(f"Details: {traceback.format_exc()}")
+
+        ranked = [row for row in st.session_state.get('variant_results') or [] if not row.get("error")]
+        if ranked:
+            best = max(ranked, key=lambda row: row.get("sharpe_ratio") or 0)
+            st.write(f"Best variant by Sharpe ratio: #{best['variant']}")
+            if st.button("Use Best Variant"):
+                st.session_state.strategy_code = best["code"]
+                st.session_state.code_generated = True
+
+            # Trade every successful variant together from one pool of capital
+            st.write("Combine the variants into one portfolio:")
+            pf_col1, pf_col2 = st.columns(2)
+            with pf_col1:
+                pf_allocation = st.selectbox("Allocation", ["fixed", "active"],
+                                             help="fixed: equal sleeves per variant; active: capital shared by variants in a position")
+            with pf_col2:
+                pf_rebalance = st.selectbox("Rebalance", ["never", "1d", "1w", "1M"])
+            if st.button("Backtest Portfolio"):
+                with st.spinner("Running portfolio backtest..."):
+                    portfolio = run_portfolio_backtest(
+                        [{"name": f"variant {row['variant']}", "data": st.session_state.ohlc_data, "strategy_code": row["code"]}
+                         for row in ranked],
+                        initial_capital=100,
+                        rebalance=None if pf_rebalance == "never" else pf_rebalance,
+                        allocation=pf_allocation,
+                        commission=0.001,
+                        interval=st.session_state.strategy_params.get('Timeframe')
+                    )
+                if "error" in portfolio:
+                    st.error(f"Portfolio Error: {portfolio['error']}")
+                else:
+                    pf_metrics = st.columns(4)
+                    pf_metrics[0].metric("Total Return", f"{portfolio['return']:.2f}%")
+                    pf_metrics[1].metric("Sharpe Ratio", f"{portfolio['sharpe_ratio']:.2f}")
+                    pf_metrics[2].metric("Max Drawdown", f"{portfolio['max_drawdown']:.2f}%")
+                    pf_metrics[3].metric("Fees Paid", f"${portfolio['total_fees']:.2f}")
+                    st.dataframe(pd.DataFrame(portfolio["components"]))
+                    pf_equity = pd.DataFrame(portfolio["equity_curve"]).set_index("timestamp")["equity"]
+                    st.line_chart(downsample_series(pf_equity, CHART_POINTS))
+
+# Step 3c: Feed backtest metrics back into the generator until the strategy stops improving
+if st.session_state.code_generated and st.session_state.ohlc_data is not None:
+    with st.expander("Refine Automatically"):
+        rf_col1, rf_col2, rf_col3 = st.columns(3)
+        with rf_col1:
+            refine_iterations = st.number_input("Max iterations", min_value=1, max_value=20, value=5)
+            refine_candidates = st.number_input("Revisions per iteration", min_value=1, max_value=10, value=3)
+        with rf_col2:
+            refine_metric = st.selectbox("Optimize", ["sharpe_ratio", "sortino_ratio", "return", "profit_factor"])
+            refine_patience = st.number_input("Stop after iterations without improvement", min_value=1, max_value=10, value=2)
+        with rf_col3:
+            refine_tokens = st.number_input("Token budget (0 = none)", min_value=0, value=50000, step=10000)
+            refine_seconds = st.number_input("Time budget in seconds (0 = none)", min_value=0, value=300, step=30)
+        if st.button("Run Refinement"):
+            with st.spinner("Refining the strategy with Azure OpenAI..."):
+                try:
+                    generator = StrategyGenerator(st.session_state.strategy_params, ohlcv_data=st.session_state.ohlc_data)
+                    st.session_state.refine_report = refine(
+                        generator,
+                        seed_code=st.session_state.strategy_code,
+                        ohlc_data=st.session_state.ohlc_data,
+                        metric=refine_metric,
+                        max_iterations=int(refine_iterations),
+                        candidates=int(refine_candidates),
+                        patience=int(refine_patience),
+                        token_budget=int(refine_tokens) or None,
+                        time_budget=int(refine_seconds) or None,
+                        backtest_kwargs={"interval": st.session_state.strategy_params.get('Timeframe')},
+                        store=get_results_store()
+                    )
+                except Exception as e:
+                    st.error(f"Error refining strategy: {str(e)}")
+                    st.error(f"Details: {traceback.format_exc()}")
+
+        report = st.session_state.get('refine_report')
+        if report:
+            best = report["best"]
+            st.write(f"Stopped: {report['stop_reason']}. Best {report['metric']}: {best['score']} "
+                     f"(iteration {best['iteration']}); {report['usage']['prompt_tokens'] + report['usage']['completion_tokens']} "
+                     f"tokens in {report['elapsed_ms'] / 1000:.1f}s")
+            if report["history"]:
+                st.dataframe(pd.DataFrame(report["history"]).set_index("iteration"))
+            if best["iteration"] and st.button("Use Refined Strategy"):
+                st.session_state.strategy_code = best["code"]
                 st.session_state.code_generated = True
-            except Exception as e:
-                st.error(f"Error generating strategy code: {str(e)}")
-                st.error(f"Details: {traceback.format_exc()}")
 
 # Display the generated code (always show if it exists)
 if st.session_state.strategy_code:
@@ -195,18 +439,45 @@ if st.session_state.strategy_code:
 
 # Step 4: Backtest the strategy
 if st.session_state.code_generated and st.session_state.ohlc_data is not None:
+    # Percentage exits parsed by the rule engine become the defaults
+    rules = st.session_state.strategy_params.get("Rules") or {}
+    rule_exits = {name: rules[name] * 100 for name in ("stop_loss", "take_profit", "trailing_stop") if rules.get(name)}
+    with st.expander("Execution Settings"):
+        exec_col1, exec_col2, exec_col3 = st.columns(3)
+        with exec_col1:
+            commission_pct = st.number_input("Commission per fill (%)", min_value=0.0, value=0.1, step=0.01)
+            slippage_pct = st.number_input("Slippage (%)", min_value=0.0, value=0.05, step=0.01)
+        with exec_col2:
+            stop_loss_pct = st.number_input("Stop Loss (%)", min_value=0.0, value=rule_exits.get("stop_loss") or 0.0, step=0.5, help="0 disables the stop")
+            take_profit_pct = st.number_input("Take Profit (%)", min_value=0.0, value=rule_exits.get("take_profit") or 0.0, step=0.5, help="0 disables the target")
+        with exec_col3:
+            trailing_stop_pct = st.number_input("Trailing Stop (%)", min_value=0.0, value=rule_exits.get("trailing_stop") or 0.0, step=0.5, help="0 disables the trailing stop")
+
     if st.button("Backtest This"):
         try:
-            # Validate the generated code
-            if not st.session_state.strategy_code or "def trading_strategy(" not in str(st.session_state.strategy_code):
-                st.error("Generated code is invalid. Missing 'trading_strategy' function.")
+            # Validate the generated code statically before loading anything
+            code_analysis = analyze_strategy_code(st.session_state.strategy_code)
+            for warning in code_analysis["warnings"]:
+                st.warning(f"Slow pattern: {warning}")
+            if not code_analysis["valid"]:
+                st.error("Generated code is invalid: " + "; ".join(code_analysis["errors"]))
             else:
+                if code_analysis["indicators"]:
+                    st.caption("Indicators used: " + ", ".join(code_analysis["indicators"]))
                 with st.spinner("Running backtest..."):
                     # Run backtest and store results
-                    st.session_state.backtest_results = run_backtest(
+                    st.session_state.backtest_results = cached_backtest(
+                        get_results_store(),
                         st.session_state.strategy_code,
                         st.session_state.ohlc_data,
-                        initial_capital=100
+                        symbol=st.session_state.strategy_params.get('Asset', 'BTC/USDT').replace('/', ''),
+                        initial_capital=100,
+                        commission=commission_pct / 100,
+                        slippage=slippage_pct / 100,
+                        stop_loss=stop_loss_pct / 100 or None,
+                        take_profit=take_profit_pct / 100 or None,
+                        trailing_stop=trailing_stop_pct / 100 or None,
+                        interval=st.session_state.strategy_params.get('Timeframe')
                     )
 
                 # Check for errors in backtest results
@@ -215,77 +486,9 @@ if st.session_state.code_generated and st.session_state.ohlc_data is not None:
                     st.error(f"Backtest Error: {error_msg}")
                     st.error("Backtesting failed. Please review your strategy or try with a different asset/timeframe.")
                 else:
-                    # Display results
-                    st.subheader("Backtest Results")
-                    
-                    # Create metrics in a nice dashboard style
-                    metric1, metric2, metric3 = st.columns(3)
-                    metric1.metric("Initial Capital", f"${st.session_state.backtest_results['initial_capital']:.2f}")
-                    metric2.metric("Final Portfolio Value", f"${st.session_state.backtest_results['final_value']:.2f}")
-                    metric3.metric("Total Return", f"{st.session_state.backtest_results['return']:.2f}%")
-                    
-                    # Display enhanced metrics
-                    col1, col2, col3, col4 = st.columns(4)
-                    with col1:
-                        st.metric("Win Rate", f"{st.session_state.backtest_results.get('win_rate', 0):.2f}%")
-                        st.metric("Total Trades", st.session_state.backtest_results.get('total_trades', 0))
-                    
-                    with col2:
-                        st.metric("Profitable Trades", st.session_state.backtest_results.get('profitable_trades', 0))
-                        st.metric("Losing Trades", st.session_state.backtest_results.get('losing_trades', 0))
-                    
-                    with col3:
-                        st.metric("Max Drawdown", f"{st.session_state.backtest_results.get('max_drawdown', 0):.2f}%")
-                        st.metric("Sharpe Ratio", f"{st.session_state.backtest_results.get('sharpe_ratio', 0):.2f}")
-                    
-                    with col4:
-                        st.metric("Avg Profit", f"{st.session_state.backtest_results.get('average_profit', 0):.2f}%")
-                        st.metric("Avg Loss", f"{st.session_state.backtest_results.get('average_loss', 0):.2f}%")
-                    
-                    # Plot equity curve if available
-                    equity_curve = st.session_state.backtest_results.get('equity_curve', [])
-                    if equity_curve:
-                        st.subheader("Equity Curve")
-                        # Convert to DataFrame for plotting
-                        equity_df = pd.DataFrame(equity_curve)
-                        if not equity_df.empty:
-                            # Remove timestamp column for plotting
-                            equity_df['timestamp'] = pd.to_datetime(equity_df['timestamp'])
-                            equity_df.set_index('timestamp', inplace=True)
-                            
-                            # Create plot with both equity and price
-                            chart1, chart2 = st.columns(2)
-                            with chart1:
-                                st.subheader("Portfolio Value")
-                                st.line_chart(equity_df[['equity']])
-                            with chart2:
-                                st.subheader("Price Chart")
-                                st.line_chart(equity_df[['close']])
-
-                    # Show Trade Log
-                    st.subheader("Trade Log")
-                    trade_log_df = pd.DataFrame(st.session_state.backtest_results['trade_log'])
-                    if not trade_log_df.empty:
-                        # Add profit column if it exists
-                        if 'profit_pct' in trade_log_df.columns:
-                            # Format profit_pct for display
-                            trade_log_df['profit_pct'] = trade_log_df['profit_pct'].apply(
-                                lambda x: f"+{x:.2f}%" if x > 0 else f"{x:.2f}%"
-                            )
-                            st.dataframe(trade_log_df)
-                        else:
-                            st.dataframe(trade_log_df)
-                        
-                        # Add a download button for the trade log
-                        csv = trade_log_df.to_csv(index=False).encode('utf-8')
-                        st.download_button(
-                            label="Download Trade Log as CSV",
-                            data=csv,
-                            file_name="trade_log.csv",
-                            mime="text/csv"
-                        )
-                    else:
-                        st.write("No trades were executed during the backtest period.")
+                    st.session_state.backtest_results["result_id"] = uuid.uuid4().hex
+                    if st.session_state.backtest_results.get("cached"):
+                        st.info("Identical run found in the results store; showing the stored result.")
 
         except ImportError as e:
             st.error(f"Missing dependency: {str(e)}")
@@ -295,6 +498,273 @@ if st.session_state.code_generated and st.session_state.ohlc_data is not None:
             st.error(f"Details: {traceback.format_exc()}")
             st.info("Please try a different strategy or timeframe.")
 
+    # Re-run the strategy on prefixes of the data; signals that change when later bars arrive used the future
+    with st.expander("Look-Ahead Bias Check"):
+        if st.button("Check for Look-Ahead Bias"):
+            with st.spinner("Re-running the strategy on truncated data..."):
+                lookahead_report = detect_lookahead(st.session_state.strategy_code, st.session_state.ohlc_data)
+            if "error" in lookahead_report:
+                st.error(f"Look-Ahead Check Error: {lookahead_report['error']}")
+            else:
+                first = lookahead_report["first_divergence"]
+                if first:
+                    st.error(
+                        f"Look-ahead bias: bar {first['first_changed']} ({first['timestamp']}) changes once data "
+                        f"after bar {first['length'] - 1} is added (columns: {', '.join(first['columns'])}). "
+                        "Backtest results are not reproducible live."
+                    )
+                else:
+                    st.success("Signals on every checked prefix match the full run.")
+                for hint in lookahead_report["hints"]:
+                    st.warning(hint)
+                st.caption(f"{lookahead_report['runs']} runs, {lookahead_report['cost_multiple']:.1f}x one full run")
+                st.dataframe(pd.DataFrame(lookahead_report["checkpoints"]))
+
+    # Replay the same signals on stored aggTrades when ticks for this asset were ingested
+    tick_symbol = st.session_state.strategy_params.get('Asset', 'BTC/USDT').replace('/', '')
+    if os.path.isdir(TICK_STORE_DIR) and get_tick_store().has_ticks(tick_symbol):
+        with st.expander("Tick Replay"):
+            tick_series = get_tick_store().series(tick_symbol)
+            st.caption(f"{len(tick_series):,} {tick_symbol} ticks stored from {tick_series.start} to {tick_series.end}")
+            latency_ms = st.number_input("Order latency (ms)", min_value=0, value=100, step=50)
+            if st.button("Replay on Ticks"):
+                with st.spinner("Building candles and replaying fills on ticks..."):
+                    tick_results = run_tick_backtest(
+                        st.session_state.strategy_code,
+                        tick_symbol,
+                        st.session_state.strategy_params.get('Timeframe') or '1h',
+                        store=get_tick_store(),
+                        commission=commission_pct / 100,
+                        slippage=slippage_pct / 100,
+                        stop_loss=stop_loss_pct / 100 or None,
+                        take_profit=take_profit_pct / 100 or None,
+                        trailing_stop=trailing_stop_pct / 100 or None,
+                        latency_ms=latency_ms,
+                    )
+                if "error" in tick_results:
+                    st.error(f"Tick replay failed: {tick_results['error']}")
+                else:
+                    tick_col1, tick_col2, tick_col3, tick_col4 = st.columns(4)
+                    tick_col1.metric("Return", f"{tick_results['return']:.2f}%")
+                    tick_col2.metric("Trades", tick_results['total_trades'])
+                    tick_col3.metric("Avg entry delay", f"{tick_results['average_entry_delay_ms']:.0f} ms")
+                    tick_col4.metric("Avg entry vs close", f"{tick_results['average_entry_drift_pct']:+.3f}%")
+                    st.caption(f"{tick_results['ticks']:,} ticks, {tick_results['candles']:,} candles, "
+                               f"{tick_results['elapsed_ms']:.0f} ms")
+                    if tick_results['trade_log']:
+                        st.dataframe(pd.DataFrame(tick_results['trade_log']))
+
+    # Offline soak test: replay the loaded candles through the local order-matching engine
+    with st.expander("Paper Trading"):
+        pt_col1, pt_col2, pt_col3 = st.columns(3)
+        with pt_col1:
+            pt_order_type = st.selectbox("Signal orders", ["MARKET", "LIMIT"])
+            pt_limit_offset = st.number_input("Limit offset (%)", min_value=0.0, value=0.05, step=0.01)
+        with pt_col2:
+            pt_latency = st.number_input("Latency (ms)", min_value=0, value=0, step=50,
+                                         help="Resolved to whole bars: any latency above 0 makes orders wait "
+                                              "for the open after the next bar, e.g. an hour later on 1h candles")
+            pt_participation = st.number_input("Max share of bar volume (%)", min_value=0.0, value=0.0, step=1.0,
+                                               help="0 fills orders in full")
+        with pt_col3:
+            pt_incremental = st.checkbox("Rerun the strategy on every bar", value=False,
+                                         help="Slower; matches a live deployment for strategies that peek ahead")
+        if st.button("Run Paper Trading"):
+            with st.spinner("Replaying candles through the matching engine..."):
+                paper = run_paper_trading(
+                    st.session_state.strategy_code,
+                    st.session_state.ohlc_data,
+                    st.session_state.strategy_params.get('Timeframe') or '1h',
+                    commission=commission_pct / 100,
+                    slippage=slippage_pct / 100,
+                    participation=pt_participation / 100 or None,
+                    latency_ms=pt_latency,
+                    order_type=pt_order_type,
+                    limit_offset=pt_limit_offset / 100,
+                    stop_loss=stop_loss_pct / 100 or None,
+                    take_profit=take_profit_pct / 100 or None,
+                    mode="incremental" if pt_incremental else "batch",
+                )
+            if "error" in paper:
+                st.error(f"Paper trading failed: {paper['error']}")
+            else:
+                pt_m1, pt_m2, pt_m3, pt_m4 = st.columns(4)
+                pt_m1.metric("Return", f"{paper['return']:.2f}%")
+                pt_m2.metric("Orders", paper['orders'])
+                pt_m3.metric("Fills", paper['fills'])
+                pt_m4.metric("Fees", f"{paper['total_fees']:.4f}")
+                st.caption(f"{paper['bars']:,} bars in {paper['elapsed_ms']:.0f} ms; statuses: {paper['order_statuses']}")
+                if paper['order_log']:
+                    st.dataframe(pd.DataFrame(paper['order_log']))
+
+    # Run the same strategy over every USDT pair and list the ones signalling now
+    with st.expander("Market Scanner"):
+        sc_col1, sc_col2, sc_col3 = st.columns(3)
+        with sc_col1:
+            sc_window = st.number_input("Bars per symbol", min_value=50, max_value=1000, value=300, step=50)
+        with sc_col2:
+            sc_fresh = st.number_input("Signal within last N bars", min_value=1, max_value=50, value=1)
+        with sc_col3:
+            sc_max = st.number_input("Max symbols (0 = all)", min_value=0, value=0, step=50)
+        if st.button("Scan Market"):
+            try:
+                scanner = get_market_scanner(st.session_state.strategy_params.get('Timeframe') or '1h', int(sc_window))
+                with st.spinner("Topping up data and evaluating every USDT pair..."):
+                    scan_symbols = get_exchange_symbols(quote_asset="USDT")
+                    scan = scanner.scan(st.session_state.strategy_code,
+                                        symbols=scan_symbols[:int(sc_max)] if sc_max else scan_symbols,
+                                        fresh_within=int(sc_fresh))
+                st.caption(f"Scanned {scan.attrs['scanned']} symbols in {scan.attrs['elapsed_ms'] / 1000:.1f}s; "
+                           f"{len(scan)} firing, {len(scan.attrs['errors'])} skipped")
+                st.dataframe(scan)
+            except Exception as e:
+                st.error(f"Market scan failed: {e}")
+
+# Display the latest backtest results (kept across reruns so charts can be zoomed)
+if st.session_state.backtest_results and "error" not in st.session_state.backtest_results:
+    # Display results
+    st.subheader("Backtest Results")
+
+    # Create metrics in a nice dashboard style
+    metric1, metric2, metric3, metric4 = st.columns(4)
+    metric1.metric("Initial Capital", f"${st.session_state.backtest_results['initial_capital']:.2f}")
+    metric2.metric("Final Portfolio Value", f"${st.session_state.backtest_results['final_value']:.2f}")
+    metric3.metric("Total Return", f"{st.session_state.backtest_results['return']:.2f}%")
+    metric4.metric("Fees Paid", f"${st.session_state.backtest_results.get('total_fees', 0):.2f}")
+
+    # Display enhanced metrics
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Win Rate", f"{st.session_state.backtest_results.get('win_rate', 0):.2f}%")
+        st.metric("Total Trades", st.session_state.backtest_results.get('total_trades', 0))
+
+    with col2:
+        st.metric("Profitable Trades", st.session_state.backtest_results.get('profitable_trades', 0))
+        st.metric("Losing Trades", st.session_state.backtest_results.get('losing_trades', 0))
+
+    with col3:
+        st.metric("Max Drawdown", f"{st.session_state.backtest_results.get('max_drawdown', 0):.2f}%")
+        st.metric("Sharpe Ratio", f"{st.session_state.backtest_results.get('sharpe_ratio', 0):.2f}")
+
+    with col4:
+        st.metric("Avg Profit", f"{st.session_state.backtest_results.get('average_profit', 0):.2f}%")
+        st.metric("Avg Loss", f"{st.session_state.backtest_results.get('average_loss', 0):.2f}%")
+
+    col5, col6, col7, col8 = st.columns(4)
+    col5.metric("Sortino Ratio", f"{st.session_state.backtest_results.get('sortino_ratio', 0):.2f}")
+    col6.metric("Calmar Ratio", f"{st.session_state.backtest_results.get('calmar_ratio', 0):.2f}")
+    col7.metric("Profit Factor", f"{st.session_state.backtest_results.get('profit_factor', 0):.2f}")
+    col8.metric("Exposure", f"{st.session_state.backtest_results.get('exposure', 0):.1f}%")
+
+    # Plot equity curve if available
+    equity_curve = st.session_state.backtest_results.get('equity_curve', [])
+    result_id = st.session_state.backtest_results.get('result_id')
+    if equity_curve:
+        st.subheader("Equity Curve")
+        # Convert to DataFrame once per result; reruns reuse it
+        if st.session_state.get('equity_frame_id') != result_id:
+            equity_df = pd.DataFrame(equity_curve)
+            equity_df['timestamp'] = pd.to_datetime(equity_df['timestamp'])
+            equity_df.set_index('timestamp', inplace=True)
+            st.session_state.equity_frame = equity_df
+            st.session_state.equity_frame_id = result_id
+        equity_df = st.session_state.equity_frame
+        if not equity_df.empty:
+            # Zooming narrows the window so the same point budget shows more detail
+            window = None
+            if len(equity_df) > CHART_POINTS:
+                first, last = equity_df.index[0].to_pydatetime(), equity_df.index[-1].to_pydatetime()
+                window = st.slider("Zoom", min_value=first, max_value=last, value=(first, last))
+
+            # Create plot with both equity and price
+            chart1, chart2 = st.columns(2)
+            with chart1:
+                st.subheader("Portfolio Value")
+                st.line_chart(chart_cache.get_series(result_id, 'equity', equity_df['equity'], CHART_POINTS, window=window))
+            with chart2:
+                st.subheader("Price Chart")
+                st.line_chart(chart_cache.get_series(result_id, 'close', equity_df['close'], CHART_POINTS, method="minmax", window=window))
+
+            # Compress the full-resolution curve once per result for download
+            if st.session_state.get('equity_csv_id') != result_id:
+                st.session_state.equity_csv = gzip.compress(equity_df.to_csv().encode('utf-8'))
+                st.session_state.equity_csv_id = result_id
+            st.download_button(
+                label="Download Equity Curve as CSV (gzip)",
+                data=st.session_state.equity_csv,
+                file_name="equity_curve.csv.gz",
+                mime="application/gzip"
+            )
+
+    # Show Trade Log
+    st.subheader("Trade Log")
+    trade_log_df = pd.DataFrame(st.session_state.backtest_results['trade_log'])
+    if not trade_log_df.empty:
+        # Add profit column if it exists
+        if 'profit_pct' in trade_log_df.columns:
+            # Format profit_pct for display
+            trade_log_df['profit_pct'] = trade_log_df['profit_pct'].apply(
+                lambda x: f"+{x:.2f}%" if x > 0 else f"{x:.2f}%"
+            )
+            st.dataframe(trade_log_df)
+        else:
+            st.dataframe(trade_log_df)
+
+        # Add a download button for the trade log
+        csv = trade_log_df.to_csv(index=False).encode('utf-8')
+        st.download_button(
+            label="Download Trade Log as CSV",
+            data=csv,
+            file_name="trade_log.csv",
+            mime="text/csv"
+        )
+    else:
+        st.write("No trades were executed during the backtest period.")
+
+    # Monte Carlo robustness from the trade log and equity curve already computed
+    with st.expander("Robustness Analysis"):
+        rb_col1, rb_col2 = st.columns(2)
+        with rb_col1:
+            rb_paths = st.number_input("Synthetic paths", min_value=500, max_value=50000, value=5000, step=500)
+        with rb_col2:
+            rb_ruin = st.number_input("Ruin level (% of capital lost)", min_value=5.0, max_value=100.0, value=50.0, step=5.0)
+        if st.button("Run Robustness Analysis"):
+            with st.spinner("Resampling trades and bootstrapping returns..."):
+                st.session_state.robustness = analyze_robustness(
+                    st.session_state.backtest_results, n_paths=int(rb_paths), ruin_level=1 - rb_ruin / 100
+                )
+                st.session_state.robustness_id = st.session_state.backtest_results.get('result_id')
+        robustness = st.session_state.get('robustness')
+        if robustness and st.session_state.get('robustness_id') == st.session_state.backtest_results.get('result_id'):
+            if "error" in robustness:
+                st.error(robustness["error"])
+            else:
+                for view, label in (("bars", "Block-bootstrapped returns"), ("trades", "Resampled trades")):
+                    if view not in robustness:
+                        continue
+                    st.write(f"**{label}** — risk of ruin {robustness[view]['risk_of_ruin']:.1f}%, "
+                             f"probability of loss {robustness[view]['probability_of_loss']:.1f}%")
+                    st.dataframe(pd.DataFrame(robustness[view]["metrics"]).T)
+                st.info(refine_strategy(st.session_state.backtest_results, robustness))
+
+# Leaderboard of every stored run
+with st.expander("Leaderboard"):
+    lb_col1, lb_col2, lb_col3 = st.columns(3)
+    with lb_col1:
+        lb_metric = st.selectbox("Rank by", ["sharpe_ratio", "return", "sortino_ratio", "calmar_ratio", "profit_factor", "win_rate"])
+    with lb_col2:
+        lb_symbol = st.text_input("Symbol filter", value="")
+    with lb_col3:
+        lb_interval = st.text_input("Interval filter", value="")
+    try:
+        store = get_results_store()
+        st.caption(f"{store.count()} runs stored in {RESULTS_DB_PATH}")
+        leaderboard = store.leaderboard(lb_metric, symbol=lb_symbol.strip().upper().replace("/", "") or None,
+                                        interval=lb_interval.strip() or None, limit=50)
+        st.dataframe(leaderboard)
+    except Exception as e:
+        st.error(f"Could not read the results store: {e}")
+
 # Reset Button
 col1, col2 = st.columns([1, 5])
 with col1:
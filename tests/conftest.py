@@ -0,0 +1,26 @@
+# tests/conftest.py
+import pytest
+
+from app.data_cache import OHLCVCache
+from app.mock_servers import MockBinance
+
+
+@pytest.fixture
+def mock_binance(monkeypatch):
+    """Point app.data_handler at a local MockBinance with an empty, memory-only OHLCV cache."""
+    pytest.importorskip("binance")
+    import app.data_handler as data_handler
+    import app.prefetch as prefetch
+
+    server = MockBinance(latency_ms=0).start()
+    # python-binance pings API_URL while constructing the client
+    monkeypatch.setattr(data_handler.Client, "API_URL", f"{server.url}/api")
+    client = data_handler.Client("", "")
+    client.API_URL = f"{server.url}/api"
+    cache = OHLCVCache(ttl=None)
+    monkeypatch.setattr(data_handler, "client", client)
+    monkeypatch.setattr(data_handler, "BINANCE_AVAILABLE", True)
+    monkeypatch.setattr(data_handler, "ohlc_cache", cache)
+    monkeypatch.setattr(prefetch, "ohlc_cache", cache)
+    yield server
+    server.close()
@@ -0,0 +1,11 @@
+# tests/run_tests.py
+import os
+import sys
+
+import pytest
+
+if __name__ == "__main__":
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    # Make the app package importable however the script is launched
+    sys.path.insert(0, os.path.dirname(tests_dir))
+    sys.exit(pytest.main([tests_dir] + sys.argv[1:]))
@@ -0,0 +1,29 @@
+# tests/test_backtester.py
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pandas_ta")
+from app.backtester import run_backtest
+
+STRATEGY = """
+def trading_strategy(ohlc_data):
+    df = ohlc_data.copy()
+    df['signal'] = 0
+    df.loc[df.index[2], 'signal'] = 1
+    df.loc[df.index[5], 'signal'] = -1
+    return df
+"""
+
+
+def test_trade_log_timestamps_use_pandas_format():
+    close = 100 + np.arange(30.0)
+    df = pd.DataFrame({
+        "timestamp": pd.date_range("2024-01-01", periods=30, freq="h"),
+        "open": close, "high": close + 1, "low": close - 1, "close": close, "volume": 1.0,
+    })
+    result = run_backtest(STRATEGY, df, interval="1h")
+    stamps = [row["timestamp"] for row in result["trade_log"]]
+    assert stamps == [str(pd.Timestamp(ts)) for ts in stamps]
+    assert stamps[0].startswith("2024-01-01 0")
+    assert "T" not in stamps[0] and not stamps[0].endswith("000000000")
@@ -0,0 +1,38 @@
+# tests/test_distributed.py
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pandas_ta")
+from app.distributed import DatasetStore, distributed_backtest, worker_cache_dir
+
+STRATEGY = """
+def trading_strategy(ohlc_data):
+    df = ohlc_data.copy()
+    df['signal'] = 0
+    df.loc[df.index[2], 'signal'] = 1
+    df.loc[df.index[5], 'signal'] = -1
+    return df
+"""
+
+
+def test_store_root_is_absolute(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = DatasetStore("datasets")
+    assert store.root == str(tmp_path / "datasets")
+    assert not worker_cache_dir(store.root).startswith(store.root + os.sep)
+
+
+def test_worker_caches_stay_out_of_the_coordinator_store(tmp_path):
+    close = 100 + np.arange(40.0)
+    data = pd.DataFrame({
+        "timestamp": pd.date_range("2024-01-01", periods=40, freq="h"),
+        "open": close, "high": close + 1, "low": close - 1, "close": close, "volume": 1.0,
+    })
+    store = DatasetStore(str(tmp_path / "datasets"))
+    run = distributed_backtest([{"strategy_code": STRATEGY, "data": data}], workers=1, timeout=120, store=store)
+    assert "error" not in run["results"][0]
+    assert store.keys() == [store.put(data)]
+    assert os.listdir(worker_cache_dir(store.root))
@@ -0,0 +1,38 @@
+# tests/test_intervals.py
+import numpy as np
+import pytest
+
+from app.utils import interval_to_seconds, normalize_interval, parse_interval
+
+SPELLINGS = ["1s", "15s", "1m", "1min", "5m", "15M", "30 minutes", "1h", "4H", "2hours", "1d", "3D", "1w", "2weeks",
+             "1M", "1mo", "3mo", "6 months"]
+
+
+@pytest.mark.parametrize("interval", SPELLINGS)
+def test_normalize_interval_is_idempotent(interval):
+    once = normalize_interval(interval)
+    assert normalize_interval(once) == once
+    assert parse_interval(once) == parse_interval(interval)
+
+
+@pytest.mark.parametrize("interval, expected", [
+    ("1m", (1, "m")), ("1min", (1, "m")), ("15M", (15, "m")), ("1M", (1, "M")), ("3mo", (3, "M")),
+])
+def test_minutes_and_months(interval, expected):
+    assert parse_interval(interval) == expected
+
+
+def test_download_interval_uses_binance_spelling():
+    data_handler = pytest.importorskip("app.data_handler")
+    assert data_handler.download_interval("1min") == "1m"
+    assert data_handler.download_interval("15min") == "15m"
+    assert data_handler.download_interval("1M") == "1M"
+    assert data_handler.download_interval("2h") == "2h"
+
+
+@pytest.mark.parametrize("interval", ["1m", "1min", "5m"])
+def test_fetch_minute_bars(mock_binance, interval):
+    from app.data_handler import fetch_ohlc_data
+    df = fetch_ohlc_data("BTCUSDT", interval)
+    steps = np.diff(df["timestamp"].to_numpy(dtype="datetime64[s]").astype(np.int64))
+    assert (steps == interval_to_seconds(interval)).all()
@@ -0,0 +1,21 @@
+# tests/test_loadtest.py
+import pytest
+
+pytest.importorskip("binance")
+pytest.importorskip("pandas_ta")
+import app.data_handler as data_handler
+from app.loadtest import install_mocks, restore_mocks
+from app.mock_servers import MockBinance
+
+
+def test_restore_mocks_undoes_the_client_class_url():
+    original = data_handler.Client.API_URL
+    server = MockBinance(latency_ms=0).start()
+    try:
+        previous = install_mocks("http://127.0.0.1:9", server.url)
+        assert data_handler.Client.API_URL == f"{server.url}/api"
+        restore_mocks(previous)
+    finally:
+        server.close()
+    assert data_handler.Client.API_URL == original
+    assert data_handler.client is previous["binance"][0]
@@ -0,0 +1,41 @@
+# tests/test_paper_trading.py
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pandas_ta")
+from app.paper_trading import MatchingEngine, PaperTrader, replay_candles
+
+HOUR_NS = 3600 * 10**9
+
+
+def _frame(rows):
+    df = pd.DataFrame(rows, columns=["open", "high", "low", "close"])
+    df["timestamp"] = pd.date_range("2024-01-01 10:00", periods=len(df), freq="h")
+    df["volume"] = 1e6
+    return df
+
+
+@pytest.mark.parametrize("latency_ms, fill_bar", [(0, 1), (200, 2), (3_600_000, 2), (3_600_001, 3)])
+def test_latency_resolves_to_bars(latency_ms, fill_bar):
+    engine = MatchingEngine(cash=100, latency_ms=latency_ms)
+    bars = list(replay_candles(_frame([(100 + i, 101 + i, 99 + i, 100 + i) for i in range(5)])))
+    # Submitted at the close of bar 0
+    order = engine.submit("BUY", "MARKET", 0.5, timestamp=bars[0][0] + HOUR_NS)
+    for bar in bars:
+        engine.on_bar(*bar, HOUR_NS)
+    assert order.status == "FILLED"
+    assert order.average_price == bars[fill_bar][1]
+
+
+def test_sell_signal_replaces_resting_exit():
+    rows = [(100, 100.5, 99.5, 100), (100, 100.5, 97, 99), (99, 100, 98.5, 100), (100, 100.5, 98, 99),
+            (99, 101.5, 98.5, 101), (101, 101.5, 96, 97), (97, 97.5, 95, 96), (96, 102.5, 95.5, 102)]
+    signals = np.array([1, 0, -1, -1, 0, 1, 0, 0])
+    engine = MatchingEngine(cash=100)
+    trader = PaperTrader("", "1h", engine=engine, order_type="LIMIT", limit_offset=0.02)
+    report = trader.run(replay_candles(_frame(rows)), signals=signals)
+    exits = [o for o in report["order_log"] if o["tag"] == "exit"]
+    assert [o["status"] for o in exits] == ["CANCELED", "FILLED"]
+    # The first exit's 102 limit trades in the last bar; had it survived it would close the new position
+    assert engine.position > 0
@@ -0,0 +1,17 @@
+# tests/test_prefetch.py
+import numpy as np
+
+from app.prefetch import Prefetcher
+
+
+def test_prefetch_minute_bars(mock_binance):
+    prefetcher = Prefetcher()
+    try:
+        prefetcher.prefetch("BTC", "1m")
+        prefetcher.prefetch("BTCUSDT", "1min")
+        df = prefetcher.fetch("BTC/USDT", "1 minute")
+    finally:
+        prefetcher.shutdown()
+    assert prefetcher.stats["started"] == 1
+    steps = np.diff(df["timestamp"].to_numpy(dtype="datetime64[s]").astype(np.int64))
+    assert (steps == 60).all()
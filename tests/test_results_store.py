@@ -0,0 +1,32 @@
+# tests/test_results_store.py
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pandas_ta")
+import app.results_store as results_store
+from app.results_store import ResultsStore
+
+DATA = pd.DataFrame({"timestamp": pd.date_range("2024-01-01", periods=50, freq="h"), "close": np.arange(50.0)})
+RESULT = {"return": 5.0, "sharpe_ratio": 1.2, "profit_factor": float("inf"), "total_trades": 3}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    yield store
+    store.close()
+
+
+def test_key_covers_engine_version(store, monkeypatch):
+    run_id = store.put("code", DATA, {"interval": "1h"}, RESULT)
+    assert store.get("code", DATA, {"interval": "1h"})["run_id"] == run_id
+    monkeypatch.setattr(results_store, "ENGINE_VERSION", results_store.ENGINE_VERSION + 1)
+    assert store.get("code", DATA, {"interval": "1h"}) is None
+
+
+def test_infinite_profit_factor_is_not_ranked(store):
+    store.put("code", DATA, {}, RESULT)
+    assert store.leaderboard("profit_factor").empty
+    assert store.leaderboard("sharpe_ratio")["profit_factor"].isna().all()
+    assert store.get("code", DATA, {})["profit_factor"] == float("inf")
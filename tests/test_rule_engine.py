@@ -0,0 +1,27 @@
+# tests/test_rule_engine.py
+import numpy as np
+import pytest
+
+from app.rule_engine import parse_strategy_text
+
+
+@pytest.mark.parametrize("text", [
+    "Buy BTC when RSI(14) falls below 30 on a 1m timeframe, sell when RSI goes above 70",
+    "Buy BTC on the 1 minute chart when RSI < 30, sell when RSI > 70",
+])
+def test_minute_timeframe_fetches_minute_bars(mock_binance, text):
+    from app.data_handler import fetch_ohlc_data
+    params = parse_strategy_text(text)
+    assert params is not None
+    df = fetch_ohlc_data(params["Asset"].replace("/", ""), params["Timeframe"])
+    steps = np.diff(df["timestamp"].to_numpy(dtype="datetime64[s]").astype(np.int64))
+    assert (steps == 60).all()
+
+
+@pytest.mark.parametrize("text", [
+    "Buy BTC when the 20 EMA crosses above the 50 EMA unless price is below the 200 SMA, "
+    "sell when the 20 EMA crosses below the 50 EMA",
+    "Buy when RSI drops below 30 within the last 3 candles, sell when RSI is above 70",
+])
+def test_unparsed_text_defers_to_llm(text):
+    assert parse_strategy_text(text) is None
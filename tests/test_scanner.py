@@ -0,0 +1,29 @@
+# tests/test_scanner.py
+import numpy as np
+import pytest
+
+pytest.importorskip("pandas_ta")
+from app.scanner import MarketScanner
+
+STRATEGY = '''
+def trading_strategy(ohlc_data):
+    df = ohlc_data.copy()
+    fast = df["close"].rolling(5).mean()
+    slow = df["close"].rolling(20).mean()
+    df["signal"] = 0
+    df.loc[(fast > slow) & (fast.shift(1) <= slow.shift(1)), "signal"] = 1
+    df.loc[(fast < slow) & (fast.shift(1) >= slow.shift(1)), "signal"] = -1
+    return df
+'''
+
+
+@pytest.mark.parametrize("interval, binance, seconds", [("1min", "1m", 60), ("1m", "1m", 60), ("15m", "15m", 900)])
+def test_minute_scanner(mock_binance, interval, binance, seconds):
+    scanner = MarketScanner(interval, window=60, max_workers=1)
+    assert scanner._binance_interval == binance
+    bars = scanner.top_up("BTCUSDT")
+    assert len(bars) == 60
+    steps = np.diff(bars["timestamp"].to_numpy(dtype="datetime64[s]").astype(np.int64))
+    assert (steps == seconds).all()
+    table = scanner.scan(STRATEGY, symbols=["BTCUSDT", "ETHUSDT"], only_firing=False)
+    assert sorted(table["symbol"]) == ["BTCUSDT", "ETHUSDT"]